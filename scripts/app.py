@@ -1,19 +1,161 @@
+import asyncio
 import pandas as pd
 
-from config import logger
+from typing import Callable, Optional
+
+from config import logger, EVAL_SHARD_SIZE, EVAL_PARALLEL_MIN_TICKERS, FINGERPRINT_CACHE_ENABLED
+from metrics import registry
 from ib_insync import util
 from datetime import datetime
+from contextlib import aclosing
 from tkinter import messagebox
-from fetch_data import fetch_all_data
-from conditions import evaluate_conditions
-from data_handler import (get_data_for_date,
+from fetch_data import fetch_store, stream_all_data, history_duration_days
+from conditions import split_condition_ids, get_condition_stats
+from engine import backtest_universe
+from bar_store import BarStore
+from data_source import DataSource
+from fingerprints import covered_tickers, fingerprint_day
+from parallel import get_eval_pool
+from widgets import SCREENER_COLUMNS, BACKTEST_COLUMNS
+from results_store import RunRecorder, run_timings
+from data_handler import (get_business_days,
                           save_screener_results,
-                          find_previous_day_data,
-                          find_previous_16h_open)
+                          save_backtest_results)
+
+async def _run_screener_async(app, selected_tickers: list[str], screening_date) -> None:
+
+    """
+    Les tickers déjà en mémoire pour cette date (app.screen_cache) sont re-screenés localement,
+    seules les conditions jamais évaluées sont calculées. Les autres sont consommés dans l'ordre
+    d'arrivée : chaque ticker est découpé, évalué, puis son DataFrame est libéré aussitôt.
+    Au-delà de EVAL_PARALLEL_MIN_TICKERS (et si EVAL_WORKERS le permet), les barres reçues partent par lots
+    vers des process d'évaluation et les résultats sont affichés à la fin, dans l'ordre des tickers.
+    """
+
+    ticker_index = {ticker: idx + 1 for idx, ticker in enumerate(app.tickers)}
+    done = 0
+
+    registry.reset()
+
+    cache = app.screen_cache
+    cache.use_date(screening_date)
+
+    to_fetch = cache.missing(selected_tickers)
+
+    selected_ids, inverse_ids = split_condition_ids(app.conditions)
+    recorder = RunRecorder("screen", screening_date, screening_date, selected_ids, inverse_ids, len(selected_tickers))
+    screened = []
+
+    def show(ticker: str) -> None:
+
+        screened.append(ticker)
+        open_16h = cache.screen(ticker, app.conditions)
+
+        if open_16h is None:
+            return
+
+        row = (len(app.results) + 1, ticker_index.get(ticker, 0), ticker, open_16h)
+
+        app.results.append(row)
+        app.results_view.add(row)
+
+    for ticker in selected_tickers:
+
+        if ticker in cache.entries:
+            done += 1
+            show(ticker)
+
+    app.progress["value"] = done
+    logger.info(f"[RUN] {done} tickers re-screened from memory, {len(to_fetch)} to fetch.")
+
+    def finish(status: str) -> None:
+
+        # Verdicts et résultats par condition des tickers affichés (un run annulé garde ce qui a été screené)
+        recorder.add(screening_date, cache.verdicts(screened, (row[2] for row in app.results)))
+        recorder.finish(status, run_timings(registry.snapshot()))
+
+        registry.export("screen")
+        get_condition_stats().save()
+        app.set_running(False)
+
+    pool = get_eval_pool() if len(to_fetch) >= EVAL_PARALLEL_MIN_TICKERS else None
+    ids = sorted(selected_ids | inverse_ids)
+
+    batch, shards = {}, []
+
+    def cancel_shards() -> None:
+
+        # Lots pas encore pris par un process : retirés de la file du pool
+        for _, job in shards:
+            job.cancel()
+
+    try:
+        if to_fetch:
+
+            async with aclosing(stream_all_data(app.ib, to_fetch, screening_date)) as stream:
+
+                async for ticker, df in stream:
+
+                    done += 1
+                    app.progress["value"] = done
+
+                    if pool is not None:
+                        batch[ticker] = df
+
+                        if len(batch) >= EVAL_SHARD_SIZE:
+                            shards.append((list(batch), pool.submit(batch, screening_date, ids)))
+                            batch = {}
+
+                        continue
+
+                    cache.add(ticker, df)
+                    del df
+
+                    show(ticker)
+
+        if pool is not None:
+
+            if batch:
+                shards.append((list(batch), pool.submit(batch, screening_date, ids)))
+
+            for tickers, job in shards:
+                cache.add_shard(await job, tickers)
+
+            for ticker in to_fetch:
+                show(ticker)
+
+    except asyncio.CancelledError:
+        logger.info(f"[CANCEL] Screener cancelled after {done}/{len(selected_tickers)} tickers.")
+        cancel_shards()
+        finish("cancelled")
+        return
+
+    except Exception as e:
+        logger.error(f"[FETCH_ERROR] {e}")
+        cancel_shards()
+        finish("error")
+
+        msg = f"Data fetch failed: {e}"
+        app.root.after(0, lambda m=msg: messagebox.showerror("Error", m))
+        return
+
+    save_screener_results(app.results)
+    logger.info(f"[DONE] Screener finished with {len(app.results)} matches.")
+
+    finish("done")
+    app.root.after(0, lambda: messagebox.showinfo("Done", f"{len(app.results)} results found.\nSaved to file."))
 
 def run_screener(app):
 
-    app.tree.delete(*app.tree.get_children())
+    """
+    Lance le screening en tâche de fond sur la boucle asyncio pompée par Tk :
+    chaque ticker est évalué dès réception de ses barres et affiché immédiatement.
+    """
+
+    if is_running(app):
+        return
+
+    app.results_view.set_columns(SCREENER_COLUMNS)
     app.results.clear()
 
     try:
@@ -23,7 +165,7 @@ def run_screener(app):
         messagebox.showerror("Error", "Invalid date format (YYYY-MM-DD)")
         return
 
-    selected_tickers = [ticker for ticker, var in app.ticker_vars.items() if var.get()]
+    selected_tickers = app.ticker_selector.selected_tickers()
 
     if not selected_tickers:
         messagebox.showerror("Error", "No tickers selected.")
@@ -31,48 +173,166 @@ def run_screener(app):
 
     logger.info(f"[RUN] Fetching data for {len(selected_tickers)} tickers...")
 
+    app.progress.configure(maximum=len(selected_tickers), value=0)
+    app.set_running(True)
+
+    app.screen_task = util.getLoop().create_task(_run_screener_async(app, selected_tickers, screening_date))
+
+def is_running(app) -> bool:
+
+    """Un screening ou un backtest est en cours (un seul run à la fois : ils partagent la table des résultats)."""
+
+    return any(task is not None and not task.done() for task in (app.screen_task, app.backtest_task))
+
+def cancel_screener(app):
+
+    """Annule le run en cours, screening ou backtest."""
+
+    for task in (app.screen_task, app.backtest_task):
+
+        if task is not None and not task.done():
+            task.cancel()
+
+async def backtest_range_async(ib,
+                               tickers: list[str],
+                               start_date,
+                               end_date,
+                               selected_ids,
+                               inverse_ids,
+                               recorder=None,
+                               checked=None,
+                               progress: Optional[Callable[[int, int], None]] = None) -> pd.DataFrame:
+
+    """
+    Backtest sur une plage de dates : un seul historique horaire par ticker couvrant toute la plage,
+    puis screening local de chaque jour ouvré. Renvoie la table date × ticker des matches.
+    Les tickers dont toutes les dates ont déjà une empreinte en cache ne sont pas téléchargés.
+    Les dates sont évaluées une à une en rendant la main à la boucle entre deux (fenêtre réactive, annulation).
+    progress : appelé avec (étapes faites, étapes totales) après chaque ticker reçu et chaque date évaluée.
+    """
+
+    dates = get_business_days(start_date, end_date)
+    duration_days = history_duration_days(start_date, end_date)
+
+    # Un rejeu (DataSource) n'alimente pas le cache d'empreintes, comme pour les barres
+    cached = FINGERPRINT_CACHE_ENABLED and not isinstance(getattr(ib, "primary", ib), DataSource)
+    fetched = tickers
+
+    if cached:
+        covered = covered_tickers(tickers, dates)
+        fetched = [t for t in tickers if t not in covered]
+
+    logger.info(f"[BACKTEST] {len(dates)} dates x {len(tickers)} tickers ({duration_days} D of history, "
+                f"{len(tickers) - len(fetched)} tickers from fingerprints)")
+
+    steps, done = len(fetched) + len(dates), 0
+
+    def step(*_) -> None:
+
+        nonlocal done
+        done += 1
+
+        if progress is not None:
+            progress(done, steps)
+
+    if progress is not None:
+        progress(0, steps)
+
+    store = await fetch_store(ib, fetched, end_date, duration_days=duration_days, on_received=step) if fetched else BarStore.from_frames({})
+    tables = []
+
+    for day in dates:
+
+        tables.append(backtest_universe(store, tickers, [day], selected_ids, inverse_ids, recorder=recorder,
+                                        fingerprints=fingerprint_day if cached else None, checked=checked))
+        step()
+
+        await asyncio.sleep(0)
+
+    return pd.concat(tables) if tables else backtest_universe(store, tickers, [], selected_ids, inverse_ids)
+
+async def _run_backtest_async(app, selected_tickers: list[str], start_date, end_date) -> None:
+
+    selected_ids, inverse_ids = split_condition_ids(app.conditions)
+    checked = any(v.get() for v in app.conditions.values())
+    registry.reset()
+
+    recorder = RunRecorder("backtest", start_date, end_date, selected_ids, inverse_ids, len(selected_tickers))
+
+    def progress(done: int, steps: int) -> None:
+        app.progress.configure(maximum=max(steps, 1), value=done)
+
     try:
-        df_map = util.run(fetch_all_data(app.ib, selected_tickers, screening_date))
+        table = await backtest_range_async(app.ib, selected_tickers, start_date, end_date, selected_ids, inverse_ids,
+                                           recorder=recorder, checked=checked, progress=progress)
+
+    except asyncio.CancelledError:
+        logger.info("[CANCEL] Backtest cancelled.")
+        recorder.finish("cancelled", run_timings(registry.snapshot()))
+        app.set_running(False)
+        return
 
     except Exception as e:
-        logger.error(f"[FETCH_ERROR] {e}")
-        messagebox.showerror("Error", f"Data fetch failed: {e}")
+        logger.error(f"[BACKTEST_ERROR] {e}")
+        recorder.finish("error", run_timings(registry.snapshot()))
+        app.set_running(False)
+
+        msg = f"Backtest failed: {e}"
+        app.root.after(0, lambda m=msg: messagebox.showerror("Error", m))
         return
 
-    results_append = app.results.append
-    ticker_index = {ticker: idx + 1 for idx, ticker in enumerate(app.tickers)}
+    rows = []
 
-    for ticker in selected_tickers:
+    for day, row in table.iterrows():
+        matched = [ticker for ticker, hit in row.items() if hit]
+        rows.append((day, len(matched), ", ".join(matched)))
 
-        df = df_map.get(ticker)
+    app.results_view.extend(rows)
 
-        if df is None or df.empty:
-            logger.debug(f"[SKIP] No data for {ticker}")
-            continue
+    save_backtest_results(table)
 
-        data_today = get_data_for_date(df, screening_date)
-        
-        if data_today.empty:
-            logger.debug(f"[SKIP] No data_today for {ticker}")
-            continue
+    recorder.finish("done", run_timings(registry.snapshot()))
+    registry.export("backtest")
+    app.set_running(False)
 
-        data_yesterday = find_previous_day_data(df, screening_date)
-        open_16h = find_previous_16h_open(df, screening_date)
+    total = int(table.to_numpy().sum())
+    logger.info(f"[DONE] Backtest finished with {total} matches over {len(table)} dates.")
+    app.root.after(0, lambda: messagebox.showinfo("Done", f"{total} matches over {len(table)} dates.\nSaved to file."))
 
-        if data_yesterday is None:
-            logger.debug(f"[SKIP] No previous day data for {ticker}")
-            continue
+def run_backtest(app):
 
-        if open_16h is None:
-            logger.debug(f"[SKIP] No 16h open found for {ticker}")
-            continue
+    """
+    Lance le backtest en tâche de fond sur la boucle asyncio pompée par Tk, comme run_screener :
+    la fenêtre reste utilisable pendant le téléchargement de l'historique, avec progression et annulation.
+    """
 
-        if evaluate_conditions(app.conditions, data_today, open_16h, data_yesterday):
-            results_append((len(app.results) + 1, ticker_index.get(ticker, 0), ticker, open_16h))
+    if is_running(app):
+        return
 
-    for serial, ticker_no, ticker, open_val in app.results:
-        app.tree.insert("", "end", values=(f"{serial}. TickerNo:{ticker_no} - {ticker} - Open16h: {open_val:.2f}",))
+    app.results_view.set_columns(BACKTEST_COLUMNS)
+    app.results.clear()
 
-    save_screener_results(app.results)
-    logger.info(f"[DONE] Screener finished with {len(app.results)} matches.")
-    messagebox.showinfo("Done", f"{len(app.results)} results found.\nSaved to file.")
+    try:
+        start_date = datetime.strptime(app.date_entry.get(), "%Y-%m-%d").date()
+        end_date = datetime.strptime(app.end_date_entry.get(), "%Y-%m-%d").date()
+
+    except ValueError:
+        messagebox.showerror("Error", "Invalid date format (YYYY-MM-DD)")
+        return
+
+    if end_date < start_date:
+        messagebox.showerror("Error", "End date must be after the screening date.")
+        return
+
+    selected_tickers = app.ticker_selector.selected_tickers()
+
+    if not selected_tickers:
+        messagebox.showerror("Error", "No tickers selected.")
+        return
+
+    logger.info(f"[BACKTEST] Running {start_date} -> {end_date} on {len(selected_tickers)} tickers...")
+
+    app.progress.configure(maximum=len(selected_tickers), value=0)
+    app.set_running(True)
+
+    app.backtest_task = util.getLoop().create_task(_run_backtest_async(app, selected_tickers, start_date, end_date))
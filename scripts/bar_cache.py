@@ -0,0 +1,207 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+import datetime as dt
+
+from typing import Optional, Tuple, Union
+from config import logger, EASTERN_TZ, BAR_CACHE_FILE
+
+# region : Variables
+
+# Colonnes telles que produites par data_source.bars_to_df
+BAR_COLUMNS = ("Open", "High", "Low", "Close", "volume", "average", "barCount")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bars (
+    symbol       TEXT    NOT NULL,
+    bar_size     TEXT    NOT NULL,
+    what_to_show TEXT    NOT NULL,
+    use_rth      INTEGER NOT NULL,
+    ts           INTEGER NOT NULL,
+    Open REAL, High REAL, Low REAL, Close REAL,
+    volume REAL, average REAL, barCount INTEGER,
+    PRIMARY KEY (symbol, bar_size, what_to_show, use_rth, ts)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS coverage_intervals (
+    symbol       TEXT    NOT NULL,
+    bar_size     TEXT    NOT NULL,
+    what_to_show TEXT    NOT NULL,
+    use_rth      INTEGER NOT NULL,
+    start_ts     INTEGER NOT NULL,
+    end_ts       INTEGER NOT NULL,
+    PRIMARY KEY (symbol, bar_size, what_to_show, use_rth, start_ts)
+) WITHOUT ROWID;
+"""
+
+# Ancienne table (un seul intervalle par clé), reprise dans coverage_intervals à l'ouverture
+_LEGACY_COVERAGE = "coverage"
+
+_KEY_FILTER = "symbol=? AND bar_size=? AND what_to_show=? AND use_rth=?"
+
+_conn: Optional[sqlite3.Connection] = None
+
+# endregion
+
+# region : Helper Functions
+
+def _get_connection() -> sqlite3.Connection:
+
+    global _conn
+
+    if _conn is None:
+        BAR_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+
+        _conn = sqlite3.connect(BAR_CACHE_FILE, check_same_thread=False)
+        _conn.executescript(_SCHEMA)
+
+        _migrate_coverage(_conn)
+
+        logger.info(f"[CACHE] Bar cache opened: {BAR_CACHE_FILE}")
+
+    return _conn
+
+def _migrate_coverage(conn: sqlite3.Connection) -> None:
+
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (_LEGACY_COVERAGE,)).fetchone() is None:
+        return
+
+    with conn:
+        conn.execute(f"INSERT OR IGNORE INTO coverage_intervals SELECT * FROM {_LEGACY_COVERAGE}")
+        conn.execute(f"DROP TABLE {_LEGACY_COVERAGE}")
+
+    logger.info("[CACHE] Bar cache coverage migrated to intervals")
+
+def _ts(when: dt.datetime) -> int:
+    return int(when.timestamp())
+
+def _key(symbol: str, bar_size: str, what_to_show: str, use_rth: bool) -> tuple:
+    return symbol, bar_size, what_to_show, int(use_rth)
+
+def last_finished_hour(now: Optional[dt.datetime] = None) -> dt.datetime:
+
+    """Début de l'heure en cours (US/Eastern) : toute barre 1h qui commence avant est terminée."""
+
+    now = now or dt.datetime.now(EASTERN_TZ)
+    return now.astimezone(EASTERN_TZ).replace(minute=0, second=0, microsecond=0)
+
+# endregion
+
+# region : API Functions
+
+def missing_range(symbol: str,
+                  start: dt.datetime,
+                  end: dt.datetime,
+                  bar_size: str = "1 hour",
+                  what_to_show: str = "TRADES",
+                  use_rth: bool = False) -> Optional[Tuple[dt.datetime, dt.datetime]]:
+
+    """
+    Renvoie la plage [début, fin) à demander à IB pour couvrir [start, end), ou None si le cache suffit.
+    Seule la fin de la fenêtre est re-téléchargée quand le début est déjà couvert (intervalle contenant start).
+    """
+
+    end = min(end, last_finished_hour())
+
+    row = _get_connection().execute(f"SELECT start_ts, end_ts FROM coverage_intervals WHERE {_KEY_FILTER} "
+                                    "AND start_ts <= ? AND end_ts >= ? ORDER BY end_ts DESC LIMIT 1",
+                                    _key(symbol, bar_size, what_to_show, use_rth) + (_ts(start), _ts(start))).fetchone()
+
+    if row is None:
+        return start, end
+
+    if row[1] >= _ts(end):
+        return None
+
+    return dt.datetime.fromtimestamp(row[1], EASTERN_TZ), end
+
+def store_bars(symbol: str,
+               df: Union[pd.DataFrame, Tuple[np.ndarray, np.ndarray], None],
+               start: dt.datetime,
+               end: dt.datetime,
+               bar_size: str = "1 hour",
+               what_to_show: str = "TRADES",
+               use_rth: bool = False) -> None:
+
+    """
+    Enregistre les barres terminées de df et ajoute [start, end) aux intervalles couverts
+    (fusionné avec ceux qu'il chevauche ou touche ; une plage disjointe est gardée à côté des autres).
+    end est borné à l'heure en cours : la barre en formation n'est jamais mise en cache.
+    df : DataFrame de bars_to_df, ou réponse décodée (ts ns UTC, valeurs dans l'ordre de BAR_COLUMNS) de decode_bars.
+    """
+
+    end = min(end, last_finished_hour())
+    key = _key(symbol, bar_size, what_to_show, use_rth)
+
+    rows, ts, cols = [], (), ()
+
+    if isinstance(df, tuple):
+        ts, cols = df[0] // 10**9, list(df[1].T)
+
+    elif df is not None and not df.empty:
+        ts = df.index.tz_convert("UTC").as_unit("s").asi8
+        cols = [df[c].to_numpy() if c in df else [None] * len(df) for c in BAR_COLUMNS]
+
+    if len(ts):
+        rows = [key + (int(t),) + tuple(None if pd.isna(v) else float(v) for v in values)
+                for t, *values in zip(ts, *cols) if t + 3600 <= _ts(end)]
+
+    conn = _get_connection()
+
+    with conn:
+        conn.executemany(f"INSERT OR REPLACE INTO bars VALUES ({', '.join('?' * (5 + len(BAR_COLUMNS)))})", rows)
+
+        new_start, new_end = _ts(start), _ts(end)
+
+        if new_end <= new_start:
+            return
+
+        touching = f"FROM coverage_intervals WHERE {_KEY_FILTER} AND start_ts <= ? AND end_ts >= ?"
+        overlap = conn.execute(f"SELECT start_ts, end_ts {touching}", key + (new_end, new_start)).fetchall()
+
+        if overlap:
+            conn.execute(f"DELETE {touching}", key + (new_end, new_start))
+            new_start, new_end = min([new_start] + [r[0] for r in overlap]), max([new_end] + [r[1] for r in overlap])
+
+        conn.execute("INSERT OR REPLACE INTO coverage_intervals VALUES (?, ?, ?, ?, ?, ?)", key + (new_start, new_end))
+
+    logger.debug(f"[CACHE] {symbol}: {len(rows)} bars stored")
+
+def load_bars(symbol: str,
+              start: dt.datetime,
+              end: dt.datetime,
+              bar_size: str = "1 hour",
+              what_to_show: str = "TRADES",
+              use_rth: bool = False) -> pd.DataFrame:
+
+    """
+    Relit les barres en cache sur [start, end), au même format que data_source.bars_to_df.
+    """
+
+    rows = _get_connection().execute(f"SELECT ts, {', '.join(BAR_COLUMNS)} FROM bars "
+                                     "WHERE symbol=? AND bar_size=? AND what_to_show=? AND use_rth=? "
+                                     "AND ts >= ? AND ts < ? ORDER BY ts",
+                                     _key(symbol, bar_size, what_to_show, use_rth) + (_ts(start), _ts(end))).fetchall()
+
+    if not rows:
+        return pd.DataFrame()
+
+    df = pd.DataFrame(rows, columns=("date",) + BAR_COLUMNS)
+    df["date"] = pd.to_datetime(df["date"], unit="s", utc=True).dt.tz_convert(EASTERN_TZ)
+
+    return df.set_index("date")
+
+def merge_bars(cached: pd.DataFrame, fresh: pd.DataFrame) -> pd.DataFrame:
+
+    """Fusionne barres en cache et barres fraîches (les fraîches l'emportent)."""
+
+    if cached.empty:
+        return fresh
+
+    if fresh is None or fresh.empty:
+        return cached
+
+    df = pd.concat([cached, fresh[[c for c in cached.columns if c in fresh]]])
+    return df[~df.index.duplicated(keep="last")].sort_index()
+
+# endregion
@@ -0,0 +1,405 @@
+import json
+import numpy as np
+import pandas as pd
+import datetime as dt
+
+from pathlib import Path
+from config import logger, EASTERN_TZ
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from utils import HOUR_FIELDS, VOLUME
+from data_source import decode_bars
+
+# region : Variables
+
+OHLC_COLUMNS = ("Open", "High", "Low", "Close")
+
+# Volume inconnu : build_hour_matrix ne lit que la colonne « Volume », absente des DataFrames de bars_to_df
+# (qui gardent le « volume » d'ib_insync) ; les matrices ont alors un Volume NaN
+UNKNOWN_VOLUME = -1
+
+HOUR_NS = 3_600 * 10**9
+DAY_NS = 24 * HOUR_NS
+
+# Les changements d'heure tombent sur un quart d'heure UTC (décalages multiples de 15 min)
+TRANSITION_STEP_NS = HOUR_NS // 4
+
+# Fichiers d'un BarStore enregistré (un .npy par tableau, chargeables en mémoire mappée)
+STORE_ARRAYS = ("offsets", "ts", "wall", "ohlc", "volume")
+SYMBOLS_FILE = "symbols.json"
+
+_EPOCH = dt.date(1970, 1, 1)
+
+# endregion
+
+# region : Helper Functions
+
+def _epoch_day(day: dt.date) -> int:
+    return (day - _EPOCH).days
+
+def _to_ns(index: pd.DatetimeIndex) -> np.ndarray:
+
+    """Index tz-aware -> int64 ns UTC (quelle que soit la résolution de l'index)."""
+
+    return np.asarray(index.tz_convert("UTC").tz_localize(None), dtype="datetime64[ns]").view(np.int64)
+
+def _to_wall(ts: np.ndarray, tz) -> np.ndarray:
+
+    """int64 ns UTC -> int64 ns heure murale de `tz`, par la conversion publique de pandas."""
+
+    local = pd.DatetimeIndex(ts.view("datetime64[ns]"), tz="UTC").tz_convert(tz).tz_localize(None)
+    return np.asarray(local, dtype="datetime64[ns]").view(np.int64)
+
+def _utc_transitions(tz, lo: int, hi: int) -> Tuple[np.ndarray, np.ndarray]:
+
+    """
+    Changements d'heure de `tz` sur [lo; hi] (ns UTC) : (instants UTC en ns, décalage en ns à partir de chaque instant).
+    Décalage relevé par pandas sur une grille de TRANSITION_STEP_NS, dont on ne garde que les changements.
+    """
+
+    grid = np.arange(lo // TRANSITION_STEP_NS, hi // TRANSITION_STEP_NS + 1, dtype=np.int64) * TRANSITION_STEP_NS
+    offsets = _to_wall(grid, tz) - grid
+
+    changes = np.flatnonzero(np.diff(offsets)) + 1
+    starts = np.concatenate(([np.iinfo(np.int64).min], grid[changes]))
+
+    return starts, np.concatenate((offsets[:1], offsets[changes]))
+
+def _wall_clock(ts: np.ndarray) -> np.ndarray:
+
+    """
+    int64 ns UTC -> int64 ns heure murale US/Eastern (une seule conversion pour tout le store) :
+    décalage de la dernière transition <= ts, par recherche dichotomique et addition entière.
+    Sur une plage plus longue que le nombre de barres, la conversion pandas directe est moins coûteuse.
+    """
+
+    if not len(ts):
+        return ts.copy()
+
+    lo, hi = int(ts.min()), int(ts.max())
+
+    if (hi - lo) // TRANSITION_STEP_NS > len(ts):
+        return _to_wall(ts, EASTERN_TZ)
+
+    starts, offsets = _utc_transitions(EASTERN_TZ, lo, hi)
+    return ts + offsets[np.searchsorted(starts, ts, side="right") - 1]
+
+def _nan_reduce(values: np.ndarray, func) -> float:
+
+    """Réduction en ignorant les NaN (comme pandas) ; NaN si aucune valeur."""
+
+    values = values[~np.isnan(values)]
+    return float(func(values)) if len(values) else np.nan
+
+# endregion
+
+# region : Bar Store
+
+class TickerBars:
+
+    """
+    Vue sur les barres d'un ticker dans un BarStore (aucune copie) : lignes [start, stop), triées par date.
+    Fournit DAY, DAY-1, la matrice horaire et la barre 16h par recherche dichotomique sur l'heure murale.
+    """
+
+    __slots__ = ("store", "symbol", "start", "stop")
+
+    def __init__(self, store: "BarStore", symbol: str, start: int, stop: int):
+
+        self.store = store
+        self.symbol = symbol
+        self.start = start
+        self.stop = stop
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    @property
+    def ts(self) -> np.ndarray:
+        return self.store.ts[self.start:self.stop]
+
+    @property
+    def wall(self) -> np.ndarray:
+        return self.store.wall[self.start:self.stop]
+
+    @property
+    def ohlc(self) -> np.ndarray:
+        return self.store.ohlc[self.start:self.stop]
+
+    @property
+    def volume(self) -> np.ndarray:
+        return self.store.volume[self.start:self.stop]
+
+    def session(self, day: dt.date) -> Tuple[int, int]:
+
+        """Plage de lignes [a, b) de la séance `day` (relative au ticker ; vide si aucune barre)."""
+
+        wall = self.wall
+        lo = _epoch_day(day) * DAY_NS
+
+        return int(np.searchsorted(wall, lo)), int(np.searchsorted(wall, lo + DAY_NS))
+
+    def previous_sessions(self, day: dt.date, max_lookback_days: int = 7) -> Iterator[dt.date]:
+
+        """Séances de [day - max_lookback_days, day), de la plus récente à la plus ancienne."""
+
+        wall = self.wall
+        first = _epoch_day(day) - max_lookback_days
+        i = int(np.searchsorted(wall, _epoch_day(day) * DAY_NS))
+
+        while i > 0:
+
+            current = int(wall[i - 1] // DAY_NS)
+
+            if current < first:
+                return
+
+            yield _EPOCH + dt.timedelta(days=current)
+            i = int(np.searchsorted(wall, current * DAY_NS))
+
+    def hour_matrix(self, day: dt.date) -> np.ndarray:
+
+        """
+        Matrice (24, 5) de la séance, identique à utils.build_hour_matrix sur le DataFrame d'origine :
+        plusieurs barres dans la même heure sont agrégées (first / max / min / last / somme, NaN ignorés),
+        Volume NaN si inconnu (UNKNOWN_VOLUME).
+        """
+
+        m = np.full((24, len(HOUR_FIELDS)), np.nan)
+        a, b = self.session(day)
+
+        if a == b:
+            return m
+
+        hours = (self.wall[a:b] % DAY_NS) // HOUR_NS
+        values = self.ohlc[a:b]
+        volume = self.volume[a:b]
+
+        known = volume[0] != UNKNOWN_VOLUME
+        width = len(HOUR_FIELDS) if known else VOLUME
+
+        if known:
+            values = np.column_stack((values, volume))
+
+        if len(np.unique(hours)) == len(hours):
+            m[hours, :width] = values
+
+        else:
+            agg = {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"}
+            grouped = pd.DataFrame(values, columns=HOUR_FIELDS[:width]).groupby(hours).agg({c: agg[c] for c in HOUR_FIELDS[:width]})
+            m[grouped.index.to_numpy(), :width] = grouped.to_numpy(dtype=float)
+
+        return m
+
+    def hour_bar(self, day: dt.date, hour: int) -> Optional[Tuple[float, float, float, float]]:
+
+        """
+        Barre OHLC agrégée de hour:00–hour:59, ou None si absente, incomplète ou sans volume (volume connu),
+        comme data_handler._make_hour_bar.
+        """
+
+        wall = self.wall
+        lo = _epoch_day(day) * DAY_NS + hour * HOUR_NS
+
+        a, b = int(np.searchsorted(wall, lo)), int(np.searchsorted(wall, lo + HOUR_NS))
+
+        if a == b:
+            return None
+
+        win = self.ohlc[a:b]
+        bar = (float(win[0, 0]), _nan_reduce(win[:, 1], np.max), _nan_reduce(win[:, 2], np.min), float(win[-1, 3]))
+
+        if np.isnan(bar).any():
+            return None
+
+        volume = self.volume[a:b]
+
+        if volume[0] != UNKNOWN_VOLUME and volume.sum() <= 0:
+            return None
+
+        return bar
+
+    def frame(self) -> pd.DataFrame:
+
+        """DataFrame indexé US/Eastern (Open, High, Low, Close et Volume s'il est connu), pour le code qui attend des DataFrames."""
+
+        if not len(self):
+            return pd.DataFrame()
+
+        index = pd.DatetimeIndex(self.ts.view("datetime64[ns]"), tz="UTC", name="date").tz_convert(EASTERN_TZ)
+        df = pd.DataFrame(self.ohlc, index=index, columns=list(OHLC_COLUMNS))
+
+        if self.volume[0] != UNKNOWN_VOLUME:
+            df["Volume"] = self.volume
+
+        return df
+
+class BarStore:
+
+    """
+    Barres de tout un univers dans des tableaux contigus (pas de DataFrame par ticker) :
+    - ts      : (barres,) int64 — horodatages UTC en ns, triés par ticker
+    - wall    : (barres,) int64 — mêmes instants en heure murale US/Eastern (découpage par séance / heure)
+    - ohlc    : (barres, 4) float64 (ou float32) — Open, High, Low, Close
+    - volume  : (barres,) int64 — UNKNOWN_VOLUME si le DataFrame d'origine n'a pas de colonne « Volume »
+    - offsets : (tickers + 1,) int64 — barres du ticker i = [offsets[i], offsets[i + 1])
+    Peut être enregistré dans un dossier de .npy et rouvert en mémoire mappée.
+    """
+
+    __slots__ = ("symbols", "offsets", "ts", "wall", "ohlc", "volume", "_positions")
+
+    def __init__(self, symbols: List[str], offsets: np.ndarray, ts: np.ndarray, wall: np.ndarray, ohlc: np.ndarray, volume: np.ndarray):
+
+        self.symbols = list(symbols)
+        self.offsets = offsets
+        self.ts = ts
+        self.wall = wall
+        self.ohlc = ohlc
+        self.volume = volume
+
+        self._positions = {symbol: i for i, symbol in enumerate(self.symbols)}
+
+    def __getstate__(self):
+        return self.symbols, self.offsets, self.ts, self.wall, self.ohlc, self.volume
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self._positions
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.symbols)
+
+    def __getitem__(self, symbol: str) -> TickerBars:
+
+        i = self._positions[symbol]
+        return TickerBars(self, symbol, int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def get(self, symbol: str, default=None) -> Optional[TickerBars]:
+        return self[symbol] if symbol in self._positions else default
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in STORE_ARRAYS)
+
+    @classmethod
+    def from_frames(cls,
+                    frames: Dict[str, Optional[pd.DataFrame]],
+                    symbols: Optional[Iterable[str]] = None,
+                    dtype=np.float64) -> "BarStore":
+
+        """
+        Construit le store depuis des DataFrames de barres indexés par date (les symboles sans barres ont une plage vide).
+        dtype=np.float32 divise par deux la place des prix, au prix de comparaisons moins exactes.
+        """
+
+        symbols = list(frames) if symbols is None else list(symbols)
+        offsets = np.zeros(len(symbols) + 1, dtype=np.int64)
+
+        ts, ohlc, volume = [], [], []
+
+        for i, symbol in enumerate(symbols):
+
+            df = frames.get(symbol)
+            n = 0
+
+            if df is not None and not df.empty:
+
+                if not df.index.is_monotonic_increasing:
+                    df = df.sort_index()
+
+                n = len(df)
+
+                ts.append(_to_ns(df.index if df.index.tz is not None else df.index.tz_localize(EASTERN_TZ)))
+                ohlc.append(df.reindex(columns=OHLC_COLUMNS).to_numpy(dtype=dtype))
+                volume.append(df["Volume"].fillna(0).to_numpy(dtype=np.int64) if "Volume" in df else np.full(n, UNKNOWN_VOLUME, dtype=np.int64))
+
+            offsets[i + 1] = offsets[i] + n
+
+        ts = np.concatenate(ts) if ts else np.empty(0, dtype=np.int64)
+
+        return cls(symbols,
+                   offsets,
+                   ts,
+                   _wall_clock(ts),
+                   np.concatenate(ohlc) if ohlc else np.empty((0, len(OHLC_COLUMNS)), dtype=dtype),
+                   np.concatenate(volume) if volume else np.empty(0, dtype=np.int64))
+
+    @classmethod
+    def from_bars(cls, symbol: str, bars) -> "BarStore":
+
+        """
+        Store d'un ticker directement depuis une réponse reqHistoricalData (data_source.decode_bars), sans DataFrame.
+        Même contenu que from_frames({symbol: bars_to_df(bars)}) : le « volume » d'IB n'est pas lu (UNKNOWN_VOLUME).
+        bars : liste de BarData, réponse déjà décodée (ts, values) ou DataFrame (cache disque, backends hors ligne).
+        """
+
+        if isinstance(bars, pd.DataFrame):
+            return cls.from_frames({symbol: bars})
+
+        if isinstance(bars, tuple):
+            ts, values = bars
+
+        else:
+            ts, values = decode_bars(bars) if bars else (np.empty(0, dtype=np.int64), np.empty((0, len(OHLC_COLUMNS))))
+
+        if len(ts) and not (np.diff(ts) >= 0).all():
+            order = np.argsort(ts, kind="stable")
+            ts, values = ts[order], values[order]
+
+        return cls([symbol],
+                   np.array([0, len(ts)], dtype=np.int64),
+                   ts,
+                   _wall_clock(ts),
+                   np.ascontiguousarray(values[:, :len(OHLC_COLUMNS)]),
+                   np.full(len(ts), UNKNOWN_VOLUME, dtype=np.int64))
+
+    @classmethod
+    def concat(cls, stores: Dict[str, "BarStore"], symbols: Iterable[str]) -> "BarStore":
+
+        """Assemble des stores d'un ticker (construits au fil du fetch) dans l'ordre de `symbols`."""
+
+        symbols = list(symbols)
+        parts = [stores[s][s] for s in symbols if s in stores]
+
+        if not parts:
+            return cls.from_frames({}, symbols)
+
+        sizes = {bars.symbol: len(bars) for bars in parts}
+        offsets = np.zeros(len(symbols) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([sizes.get(s, 0) for s in symbols])
+
+        return cls(symbols,
+                   offsets,
+                   np.concatenate([bars.ts for bars in parts]),
+                   np.concatenate([bars.wall for bars in parts]),
+                   np.concatenate([bars.ohlc for bars in parts]),
+                   np.concatenate([bars.volume for bars in parts]))
+
+    def save(self, directory: Union[str, Path]) -> None:
+
+        """Enregistre le store dans `directory` (un .npy par tableau + symbols.json)."""
+
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        for name in STORE_ARRAYS:
+            np.save(directory / f"{name}.npy", getattr(self, name))
+
+        (directory / SYMBOLS_FILE).write_text(json.dumps(self.symbols))
+        logger.info(f"[STORE] {len(self)} tickers / {len(self.ts)} bars saved to {directory}")
+
+    @classmethod
+    def open(cls, directory: Union[str, Path], mmap: bool = True) -> "BarStore":
+
+        """Rouvre un store enregistré ; mmap=True mappe les tableaux en lecture seule au lieu de les charger."""
+
+        directory = Path(directory)
+        arrays = {name: np.load(directory / f"{name}.npy", mmap_mode="r" if mmap else None) for name in STORE_ARRAYS}
+
+        return cls(json.loads((directory / SYMBOLS_FILE).read_text()), **arrays)
+
+# endregion
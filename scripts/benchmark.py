@@ -0,0 +1,385 @@
+import re
+import json
+import time
+import asyncio
+import logging
+import argparse
+import platform
+import subprocess
+import numpy as np
+import pandas as pd
+import datetime as dt
+
+from pathlib import Path
+from ib_insync import BarData, util
+from collections import defaultdict
+from typing import Dict, List, Optional
+from config import logger, EASTERN_TZ, OUTPUT_DIR
+from data_source import ReplaySource, bars_to_df
+from fetch_data import fetch_all_data
+from utils import build_hour_matrix
+from bar_store import BarStore
+from parallel import EvaluationPool
+from engine import build_universe, screen_universe, evaluate_universe
+from fingerprints import fingerprint_universe, match_fingerprints
+from conditions import CONDITIONS, CONDITION_RULES, compile_plan, evaluate_plan, evaluate_conditions
+from data_handler import SessionIndex, get_data_for_date, find_previous_day_data, find_previous_16h_open
+
+# region : Variables
+
+DEFAULT_SIZES = [50, 500, 5000]
+DEFAULT_CONDITION_SETS = ["5", "20", "all"]
+DEFAULT_OUTPUT = OUTPUT_DIR / "benchmark.json"
+
+SESSION_HOURS = range(4, 20)
+RTH_HOURS = range(9, 16)
+
+# Profil des barres synthétiques : trous fréquents hors séance, volume nul, journées sans cotation
+EXTENDED_GAP_RATE = 0.30
+RTH_GAP_RATE = 0.02
+EXTENDED_ZERO_VOLUME_RATE = 0.15
+RTH_ZERO_VOLUME_RATE = 0.01
+HALTED_DAY_RATE = 0.02
+FLAT_BAR_RATE = 0.10
+
+# endregion
+
+# region : Synthetic Data
+
+class _Checked:
+
+    """Case cochée minimale (interface tk.BooleanVar.get) pour appeler evaluate_conditions."""
+
+    def get(self) -> bool:
+        return True
+
+class _SyntheticSource(ReplaySource):
+
+    """ReplaySource servi depuis la mémoire : mesure l'orchestration du fetch sans disque ni réseau."""
+
+    def __init__(self, frames: Dict[str, pd.DataFrame]):
+
+        super().__init__(".", paced=False)
+        self._frames = dict(frames)
+
+    def _load_contracts(self) -> Dict[str, dict]:
+        return {}
+
+    def _path(self, symbol: str) -> Optional[Path]:
+        return Path(symbol) if symbol in self._frames else None
+
+def synthetic_bars(rng: np.random.Generator, dates: List[dt.date]) -> pd.DataFrame:
+
+    """
+    Barres 1h 04:00–19:00 ET au format bars_to_df : marche aléatoire, barres pré/post-marché
+    souvent absentes ou à volume nul, barres plates (High == Low) et journées sans cotation.
+    """
+
+    rows, index = [], []
+    price = 5 + rng.random() * 95
+
+    for day in dates:
+
+        if rng.random() < HALTED_DAY_RATE:
+            continue
+
+        for h in SESSION_HOURS:
+
+            rth = h in RTH_HOURS
+
+            if rng.random() < (RTH_GAP_RATE if rth else EXTENDED_GAP_RATE):
+                continue
+
+            o = round(price, 2)
+            c = round(price * (1 + rng.normal(0, 0.015 if rth else 0.005)), 2)
+
+            if rng.random() < FLAT_BAR_RATE:
+                hi = lo = c = o
+
+            else:
+                hi = round(max(o, c) * (1 + abs(rng.normal(0, 0.004))), 2)
+                lo = round(min(o, c) * (1 - abs(rng.normal(0, 0.004))), 2)
+
+            zero = rng.random() < (RTH_ZERO_VOLUME_RATE if rth else EXTENDED_ZERO_VOLUME_RATE)
+            volume = 0 if zero else int(rng.integers(100, 50_000 if rth else 2_000))
+
+            rows.append((o, hi, lo, c, volume, (o + c) / 2, 0 if zero else int(rng.integers(1, 500))))
+            index.append(EASTERN_TZ.localize(dt.datetime.combine(day, dt.time(h))))
+
+            price = max(c, 0.5)
+
+    columns = ["Open", "High", "Low", "Close", "volume", "average", "barCount"]
+    return pd.DataFrame(rows, columns=columns, index=pd.DatetimeIndex(index, name="date"))
+
+def to_bar_data(df: pd.DataFrame) -> List[BarData]:
+
+    """DataFrame synthétique -> réponse reqHistoricalData (BarData, dates UTC), pour mesurer le décodage."""
+
+    dates = df.index.tz_convert("UTC").to_pydatetime()
+
+    return [BarData(date=d, open=o, high=h, low=l, close=c, volume=v, average=a, barCount=n)
+            for d, (o, h, l, c, v, a, n) in zip(dates, df.itertuples(index=False, name=None))]
+
+def synthetic_universe(size: int, screening_date: dt.date, days: int, seed: int) -> Dict[str, pd.DataFrame]:
+
+    dates = [d.date() for d in pd.bdate_range(end=screening_date, periods=days)]
+    rng = np.random.default_rng(seed)
+
+    return {f"SYN{i:05d}": synthetic_bars(rng, dates) for i in range(size)}
+
+# endregion
+
+# region : Helper Functions
+
+def _bars_to_df_util(bars: List[BarData]) -> pd.DataFrame:
+
+    """Ancien décodage (util.df puis pd.to_datetime), gardé comme référence pour l'étape bars_to_df."""
+
+    df = util.df(bars)
+    df["date"] = pd.to_datetime(df["date"])
+    df.set_index("date", inplace=True)
+    df.index = df.index.tz_convert(EASTERN_TZ)
+
+    return df.rename(columns={"open": "Open", "high": "High", "low": "Low", "close": "Close"})
+
+def _condition_sets(specs: List[str], seed: int) -> Dict[str, List[int]]:
+
+    ids = sorted(CONDITION_RULES)
+    rng = np.random.default_rng(seed)
+
+    sets = {}
+
+    for spec in specs:
+
+        if spec == "all":
+            sets[spec] = ids
+
+        else:
+            sets[spec] = sorted(int(c) for c in rng.choice(ids, size=min(int(spec), len(ids)), replace=False))
+
+    return sets
+
+def condition_families() -> Dict[str, List[int]]:
+
+    """Conditions regroupées par forme d'expression, champs et heures masqués ("X[n] >= max(X[n..n])", ...)."""
+
+    families = defaultdict(list)
+
+    for cid, condition in sorted(CONDITIONS.items()):
+        shape = re.sub(r"\b(Open|High|Low|Close|Volume|Hour)\[", "X[", condition.text)
+        families[re.sub(r"(?<![\w-])\d+(?:\.\d+)?h?|(?<=bar)\d+", "n", shape)].append(cid)
+
+    return dict(families)
+
+class _Timer:
+
+    def __init__(self, records: list, **labels):
+
+        self.records = records
+        self.labels = labels
+
+    def __enter__(self):
+
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+
+        self.records.append(dict(self.labels, seconds=time.perf_counter() - self.t0))
+        return False
+
+def _git_revision() -> Optional[str]:
+
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+
+    except Exception:
+        return None
+
+# endregion
+
+# region : Benchmark Functions
+
+def bench_universe(size: int,
+                   screening_date: dt.date,
+                   condition_sets: Dict[str, List[int]],
+                   days: int,
+                   seed: int,
+                   pool: Optional[EvaluationPool] = None) -> list:
+
+    """
+    Mesure chaque étape du pipeline pour un univers de `size` tickers :
+    fetch (orchestration, backend mémoire), décodage, découpage DAY / DAY-1 / Open 16h,
+    évaluation scalaire et vectorisée par jeu de conditions et par famille,
+    et découpage + évaluation répartis sur les process de `pool`.
+    """
+
+    records: list = []
+    frames = synthetic_universe(size, screening_date, days, seed)
+    tickers = list(frames)
+
+    bars = {t: to_bar_data(df) for t, df in frames.items()}
+    base = dict(tickers=size)
+
+    with _Timer(records, stage="fetch", **base):
+        asyncio.run(fetch_all_data(_SyntheticSource(frames), tickers, screening_date))
+
+    with _Timer(records, stage="bars_to_df_util", **base):
+        for b in bars.values():
+            _bars_to_df_util(b)
+
+    with _Timer(records, stage="bars_to_df", **base):
+        df_map = {t: bars_to_df(b) for t, b in bars.items()}
+
+    with _Timer(records, stage="bar_store_from_bars", **base):
+        BarStore.concat({t: BarStore.from_bars(t, b) for t, b in bars.items()}, tickers)
+
+    with _Timer(records, stage="session_index", **base):
+        sessions = {t: SessionIndex(df) for t, df in df_map.items()}
+
+    with _Timer(records, stage="get_data_for_date", **base):
+        today = {t: get_data_for_date(s, screening_date) for t, s in sessions.items()}
+
+    with _Timer(records, stage="find_previous_day_data", **base):
+        yesterday = {t: find_previous_day_data(s, screening_date) for t, s in sessions.items()}
+
+    with _Timer(records, stage="find_previous_16h_open", **base):
+        open16 = {t: find_previous_16h_open(s, screening_date) for t, s in sessions.items()}
+
+    kept = [t for t in tickers if not today[t].empty and yesterday[t] is not None and open16[t] is not None]
+
+    with _Timer(records, stage="build_hour_matrix", **base):
+        matrices = {t: (build_hour_matrix(today[t]), build_hour_matrix(yesterday[t])) for t in kept}
+
+    with _Timer(records, stage="build_universe", **base):
+        u = build_universe(df_map, tickers, screening_date)
+
+    with _Timer(records, stage="bar_store", **base):
+        store = BarStore.from_frames(df_map, tickers)
+
+    with _Timer(records, stage="build_universe_store", **base):
+        build_universe(store, tickers, screening_date)
+
+    with _Timer(records, stage="fingerprint_universe", **base):
+        bits = fingerprint_universe(u)
+
+    for name, ids in condition_sets.items():
+
+        checked = {str(cid): _Checked() for cid in ids}
+        labels = dict(base, conditions=len(ids), condition_set=name)
+
+        with _Timer(records, stage="evaluate_conditions", **labels):
+            for t in kept:
+                evaluate_conditions(checked, today[t], open16[t], yesterday[t])
+
+        with _Timer(records, stage="screen_universe", **labels):
+            screen_universe(u, ids, [])
+
+        with _Timer(records, stage="fingerprint_match", **labels):
+            match_fingerprints(bits, ids, [])
+
+        if pool is not None:
+            with _Timer(records, stage="parallel_screen", workers=pool.workers, **labels):
+                asyncio.run(pool.screen(df_map, screening_date, ids))
+
+    for family, ids in condition_families().items():
+
+        plan = compile_plan(ids, ())
+        labels = dict(base, conditions=len(ids), family=family)
+
+        with _Timer(records, stage="family_scalar", **labels):
+            for t in kept:
+                evaluate_plan(plan, matrices[t][0], open16[t], matrices[t][1])
+
+        with _Timer(records, stage="family_vector", **labels):
+            evaluate_universe(u, ids)
+
+    for r in records:
+        r["per_ticker_us"] = round(r["seconds"] / size * 1e6, 2)
+
+    return records
+
+def compare(current: list, baseline_path: Path) -> None:
+
+    """Affiche le ratio courant / référence de chaque mesure présente dans les deux fichiers."""
+
+    def key(r):
+        return tuple((k, r[k]) for k in sorted(r) if k not in ("seconds", "per_ticker_us"))
+
+    baseline = {key(r): r["seconds"] for r in json.loads(baseline_path.read_text())["results"]}
+
+    print(f"\nvs {baseline_path}:")
+
+    for r in current:
+
+        ref = baseline.get(key(r))
+
+        if ref:
+            flag = "  <-- regression" if r["seconds"] > 1.2 * ref else ""
+            print(f"  {dict(key(r))}: x{r['seconds'] / ref:.2f}{flag}")
+
+def run(sizes: List[int],
+        condition_specs: List[str],
+        screening_date: dt.date,
+        days: int = 5,
+        seed: int = 0,
+        output: Path = DEFAULT_OUTPUT,
+        baseline: Optional[Path] = None,
+        workers: int = 0) -> dict:
+
+    # Les logs par ticker (DEBUG / INFO) fausseraient les mesures
+    previous_level = logging.getLogger().level
+    logging.getLogger().setLevel(logging.ERROR)
+
+    pool = EvaluationPool(workers) if workers > 1 else None
+
+    try:
+        condition_sets = _condition_sets(condition_specs, seed)
+        results = [r for size in sizes for r in bench_universe(size, screening_date, condition_sets, days, seed, pool)]
+
+    finally:
+        logging.getLogger().setLevel(previous_level)
+
+        if pool is not None:
+            pool.shutdown()
+
+    report = {"revision": _git_revision(),
+              "python": platform.python_version(),
+              "numpy": np.__version__,
+              "pandas": pd.__version__,
+              "created_at": dt.datetime.now().isoformat(timespec="seconds"),
+              "params": {"sizes": sizes, "condition_sets": condition_specs, "date": screening_date.isoformat(),
+                         "days": days, "seed": seed, "workers": workers},
+              "results": results}
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+
+    for r in results:
+        label = r.get("family") or r.get("condition_set") or ""
+        print(f"{r['tickers']:>6} {r['stage']:<24} {label:<18} {r['seconds']:>9.4f}s {r['per_ticker_us']:>10.1f} us/ticker")
+
+    logger.info(f"[BENCH] Results written to {output}")
+
+    if baseline is not None:
+        compare(results, baseline)
+
+    return report
+
+# endregion
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark du pipeline de screening sur des univers synthétiques.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--conditions", nargs="+", default=DEFAULT_CONDITION_SETS, help="tailles de jeux de conditions, ou 'all'")
+    parser.add_argument("--date", type=dt.date.fromisoformat, default=dt.date(2025, 3, 7))
+    parser.add_argument("--days", type=int, default=5, help="jours ouvrés d'historique par ticker")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", type=Path, help="résultats d'une version précédente à comparer")
+    parser.add_argument("--workers", type=int, default=0, help="process pour l'étape parallel_screen (0 : étape ignorée)")
+
+    args = parser.parse_args()
+    run(args.sizes, args.conditions, args.date, args.days, args.seed, args.output, args.baseline, args.workers)
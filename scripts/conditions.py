@@ -1,13 +1,19 @@
-import operator
-import pandas as pd
-
-from config import logger, EASTERN_TZ
-from typing import List, Tuple, Optional, Dict, Callable
-from utils import (get_first_n_bars, safe_compare_bars, safe_high_vs_open16,
-                                                        safe_compare_to_range,
-                                                        safe_range_high_vs_yclose,
-                                                        safe_compare_day1_vs_today,
-                                                        get_bar_at_hour as get_bar)
+import json
+import time
+import numpy as np
+
+from config import logger, CONDITION_STATS_FILE, USER_CONDITIONS_FILE
+from metrics import registry
+from typing import TYPE_CHECKING, List, Tuple, Optional, Dict, Callable, FrozenSet
+from utils import (get_bar_at_hour, get_range_stat, get_first_n_hours,
+                                                    to_hour_matrix,
+                                                    is_valid_bar,
+                                                    HOUR_FIELDS)
+from expressions import Condition, parse_condition, Number, Open16, Bar, Nth, Range, Extremum, ARITHMETIC
+
+# pandas n'est importé que pour les annotations : la fenêtre se construit sans lui
+if TYPE_CHECKING:
+    import pandas as pd
 
 CONDITION_DEFINITIONS: List[Tuple[int, str]] = [
     
@@ -43,350 +49,686 @@ CONDITION_DEFINITIONS: List[Tuple[int, str]] = [
 
 # region : Time Functions
 
-def _hour_bounds_from_df(df: pd.DataFrame, hour: int):
+def _safe_bar_at_hour_today(m: np.ndarray, h: int) -> Optional[dict]:
 
-    last = df.index.max()
+    """
+    Barre horaire exploitable (OHLC renseignés, volume > 0) lue dans la matrice horaire, sinon None.
+    """
 
-    if last is None:
-        return None, None
+    if m is None:
+        return None
     
-    last_et = last.tz_convert(EASTERN_TZ) if last.tzinfo else EASTERN_TZ.localize(last)
-    day_start = last_et.replace(hour=0, minute=0, second=0, microsecond=0)
+    row = m[h]
 
-    t0 = day_start + pd.Timedelta(hours=hour)
-    t1 = t0 + pd.Timedelta(hours=1)
+    if not is_valid_bar(row):
+        return None
 
-    return t0, t1
+    return dict(zip(HOUR_FIELDS, row.tolist()))
 
-def _hour_window_today(df: pd.DataFrame, hour: int) -> pd.DataFrame:
+# endregion
 
-    if df is None or df.empty:
-        return pd.DataFrame()
-    
-    idx = df.index.tz_convert(EASTERN_TZ) if df.index.tz is not None else df.index.tz_localize(EASTERN_TZ)
+# region : Source Functions
 
-    df = df.copy(); df.index = idx
-    t0, t1 = _hour_bounds_from_df(df, hour)
+# Sous-expressions partagées entre conditions (résolues une seule fois par ticker) :
+#   ("bar", day, hour, safe)               -> barre horaire (dict) ou None
+#   ("range", day, col, start, stop, mode) -> max/min d'une colonne sur [start; stop[ ou None
+#   ("first", day, n)                      -> (heures, barres) des n premières barres présentes (au moins FIRST_BARS)
 
-    if t0 is None:
-        return pd.DataFrame()
-    
-    return df.loc[(df.index >= t0) & (df.index < t1)]
+FIRST_BARS = 3
 
-def _make_hour_bar(win: pd.DataFrame) -> Optional[dict]:
+def _bar(day: int, h: int, safe: bool = False) -> tuple:
+    return ("bar", day, h, safe)
 
-    if win is None or win.empty:
-        return None
-    
-    for c in ("Open", "High", "Low", "Close"):
-        if c not in win:
-            return None
-        
-    o = win["Open"].iloc[0]
-    h = win["High"].max()
-    l = win["Low"].min()
-    c = win["Close"].iloc[-1]
+def _range(day: int, col: str, hours: range, mode: str = "max") -> tuple:
+    return ("range", day, col, hours.start, hours.stop, mode)
 
-    if pd.isna(o) or pd.isna(h) or pd.isna(l) or pd.isna(c):
-        return None
-    
-    if "Volume" in win:
+def _first(day: int, n: int = 0) -> tuple:
+    return ("first", day, max(FIRST_BARS, n + 1))
 
-        vol = win["Volume"].sum()
+def _resolve_source(days: Tuple[np.ndarray, np.ndarray], key: tuple):
 
-        if pd.isna(vol) or vol <= 0:
-            return None
-        
-    return {"Open": float(o), "High": float(h), "Low": float(l), "Close": float(c)}
+    kind, day = key[0], days[key[1]]
 
-def _safe_bar_at_hour_today(df: pd.DataFrame, h: int) -> Optional[dict]:
+    if kind == "bar":
+        _, _, h, safe = key
+        return _safe_bar_at_hour_today(day, h) if safe else get_bar_at_hour(day, h)
+
+    if kind == "range":
+        _, _, col, start, stop, mode = key
+        return get_range_stat(day, range(start, stop), col, mode)
+
+    hours = get_first_n_hours(day, key[2])
+    return hours, day[hours]
+
+# endregion
+
+# region : Conditions definition
+
+# Chaque condition est une expression (voir expressions.py), compilée une fois en règle
+# pour l'évaluation ticker par ticker et en noyau NumPy pour le moteur vectorisé (engine.py).
+CONDITION_EXPRESSIONS: Dict[int, str] = {}
+
+# 1–2 (DAY-1 Close >= Open)
+for cid, h in zip(range(1, 3), [18, 19]):
+    CONDITION_EXPRESSIONS[cid] = f"Close[{h}h, D-1] >= Open[{h}h, D-1] | valid"
+
+# 3–18 (J Close >= Open)
+for cid, h in zip(range(3, 19), range(4, 20)):
+    CONDITION_EXPRESSIONS[cid] = f"Close[{h}h] >= Open[{h}h] | valid"
+
+# 19 / 51 / 80 (4h vs 19h DAY-1)
+CONDITION_EXPRESSIONS[19] = "Low[4h] <= Low[19h, D-1] | symmetric"
+CONDITION_EXPRESSIONS[51] = "High[4h] >= High[19h, D-1] | symmetric"
+CONDITION_EXPRESSIONS[80] = "Low[4h] <= Low[19h, D-1]"
+
+# 20–34 / 52–66 (Low / High progression, inverse symétrique) / 81
+for cid, (h1, h2) in zip(range(20, 35), zip(range(5, 20), range(4, 19))):
+    CONDITION_EXPRESSIONS[cid] = f"Low[{h1}h] <= Low[{h2}h] | symmetric"
+for cid, (h1, h2) in zip(range(52, 67), zip(range(5, 20), range(4, 19))):
+    CONDITION_EXPRESSIONS[cid] = f"High[{h1}h] >= High[{h2}h] | symmetric"
+CONDITION_EXPRESSIONS[81] = "Low[5h] <= Low[4h]"
+
+# 35–46 / 47–50 / 67–68 / 82–83 / 127–142 (bar vs range)
+for cid, h in zip(range(35, 47), range(4, 16)):
+    CONDITION_EXPRESSIONS[cid] = f"High[{h}h] >= max(High[4..15])"
+for cid, h in zip(range(47, 51), range(16, 20)):
+    CONDITION_EXPRESSIONS[cid] = f"High[{h}h] >= max(High[4..19])"
+CONDITION_EXPRESSIONS[67] = "High[10h] > max(High[4..9])"
+CONDITION_EXPRESSIONS[68] = "Low[10h] < min(Low[4..9])"
+CONDITION_EXPRESSIONS[82] = "High[4h] >= max(High[5..8])"
+CONDITION_EXPRESSIONS[83] = "High[8h] >= max(High[4..7])"
+for cid, h in zip(range(127, 139), range(4, 16)):
+    CONDITION_EXPRESSIONS[cid] = f"Low[{h}h] <= min(Low[4..15])"
+for cid, h in zip(range(139, 143), range(16, 20)):
+    CONDITION_EXPRESSIONS[cid] = f"Low[{h}h] <= min(Low[4..19])"
+
+# 69–76 (Open/Close != High/Low 4h/5h, barre absente = False)
+for cid, h in zip(range(69, 77), [4]*4 + [5]*4):
+    col_a, col_b = {1: ("Open", "Low"), 2: ("Open", "High"), 3: ("Close", "Low"), 0: ("Close", "High")}[cid % 4]
+    CONDITION_EXPRESSIONS[cid] = f"{col_a}[{h}h] != {col_b}[{h}h] | valid"
+
+# 77–79 (n-ième barre Close >= Open ; barre absente : principal False, inverse True)
+for n, cid in enumerate(range(77, 80), start=1):
+    CONDITION_EXPRESSIONS[cid] = f"Close[bar{n}] >= Open[bar{n}] | missing=false/true"
+
+# 84–85 / 86–101 (High != Low, barre absente = N/A)
+for cid, h in zip([84, 85], [18, 19]):
+    CONDITION_EXPRESSIONS[cid] = f"High[{h}h, D-1] != Low[{h}h, D-1] | valid, missing=na"
+for cid, h in zip(range(86, 102), range(4, 20)):
+    CONDITION_EXPRESSIONS[cid] = f"High[{h}h] != Low[{h}h] | valid, missing=na"
+
+# 102–107 (first bar == h)
+for cid, h in zip(range(102, 108), range(4, 10)):
+    CONDITION_EXPRESSIONS[cid] = f"Hour[bar1] == {h} | missing=na"
+
+# 108–123 (Open/Close == High/Low, 16..19)
+for start, (col_a, col_b) in zip(range(108, 124, 4), [("Open", "Low"), ("Open", "High"), ("Close", "Low"), ("Close", "High")]):
+    for cid, h in zip(range(start, start + 4), range(16, 20)):
+        CONDITION_EXPRESSIONS[cid] = f"{col_a}[{h}h] == {col_b}[{h}h] | valid, missing=na"
+
+# 124–126
+for cid, factor in zip([124, 125], [1.5, 1.7]):
+    CONDITION_EXPRESSIONS[cid] = f"max(High[16..19, D-1], High[4..19]) > {factor} * Open16"
+CONDITION_EXPRESSIONS[126] = "max(High[4..19]) > 2 * Close[19h, D-1]"
+
+def _load_user_conditions(path=USER_CONDITIONS_FILE) -> None:
+
+    """
+    Ajoute les conditions de l'utilisateur : fichier JSON [{"id": 143, "label": "...", "expr": "..."}].
+    Une entrée invalide (id déjà pris, expression incorrecte) est ignorée avec un avertissement.
+    """
+
+    if path is None:
+        return
 
-    if df is None or df.empty:
-        return None
-    
     try:
-        b = get_bar(df, h)
+        entries = json.loads(path.read_text(encoding="utf-8"))
 
-        if b is not None and all(k in b for k in ("Open","High","Low","Close")) \
-           and not any(pd.isna(b[k]) for k in ("Open","High","Low","Close")) \
-           and (("Volume" not in b) or (not pd.isna(b["Volume"]) and b["Volume"] > 0)):
-            return b
-        
-    except Exception:
-        pass
+    except FileNotFoundError:
+        return
 
-    return _make_hour_bar(_hour_window_today(df, h))
+    except Exception as e:
+        logger.warning(f"[CONDITIONS] Could not load user conditions from {path}: {e}")
+        return
+
+    for entry in entries:
+
+        try:
+            cid, expr = int(entry["id"]), entry["expr"]
+
+            if cid in CONDITION_EXPRESSIONS:
+                raise ValueError(f"id {cid} is already defined")
+
+            parse_condition(expr)
+
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"[CONDITIONS] Skipping user condition {entry}: {e}")
+            continue
+
+        CONDITION_EXPRESSIONS[cid] = expr
+        CONDITION_DEFINITIONS.append((cid, entry.get("label") or expr))
+
+    logger.info(f"[CONDITIONS] {len(CONDITION_EXPRESSIONS)} conditions ({path} loaded)")
+
+_load_user_conditions()
+
+CONDITIONS: Dict[int, Condition] = {cid: parse_condition(expr) for cid, expr in sorted(CONDITION_EXPRESSIONS.items())}
 
 # endregion
 
-# region : Helper Functions
+# region : Rule Compilation
 
-def _cond_bar_cmp_today(h: int, col_a: str, op: Callable, col_b: str):
+# Une règle = (sources, fn) ; fn(values, open16) -> (primary, inverse) avec values[source] déjà résolu.
+# Chaque nœud de l'expression devient une fonction (values, open16) -> float ou None (valeur absente).
 
-    def _fn(d, *_):
+def _compile_node(node, valid: bool, mode: str = "max") -> Tuple[Callable, List[tuple]]:
 
-        b = _safe_bar_at_hour_today(d, h)
+    if isinstance(node, Number):
+        value = node.value
+        return (lambda v, o: value), []
 
-        if b is None:
-            return None, None
-        
-        cond = bool(op(b[col_a], b[col_b]))
-        return cond, (not cond)
-    
-    return _fn
+    if isinstance(node, Open16):
+        return (lambda v, o: o), []
 
-def _cond_bar_neq_today(h: int):
-    return _cond_bar_cmp_today(h, "High", operator.ne, "Low")
+    if isinstance(node, Bar):
+        key, field = _bar(node.day, node.hour, safe=valid), node.field
 
-def _cond_day1_neq(h: int):
+        def _fn(v, o):
+            b = v[key]
+            return None if b is None else b[field]
 
-    def _fn(d, dy, *_):
-       
-        b = _safe_bar_at_hour_today(dy, h)
+        return _fn, [key]
 
-        if b is None:
-            return None, None
-        
-        cond = bool(b["High"] != b["Low"])
-        return cond, (not cond)
-    
-    return _fn
+    if isinstance(node, Nth):
+        key, n = _first(node.day, node.n), node.n
+        col = HOUR_FIELDS.index(node.field) if node.field in HOUR_FIELDS else None
+
+        def _fn(v, o):
+
+            hours, bars = v[key]
 
-def _cond_open_close_rel_today(h: int, which: str, target: str, op: Callable):
-    col = "Open" if which == "open" else "Close"
-    return _cond_bar_cmp_today(h, col, op, target)
+            if hours.size <= n:
+                return None
 
-def _cond_first_bar_is(h: int):
+            return hours[n] if col is None else bars[n, col]
 
-    def _fn(d, *_):
+        return _fn, [key]
 
-        bars = get_first_n_bars(d, 1)
+    if isinstance(node, Range):
+        key = _range(node.day, node.field, node.hours, mode)
+        return (lambda v, o: v[key]), [key]
 
-        if bars.shape[0] == 0:
-            return None, None
-        
-        cond = (bars.index[0].tz_convert(EASTERN_TZ).hour == h) if bars.index[0].tzinfo else (bars.index[0].hour == h)
-        return cond, (not cond)
+    if isinstance(node, Extremum):
+        args = [_compile_node(arg, valid, node.mode) for arg in node.args]
+        fns, keys = [fn for fn, _ in args], [k for _, ks in args for k in ks]
+
+        if len(fns) == 1:
+            return fns[0], keys
+
+        reduce = max if node.mode == "max" else min
+
+        def _fn(v, o):
+            values = [x for x in (fn(v, o) for fn in fns) if x is not None]
+            return reduce(values) if values else None
+
+        return _fn, keys
+
+    (left, lkeys), (right, rkeys) = _compile_node(node.left, valid), _compile_node(node.right, valid)
+    op, divide = ARITHMETIC[node.op], node.op == "/"
+
+    def _fn(v, o):
+
+        a, b = left(v, o), right(v, o)
+
+        # Dénominateur nul : valeur absente, comme une barre manquante
+        if a is None or b is None or (divide and b == 0):
+            return None
+
+        return op(a, b)
+
+    return _fn, lkeys + rkeys
+
+def compile_rule(condition: Condition) -> Tuple[tuple, Callable]:
+
+    """
+    Compile une condition en règle (sources, fn) : une valeur absente donne condition.missing,
+    sinon (op(gauche, droite), op_inverse(gauche, droite)).
+    """
+
+    (left, lkeys), (right, rkeys) = _compile_node(condition.left, condition.valid), _compile_node(condition.right, condition.valid)
+    op, inv_op, missing = condition.operator, condition.inverse_operator, condition.missing
+
+    def _fn(v, open16, *_):
+
+        a, b = left(v, open16), right(v, open16)
+
+        if a is None or b is None:
+            return missing
+
+        return op(a, b), inv_op(a, b)
+
+    return tuple(dict.fromkeys(lkeys + rkeys)), _fn
+
+CONDITION_RULES: Dict[int, Tuple[tuple, Callable]] = {cid: compile_rule(c) for cid, c in CONDITIONS.items()}
+
+def _rule_function(rule: Tuple[tuple, Callable]) -> Callable:
+
+    sources, fn = rule
+
+    def _fn(d, dy=None, open16=None, *_):
+        days = (to_hour_matrix(d), to_hour_matrix(dy))
+        return fn({key: _resolve_source(days, key) for key in sources}, open16)
     
     return _fn
 
+# Évaluation unitaire d'une condition : func(data, data_day_minus1, open_16h) -> (primary, inverse)
+CONDITION_FUNCTIONS: Dict[int, Callable] = {cid: _rule_function(rule) for cid, rule in CONDITION_RULES.items()}
+
 # endregion
 
-# region : Conditions evaluation
+# region : Evaluation plan
 
-CONDITION_FUNCTIONS: Dict[int, Callable] = {}
+class EvaluationPlan:
 
-# 1–2 (DAY-1 Close >= Open)
-for cid, h in zip(range(1, 3), [18, 19]):
-    CONDITION_FUNCTIONS[cid] = lambda d, dy, *_ , h=h: (
-        (b := _safe_bar_at_hour_today(dy, h)) is not None and b["Close"] >= b["Open"],
-        (b := _safe_bar_at_hour_today(dy, h)) is not None and b["Close"] <  b["Open"],
-)
+    """
+    Plan d'évaluation compilé pour un jeu de conditions cochées :
+    - sources : sous-expressions distinctes (barres, agrégats de plage, premières barres)
+    - steps   : (cid, clé principale ou None, clé inverse ou None, fn, sources de la règle)
+    - preflight_hours : heures DAY attendues, pour le pré-contrôle des barres manquantes
+    """
 
-# 3–18 (J Close >= Open)
-for cid, h in zip(range(3, 19), range(4, 20)):
-    CONDITION_FUNCTIONS[cid] = lambda d, *_ , h=h: (
-        (b := _safe_bar_at_hour_today(d, h)) is not None and b["Close"] >= b["Open"],
-        (b := _safe_bar_at_hour_today(d, h)) is not None and b["Close"] <  b["Open"],
-    )
+    __slots__ = ("sources", "steps", "preflight_hours")
 
-# 19
-CONDITION_FUNCTIONS[19] = lambda d, dy, *_: safe_compare_day1_vs_today(d, dy, 4, 19, "Low", operator.le, 19)
+    def __init__(self, sources: tuple, steps: tuple, preflight_hours: FrozenSet[int]):
 
-# 20–34 (Low progression)
-for cid, (h1, h2) in zip(range(20, 35), zip(range(5, 20), range(4, 19))):
-    CONDITION_FUNCTIONS[cid] = lambda d, *_ , h1=h1, h2=h2, cid=cid: safe_compare_bars(d, h1, h2, "Low", operator.le, cid)
+        self.sources = sources
+        self.steps = steps
+        self.preflight_hours = preflight_hours
 
-# 35–46 / 47–50
-for cid, h in zip(range(35, 47), range(4, 16)):
-    CONDITION_FUNCTIONS[cid] = lambda d, *_ , h=h: safe_compare_to_range(d, h, "High", range(4, 16), operator.ge)
-for cid, h in zip(range(47, 51), range(16, 20)):
-    CONDITION_FUNCTIONS[cid] = lambda d, *_ , h=h: safe_compare_to_range(d, h, "High", range(4, 20), operator.ge)
+_PLAN_CACHE: Dict[Tuple[FrozenSet[int], FrozenSet[int]], EvaluationPlan] = {}
 
-# 51
-CONDITION_FUNCTIONS[51] = lambda d, dy, *_: safe_compare_day1_vs_today(d, dy, 4, 19, "High", operator.ge, 51)
+def _preflight_hours(cid: int) -> FrozenSet[int]:
 
-# 52–66 (High progression)
-for cid, (h1, h2) in zip(range(52, 67), zip(range(5, 20), range(4, 19))):
-    CONDITION_FUNCTIONS[cid] = lambda d, *_ , h1=h1, h2=h2, cid=cid: safe_compare_bars(d, h1, h2, "High", operator.ge, cid)
-
-# 67–68
-CONDITION_FUNCTIONS[67] = lambda d, *_: safe_compare_to_range(d, 10, "High", range(4, 10), operator.gt)
-CONDITION_FUNCTIONS[68] = lambda d, *_: safe_compare_to_range(d, 10, "Low",  range(4, 10), operator.lt, agg_func="min")
-
-# 69–76 (Open/Close != High/Low) 4h/5h
-def _make_cond_neq(h: int, idx_mod4: int):
-    def _fn(d, *_):
-        b = _safe_bar_at_hour_today(d, h)
-        if b is None:
-            return False, False
-        if idx_mod4 == 1:
-            cond = b["Open"] != b["Low"]
-        elif idx_mod4 == 2:
-            cond = b["Open"] != b["High"]
-        elif idx_mod4 == 3:
-            cond = b["Close"] != b["Low"]
-        else:
-            cond = b["Close"] != b["High"]
-        return cond, (not cond)
-    return _fn
-for cid, h in zip(range(69, 77), [4]*4 + [5]*4):
-    CONDITION_FUNCTIONS[cid] = _make_cond_neq(h, cid % 4)
+    """Heures DAY lues par une condition qui exige des barres exploitables (option valid)."""
 
-# 77–79
-for i, cid in enumerate(range(77, 80)):
-    CONDITION_FUNCTIONS[cid] = lambda d, *_ , i=i: (
-        (bars := get_first_n_bars(d, 3)).shape[0] > i and bars.iloc[i]["Close"] >= bars.iloc[i]["Open"],
-        (bars.iloc[i]["Close"] < bars.iloc[i]["Open"]) if bars.shape[0] > i else None,
-    )
+    condition = CONDITIONS.get(cid)
 
-# 80–81
-CONDITION_FUNCTIONS[80] = lambda d, dy, *_: safe_compare_day1_vs_today(d, dy, 4, 19, "Low", operator.le, cid=80)
-CONDITION_FUNCTIONS[81] = lambda d, *_: safe_compare_bars(d, 5, 4, "Low", operator.le, cid=81)
+    return condition.day_hours() if condition is not None and condition.valid else frozenset()
 
-# 82–83
-CONDITION_FUNCTIONS[82] = lambda d, *_: safe_compare_to_range(d, 4, "High", range(5, 9), operator.ge)
-CONDITION_FUNCTIONS[83] = lambda d, *_: safe_compare_to_range(d, 8, "High", range(4, 8), operator.ge)
+def compile_plan(selected_ids, inverse_ids) -> EvaluationPlan:
 
-# 84–85 (DAY-1 High != Low)
-for cid, h in zip([84, 85], [18, 19]):
-    CONDITION_FUNCTIONS[cid] = _cond_day1_neq(h)
+    """
+    Compile (et met en cache) le plan d'évaluation d'un jeu de conditions.
+    Le même plan est réutilisé pour tous les tickers d'un run.
+    """
 
-# 86–101 (DAY High != Low)
-for cid, h in zip(range(86, 102), range(4, 20)):
-    CONDITION_FUNCTIONS[cid] = _cond_bar_neq_today(h)
+    cache_key = (frozenset(selected_ids), frozenset(inverse_ids))
+    plan = _PLAN_CACHE.get(cache_key)
 
-# 102–107 (first bar == h)
-for cid, h in zip(range(102, 108), range(4, 10)):
-    CONDITION_FUNCTIONS[cid] = _cond_first_bar_is(h)
-
-# 108–123 (Open/Close vs High/Low, 16..19)
-for cid, h in zip(range(108, 112), range(16, 20)):
-    CONDITION_FUNCTIONS[cid] = _cond_open_close_rel_today(h, "open",  "Low",  operator.eq)
-for cid, h in zip(range(112, 116), range(16, 20)):
-    CONDITION_FUNCTIONS[cid] = _cond_open_close_rel_today(h, "open",  "High", operator.eq)
-for cid, h in zip(range(116, 120), range(16, 20)):
-    CONDITION_FUNCTIONS[cid] = _cond_open_close_rel_today(h, "close", "Low",  operator.eq)
-for cid, h in zip(range(120, 124), range(16, 20)):
-    CONDITION_FUNCTIONS[cid] = _cond_open_close_rel_today(h, "close", "High", operator.eq)
-
-# 124–126 / 127–142
-for cid, factor in zip([124, 125], [1.5, 1.7]):
-    CONDITION_FUNCTIONS[cid] = lambda d, dy, open16, *_ , f=factor: safe_high_vs_open16(d, dy, open16, f)
-CONDITION_FUNCTIONS[126] = lambda d, dy, *_: safe_range_high_vs_yclose(d, dy, 19, 2)
-for cid, h in zip(range(127, 139), range(4, 16)):
-    CONDITION_FUNCTIONS[cid] = lambda d, *_ , h=h: safe_compare_to_range(d, h, "Low", range(4, 16), operator.le, agg_func="min")
-for cid, h in zip(range(139, 143), range(16, 20)):
-    CONDITION_FUNCTIONS[cid] = lambda d, *_ , h=h: safe_compare_to_range(d, h, "Low", range(4, 20), operator.le, agg_func="min")
+    if plan is not None:
+        return plan
 
-# endregion
+    sources: Dict[tuple, None] = {}
+    steps = []
 
-# ---------------------------
-# Pre-check missing hours
-# ---------------------------
+    for cid in sorted(cache_key[0] | cache_key[1]):
+
+        rule = CONDITION_RULES.get(cid)
 
-def _preflight_missing_hours(conditions: dict, df: pd.DataFrame):
+        if rule is None:
+            logger.warning(f"No evaluation function defined for condition {cid}.")
+            continue
 
-    wanted = set()
+        srcs, fn = rule
+        sources.update(dict.fromkeys(srcs))
 
-    for k, v in conditions.items():
+        pk = str(cid) if cid in cache_key[0] else None
+        ik = f"inv_{cid}" if cid in cache_key[1] else None
 
-        if not v.get():
+        steps.append((cid, pk, ik, fn, srcs))
+
+    wanted = frozenset().union(*(_preflight_hours(cid) for cid in cache_key[0] | cache_key[1]))
+
+    plan = EvaluationPlan(tuple(sources), tuple(steps), wanted)
+    _PLAN_CACHE[cache_key] = plan
+
+    logger.debug(f"[PLAN] {len(steps)} conditions -> {len(plan.sources)} distinct sources")
+    return plan
+
+def evaluate_plan(plan: EvaluationPlan,
+                  data,
+                  open_16h_day_minus1: float,
+                  data_day_minus1=None) -> Dict[str, bool]:
+    
+    """
+    Exécute un plan sur un ticker : chaque source est résolue une fois, puis chaque condition
+    est évaluée (durée et N/A comptabilisées par condition). Renvoie {clé de case cochée: bool}, sans les conditions N/A.
+    """
+
+    days = (to_hour_matrix(data), to_hour_matrix(data_day_minus1))
+    values = {key: _resolve_source(days, key) for key in plan.sources}
+
+    results: Dict[str, bool] = {}
+
+    for cid, pk, ik, fn, _ in plan.steps:
+
+        t0 = time.perf_counter()
+
+        try:
+            primary, inverse = fn(values, open_16h_day_minus1)
+
+        except Exception as e:
+            logger.error(f"Exception while evaluating condition {cid}: {e}")
+            registry.inc("condition_errors", condition=cid)
             continue
 
-        if k.startswith("inv_"):
-            k = k.split("_")[1]
+        finally:
+            registry.observe("condition", time.perf_counter() - t0, condition=cid)
 
-        cid = int(k)
+        na = False
 
-        if 3 <= cid <= 18:    wanted.add(cid - (3 - 4))       
-        if 86 <= cid <= 101:  wanted.add(cid - (86 - 4))      
-        if 120 <= cid <= 123: wanted.add(cid - (120 - 16))   
-        if 102 <= cid <= 107: wanted.add(cid - 98)            
+        if pk is not None:
 
-    present = set()
+            if primary is not None:
+                results[pk] = bool(primary)
 
-    if df is not None and not df.empty:
+            else:
+                na = True
 
-        for h in range(0, 24):
-            if _safe_bar_at_hour_today(df, h) is not None:
-                present.add(h)
+        if ik is not None:
+            inv_val = _inverse_value(primary, inverse)
 
-    missing = sorted(wanted - present)
+            if inv_val is not None:
+                results[ik] = bool(inv_val)
 
-    if missing:
-        logger.warning(f"[PRECHECK] Missing hours on 'data' for today: {missing}")
+            else:
+                na = True
 
-# ---------------------------
-# Evaluation function
-# ---------------------------
+        if na:
+            registry.inc("conditions_na", condition=cid)
+
+    return results
+
+def plan_passes(plan: EvaluationPlan,
+                data,
+                open_16h_day_minus1: float,
+                data_day_minus1=None,
+                memo: Optional[Dict[int, Tuple[Optional[bool], Optional[bool]]]] = None) -> bool:
 
-def evaluate_conditions(conditions: dict,
-                        data: pd.DataFrame,
-                        open_16h_day_minus1: float,
-                        data_day_minus1: Optional[pd.DataFrame]) -> bool:
     """
-    Retourne True si toutes les conditions cochées ET évaluées sont vraies.
-    Ignore les conditions N/A (barres absentes). Ignore les paires contradictoires.
+    Verdict d'un ticker avec court-circuit : les conditions sont évaluées dans l'ordre de
+    ConditionStats (moins coûteuses et plus sélectives d'abord) et l'évaluation s'arrête au premier False.
+    Les sources ne sont résolues qu'à la demande. Même sémantique que all(evaluate_plan(...)) :
+    N/A ignorées, aucun résultat évalué -> False.
+    memo : résultats déjà connus du ticker, cid -> (principal, inverse) avec None pour N/A ;
+    consultés en premier et complétés au fil de l'évaluation.
     """
 
-    if not any(v.get() for v in conditions.values()):
-        logger.info("No conditions selected")
-        return True
-
-    _preflight_missing_hours(conditions, data)
+    stats = get_condition_stats()
+    days = (to_hour_matrix(data), to_hour_matrix(data_day_minus1))
+    values = {}
+    evaluated = False
 
-    selected_ids = {int(k) for k, v in conditions.items() if not k.startswith("inv_") and v.get()}
-    inverse_ids  = {int(k.split("_")[1]) for k, v in conditions.items() if k.startswith("inv_") and v.get()}
+    steps = stats.ordered(plan)
 
-    both = selected_ids & inverse_ids
+    if memo:
+        steps = sorted(steps, key=lambda step: step[0] not in memo)
 
-    if both:
-        logger.warning(f"Ignoring contradictory pairs for ids: {sorted(both)}")
+    for cid, pk, ik, fn, srcs in steps:
 
-        for cid in list(both):
-            selected_ids.discard(cid)
-            inverse_ids.discard(cid)
+        known = memo.get(cid) if memo is not None else None
 
-    requested = sorted(selected_ids | inverse_ids)
-    results: Dict[str, bool] = {}
+        if known is not None:
+            pv = known[0] if pk is not None else None
+            iv = known[1] if ik is not None else None
 
-    def record(key: str, value):
+            if pv is False or iv is False:
+                return False
 
-        if value is None:
-            return
-        
-        results[key] = bool(value)
+            evaluated = evaluated or pv is not None or iv is not None
+            continue
 
-    for cid in requested:
+        t0 = time.perf_counter()
 
-        func = CONDITION_FUNCTIONS.get(cid)
+        for key in srcs:
 
-        if func is None:
-            logger.warning(f"No evaluation function defined for condition {cid}.")
-            continue
+            if key not in values:
+                values[key] = _resolve_source(days, key)
 
         try:
-            primary, inverse = func(data, data_day_minus1, open_16h_day_minus1)
+            primary, inverse = fn(values, open_16h_day_minus1)
 
         except Exception as e:
             logger.error(f"Exception while evaluating condition {cid}: {e}")
+            registry.inc("condition_errors", condition=cid)
             continue
 
-        pk, ik = str(cid), f"inv_{cid}"
+        finally:
+            elapsed = time.perf_counter() - t0
+            registry.observe("condition", elapsed, condition=cid)
+
+        inv_val = _inverse_value(primary, inverse)
+        outcome = (None if primary is None else bool(primary), None if inv_val is None else bool(inv_val))
+
+        if memo is not None:
+            memo[cid] = outcome
+
+        pv = outcome[0] if pk is not None else None
+        iv = outcome[1] if ik is not None else None
 
-        if pk in conditions and conditions[pk].get():
-            record(pk, primary)
+        stats.record(cid, elapsed, pk, pv, ik, iv)
 
-        if ik in conditions and conditions[ik].get():
-            inv_val = inverse if inverse is not None else (None if primary is None else (not primary))
-            record(ik, inv_val)
+        if (pk is not None and pv is None) or (ik is not None and iv is None):
+            registry.inc("conditions_na", condition=cid)
 
-    picked_keys = [k for k, v in conditions.items() if v.get()]
-    scored = [results[k] for k in picked_keys if k in results]
+        if pv is False or iv is False:
+            registry.inc("short_circuits", condition=cid)
+            return False
 
-    if not scored:
+        evaluated = evaluated or pv is not None or iv is not None
+
+    if not evaluated:
         logger.warning("No conditions evaluated (N/A) — exclusion.")
-        return False
 
-    return all(scored)
+    return evaluated
+
+def _inverse_value(primary, inverse):
+
+    """Valeur de la case inverse : l'inverse explicite de la règle, sinon la négation du principal (N/A reste N/A)."""
+
+    return inverse if inverse is not None else (None if primary is None else (not primary))
+
+# endregion
+
+# region : Selectivity Statistics
+
+# Coût par source tant qu'aucune durée n'a été mesurée pour une condition
+DEFAULT_SOURCE_COST_SEC = 2e-6
+# Ordre recalculé toutes les N évaluations d'un même plan
+REORDER_EVERY = 256
+
+class ConditionStats:
+
+    """
+    Statistiques persistées entre les runs pour ordonner l'évaluation court-circuitée :
+    - par case cochée (« 12 », « inv_12 ») : évaluations non N/A et rejets (False)
+    - par condition : nombre d'évaluations et durée cumulée (sources + règle)
+    Ordre = coût moyen / taux de rejet (lissage de Laplace) croissant.
+    """
+
+    def __init__(self, state_file=CONDITION_STATS_FILE):
+
+        self.state_file = state_file
+
+        self.outcomes: Dict[str, List[int]] = {}
+        self.costs: Dict[int, List[float]] = {}
+
+        self._orders: Dict[EvaluationPlan, list] = {}
+
+        self.load()
+
+    def load(self) -> None:
+
+        if self.state_file is None:
+            return
+
+        try:
+            state = json.loads(self.state_file.read_text())
+
+            self.outcomes = {k: list(v) for k, v in state.get("outcomes", {}).items()}
+            self.costs = {int(k): list(v) for k, v in state.get("costs", {}).items()}
+
+        except FileNotFoundError:
+            pass
+
+        except Exception as e:
+            logger.warning(f"[STATS] Could not load condition stats: {e}")
+
+    def save(self) -> None:
+
+        if self.state_file is None:
+            return
+
+        try:
+            self.state_file.parent.mkdir(parents=True, exist_ok=True)
+            self.state_file.write_text(json.dumps({"outcomes": self.outcomes, "costs": self.costs}))
+
+        except Exception as e:
+            logger.warning(f"[STATS] Could not save condition stats: {e}")
+
+    def record(self, cid: int, seconds: float, pk: Optional[str], pv: Optional[bool], ik: Optional[str], iv: Optional[bool]) -> None:
+
+        cost = self.costs.setdefault(cid, [0, 0.0])
+        cost[0] += 1
+        cost[1] += seconds
+
+        for key, value in ((pk, pv), (ik, iv)):
+
+            if value is not None:
+                outcome = self.outcomes.setdefault(key, [0, 0])
+                outcome[0] += 1
+                outcome[1] += not value
+
+    def _score(self, step: tuple) -> float:
+
+        cid, pk, ik, _, srcs = step
+
+        count, total = self.costs.get(cid, (0, 0.0))
+        cost = total / count if count else DEFAULT_SOURCE_COST_SEC * max(len(srcs), 1)
+
+        # Probabilité de rejet de la condition : au moins une de ses cases renvoie False
+        keep = 1.0
+
+        for key in (pk, ik):
+
+            if key is not None:
+                evaluated, rejected = self.outcomes.get(key, (0, 0))
+                keep *= 1 - (rejected + 1) / (evaluated + 2)
+
+        return cost / max(1 - keep, 1e-6)
+
+    def ordered(self, plan: EvaluationPlan) -> list:
+
+        """Étapes du plan triées par score, recalculées toutes les REORDER_EVERY évaluations."""
+
+        entry = self._orders.get(plan)
+
+        if entry is None or entry[1] >= REORDER_EVERY:
+            entry = self._orders[plan] = [sorted(plan.steps, key=self._score), 0]
+
+        entry[1] += 1
+        return entry[0]
+
+_stats: Optional[ConditionStats] = None
+
+def get_condition_stats() -> ConditionStats:
+
+    """Statistiques partagées par le process (chargées au premier usage)."""
+
+    global _stats
+
+    if _stats is None:
+        _stats = ConditionStats()
+
+    return _stats
+
+# endregion
+
+# ---------------------------
+# Pre-check missing hours
+# ---------------------------
+
+def _preflight_missing_hours(plan: EvaluationPlan, m: np.ndarray):
+
+    if not plan.preflight_hours:
+        return
+
+    present = set()
+
+    for h in range(0, 24):
+        if _safe_bar_at_hour_today(m, h) is not None:
+            present.add(h)
+
+    missing = sorted(plan.preflight_hours - present)
+
+    if missing:
+        logger.warning(f"[PRECHECK] Missing hours on 'data' for today: {missing}")
+
+# ---------------------------
+# Evaluation function
+# ---------------------------
+
+def split_condition_ids(conditions: dict) -> Tuple[set, set]:
+
+    """
+    Sépare les cases cochées en ids principaux et ids inverses.
+    Les paires contradictoires (principal ET inverse) sont retirées des deux côtés.
+    """
+
+    selected_ids = {int(k) for k, v in conditions.items() if not k.startswith("inv_") and v.get()}
+    inverse_ids  = {int(k.split("_")[1]) for k, v in conditions.items() if k.startswith("inv_") and v.get()}
+
+    return resolve_condition_ids(selected_ids, inverse_ids)
+
+def resolve_condition_ids(selected_ids, inverse_ids) -> Tuple[set, set]:
+
+    """
+    Normalise des ids principaux / inverses (API, scripts) : retire les paires contradictoires.
+    """
+
+    selected_ids, inverse_ids = {int(c) for c in selected_ids}, {int(c) for c in inverse_ids}
+    both = selected_ids & inverse_ids
+
+    if both:
+        logger.warning(f"Ignoring contradictory pairs for ids: {sorted(both)}")
+
+        for cid in list(both):
+            selected_ids.discard(cid)
+            inverse_ids.discard(cid)
+
+    return selected_ids, inverse_ids
+
+def evaluate_conditions(conditions: dict,
+                        data: "pd.DataFrame",
+                        open_16h_day_minus1: float,
+                        data_day_minus1: Optional["pd.DataFrame"],
+                        memo: Optional[dict] = None) -> bool:
+    """
+    Retourne True si toutes les conditions cochées ET évaluées sont vraies.
+    Ignore les conditions N/A (barres absentes). Ignore les paires contradictoires.
+    Le jeu de conditions est compilé en plan (mis en cache) et DAY / DAY-1 sont
+    convertis une seule fois en matrices horaires (24, 5) ; l'évaluation s'arrête au premier False.
+    memo : résultats par condition déjà calculés pour ce ticker et cette date (voir plan_passes).
+    """
+
+    if not any(v.get() for v in conditions.values()):
+        logger.info("No conditions selected")
+        return True
+
+    data = to_hour_matrix(data)
+    data_day_minus1 = to_hour_matrix(data_day_minus1)
+
+    plan = compile_plan(*split_condition_ids(conditions))
+    _preflight_missing_hours(plan, data)
+
+    return plan_passes(plan, data, open_16h_day_minus1, data_day_minus1, memo)
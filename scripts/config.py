@@ -15,6 +15,35 @@ logger = logging.getLogger(__name__)
 
 OUTPUT_DIR = Path("./output")
 RESULTS_FILE = OUTPUT_DIR / "screener_results.txt"
+RESULTS_DB_FILE = OUTPUT_DIR / "results.sqlite"
+RESULTS_STORE_BACKTEST_OUTCOMES = False  # résultats par condition cochée aussi en backtest (tickers × dates × conditions : volumineux)
+
+CACHE_DIR = Path("./cache")
+BAR_CACHE_FILE = CACHE_DIR / "bars.sqlite"
+BAR_CACHE_ENABLED = True
+
+# Contrats qualifiés (conId, exchange) et échecs de qualification, avec durée de validité
+CONTRACT_CACHE_FILE = CACHE_DIR / "contracts.sqlite"
+CONTRACT_CACHE_ENABLED = True
+CONTRACT_TTL_DAYS = 30
+CONTRACT_NEGATIVE_TTL_DAYS = 7
+# Tickers par appel qualifyContractsAsync (IB reçoit une requête contractDetails par ticker)
+QUALIFY_BATCH_SIZE = 25
+
+# Taux de rejet et coût observés par condition (ordre de l'évaluation court-circuitée)
+CONDITION_STATS_FILE = CACHE_DIR / "condition_stats.json"
+
+# Empreintes (bitsets) de toutes les conditions par (ticker, date) des séances terminées : le backtest se réduit à des masques
+FINGERPRINT_CACHE_FILE = CACHE_DIR / "fingerprints.sqlite"
+FINGERPRINT_CACHE_ENABLED = True
+
+# Conditions ajoutées par l'utilisateur (expressions, voir expressions.py), à la suite des 142 conditions intégrées
+USER_CONDITIONS_FILE = Path("./user_conditions.json")
+
+# Métriques par run (textfile Prometheus et/ou JSON)
+METRICS_DIR = OUTPUT_DIR / "metrics"
+METRICS_FORMATS = ("prometheus", "json")
+METRICS_MAX_SAMPLES = 10_000
 
 MAX_TICKERS = 50
 ICON_PATH = "money_analyze_icon_143358.ico"
@@ -24,6 +53,8 @@ ICON_PATH = "money_analyze_icon_143358.ico"
 APP_TITLE = "Nasdaq Stock Screener"
 DEFAULT_FULLSCREEN = True
 DEFAULT_ZOOMED = True
+ASYNC_PUMP_MS = 10
+RESULTS_FLUSH_MS = 100  # regroupement des lignes insérées dans le tableau de résultats
 
 # === Timezone / Brokers === #
 
@@ -31,3 +62,34 @@ EASTERN_TZ = pytz.timezone("US/Eastern")
 IB_GATEWAY_HOST = '127.0.0.1'
 IB_GATEWAY_PORT = 7497
 IB_CLIENT_ID = 1
+
+# Pool de connexions : IB_POOL_SIZE clients (clientId IB_CLIENT_ID, +1, ...) répartis sur IB_GATEWAYS
+IB_GATEWAYS = [(IB_GATEWAY_HOST, IB_GATEWAY_PORT)]
+IB_POOL_SIZE = 4
+# Voie dont la connexion échoue : écartée IB_RECONNECT_COOLDOWN_SEC, doublé à chaque échec (plafonné)
+IB_RECONNECT_COOLDOWN_SEC = 5.0
+IB_RECONNECT_MAX_COOLDOWN_SEC = 300.0
+
+# === IB Pacing === #
+
+PACING_STATE_FILE = CACHE_DIR / "pacing_state.json"
+# (fenêtre en secondes, requêtes max) : IB limite l'API à ~50 messages/s ;
+# la règle 60 requêtes / 10 min ne concerne que les barres <= 30 s
+PACING_WINDOWS = [(1.0, 45)]
+PACING_MIN_CONCURRENCY = 1
+PACING_MAX_CONCURRENCY = 48
+PACING_START_CONCURRENCY = 16
+PACING_COOLDOWN_SEC = 2.0
+
+# === Parallel Evaluation === #
+
+# Process de découpage / évaluation (0 ou 1 : tout dans le process principal, None : un par cœur)
+EVAL_WORKERS = 0
+# Tickers par lot envoyé à un process, et taille d'univers à partir de laquelle les process sont utilisés
+EVAL_SHARD_SIZE = 250
+EVAL_PARALLEL_MIN_TICKERS = 500
+
+# === Headless Server === #
+
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
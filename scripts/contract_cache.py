@@ -0,0 +1,102 @@
+import time
+import sqlite3
+
+from ib_insync import Stock
+from typing import Dict, Iterable, Optional
+from config import logger, CONTRACT_CACHE_FILE, CONTRACT_TTL_DAYS, CONTRACT_NEGATIVE_TTL_DAYS
+
+# region : Variables
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS contracts (
+    symbol           TEXT    PRIMARY KEY,
+    con_id           INTEGER,
+    exchange         TEXT,
+    primary_exchange TEXT,
+    currency         TEXT,
+    qualified_at     INTEGER NOT NULL
+);
+"""
+
+_conn: Optional[sqlite3.Connection] = None
+
+# endregion
+
+# region : Helper Functions
+
+def _get_connection() -> sqlite3.Connection:
+
+    global _conn
+
+    if _conn is None:
+        CONTRACT_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+
+        _conn = sqlite3.connect(CONTRACT_CACHE_FILE, check_same_thread=False)
+        _conn.executescript(_SCHEMA)
+
+        logger.info(f"[CONTRACTS] Contract cache opened: {CONTRACT_CACHE_FILE}")
+
+    return _conn
+
+def _is_fresh(con_id: Optional[int], qualified_at: int, now: float) -> bool:
+
+    """Un contrat qualifié expire après CONTRACT_TTL_DAYS, un échec (con_id NULL) après CONTRACT_NEGATIVE_TTL_DAYS."""
+
+    ttl_days = CONTRACT_TTL_DAYS if con_id else CONTRACT_NEGATIVE_TTL_DAYS
+    return now - qualified_at < ttl_days * 86400
+
+# endregion
+
+# region : API Functions
+
+def load_contracts(symbols: Iterable[str]) -> Dict[str, Optional[Stock]]:
+
+    """
+    Contrats encore valides pour `symbols` : Stock qualifié (conId renseigné) ou None pour un échec en cache.
+    Les symboles absents ou expirés ne sont pas dans le résultat.
+    """
+
+    symbols = list(symbols)
+
+    if not symbols:
+        return {}
+
+    conn = _get_connection()
+    now = time.time()
+
+    found: Dict[str, Optional[Stock]] = {}
+
+    # SQLite limite le nombre de paramètres par requête
+    for i in range(0, len(symbols), 500):
+
+        chunk = symbols[i:i + 500]
+        rows = conn.execute("SELECT symbol, con_id, exchange, primary_exchange, currency, qualified_at FROM contracts "
+                            f"WHERE symbol IN ({', '.join('?' * len(chunk))})", chunk).fetchall()
+
+        for symbol, con_id, exchange, primary_exchange, currency, qualified_at in rows:
+
+            if not _is_fresh(con_id, qualified_at, now):
+                continue
+
+            found[symbol] = Stock(symbol, exchange, currency, conId=con_id, primaryExchange=primary_exchange) if con_id else None
+
+    return found
+
+def store_contracts(contracts: Dict[str, Optional[Stock]]) -> None:
+
+    """Enregistre le résultat d'une qualification ; None marque un symbole inconnu d'IB (cache négatif)."""
+
+    now = int(time.time())
+
+    rows = [(symbol, c.conId, c.exchange, c.primaryExchange, c.currency, now) if c is not None
+            else (symbol, None, None, None, None, now)
+            for symbol, c in contracts.items()]
+
+    conn = _get_connection()
+
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO contracts VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    logger.debug(f"[CONTRACTS] {len(rows)} contracts stored")
+
+# endregion
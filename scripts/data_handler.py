@@ -1,20 +1,13 @@
+import numpy as np
 import pandas as pd
 import datetime as dt
 
-from pandas.tseries.offsets import BDay
+from metrics import registry
+from typing import Optional, Union
 from config import logger, EASTERN_TZ, OUTPUT_DIR
 
 # region : Helper Functions
 
-def _day_bounds_eastern(target_date: dt.date):
-
-    """Délimite [YYYY-mm-dd 00:00, +1j) en US/Eastern tz-aware."""
-
-    start = EASTERN_TZ.localize(dt.datetime.combine(target_date, dt.time(0, 0)))
-    end = start + pd.Timedelta(days=1)
-
-    return start, end
-
 def _make_hour_bar(win: pd.DataFrame) -> dict | None:
 
     if win is None or win.empty:
@@ -41,67 +34,130 @@ def _make_hour_bar(win: pd.DataFrame) -> dict | None:
         
     return {"Open": float(o), "High": float(h), "Low": float(l), "Close": float(c)}
 
-def _slice_day(df: pd.DataFrame, target_date: dt.date) -> pd.DataFrame:
+def _as_sessions(data) -> "SessionIndex":
+    return data if isinstance(data, SessionIndex) else SessionIndex(data)
 
-    if df is None or df.empty:
-        return pd.DataFrame()
-    
-    start, end = _day_bounds_eastern(target_date)
-    idx = df.index.tz_convert(EASTERN_TZ) if df.index.tz is not None else df.index.tz_localize(EASTERN_TZ)
+# endregion
 
-    return df.loc[(idx >= start) & (idx < end)].copy()
+# region : Session Index
 
-def _hour_window(df: pd.DataFrame, target_date: dt.date, hour: int) -> pd.DataFrame:
+class SessionIndex:
 
-    day = _slice_day(df, target_date)
+    """
+    Barres d'un ticker indexées par séance, construites une seule fois :
+    - index converti en US/Eastern, trié
+    - days / starts / stops : séances triées et plage de lignes [start, stop) de chacune
+    DAY, DAY-1 et la fenêtre 16h sont des recherches dichotomiques renvoyant des vues (sans copie).
+    """
 
-    if day.empty:
-        return day
-    
-    start = EASTERN_TZ.localize(dt.datetime.combine(target_date, dt.time(hour, 0)))
-    end = start + pd.Timedelta(hours=1)
+    __slots__ = ("df", "days", "starts", "stops", "_wall")
+
+    def __init__(self, df: Optional[pd.DataFrame]):
+
+        if df is None or df.empty:
+            df = pd.DataFrame()
+            wall = np.empty(0, dtype="datetime64[ns]")
+
+        else:
+            idx = df.index.tz_convert(EASTERN_TZ) if df.index.tz is not None else df.index.tz_localize(EASTERN_TZ)
+            df = df.set_axis(idx)
+
+            if not idx.is_monotonic_increasing:
+                df = df.sort_index()
+
+            wall = np.asarray(df.index.tz_localize(None), dtype="datetime64[ns]")
+
+        # Heure murale Eastern : une séance = un jour calendaire local
+        day_of_row = wall.astype("datetime64[D]")
+
+        self.df = df
+        self.days, self.starts = np.unique(day_of_row, return_index=True)
+        self.stops = np.append(self.starts[1:], len(wall))
+        self._wall = wall
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def _position(self, target_date: dt.date) -> int:
+
+        """Rang de la séance `target_date`, ou -1 si aucune barre ce jour-là."""
+
+        i = int(np.searchsorted(self.days, np.datetime64(target_date, "D")))
+        return i if i < len(self.days) and self.days[i] == np.datetime64(target_date, "D") else -1
+
+    def rows(self, i: int) -> pd.DataFrame:
+        return self.df.iloc[self.starts[i]:self.stops[i]]
 
-    return day.loc[(day.index >= start) & (day.index < end)]
+    def day(self, target_date: dt.date) -> pd.DataFrame:
+
+        """Barres de la séance `target_date` (DataFrame vide si aucune)."""
+
+        i = self._position(target_date)
+        return self.rows(i) if i >= 0 else self.df.iloc[0:0]
+
+    def previous_days(self, target_date: dt.date, max_lookback_days: int = 7) -> range:
+
+        """Rangs des séances de [target_date - max_lookback_days, target_date), de la plus récente à la plus ancienne."""
+
+        stop = int(np.searchsorted(self.days, np.datetime64(target_date, "D")))
+        start = int(np.searchsorted(self.days, np.datetime64(target_date - dt.timedelta(days=max_lookback_days), "D")))
+
+        return range(stop - 1, start - 1, -1)
+
+    def hour_window(self, i: int, hour: int) -> pd.DataFrame:
+
+        """Barres de la séance de rang i entre hour:00 et hour:59 (heure Eastern)."""
+
+        lo = np.datetime64(self.days[i], "ns") + np.timedelta64(hour, "h")
+        start, stop = self.starts[i], self.stops[i]
+
+        a = start + int(np.searchsorted(self._wall[start:stop], lo))
+        b = start + int(np.searchsorted(self._wall[start:stop], lo + np.timedelta64(1, "h")))
+
+        return self.df.iloc[a:b]
+
+    def date(self, i: int) -> dt.date:
+        return self.days[i].astype(dt.date)
 
 # endregion
 
 # region : API Functions
 
-def get_screening_date_now() -> dt.date:
+def get_business_days(start_date: dt.date, end_date: dt.date) -> list[dt.date]:
 
-    now = dt.datetime.now(EASTERN_TZ)
+    """Jours ouvrés (lun–ven) de start_date à end_date inclus."""
 
-    if now.time() > dt.time(20, 0):
-        return (now + BDay(1)).date()
-    
-    return now.date()
+    return [d.date() for d in pd.bdate_range(start_date, end_date)]
 
-def get_data_for_date(df: pd.DataFrame, target_date: dt.date) -> pd.DataFrame:
-    """Slice correct en US/Eastern (évite les pièges de .date)."""
-    return _slice_day(df, target_date)
+@registry.timed("day_slice", day="today")
+def get_data_for_date(df: Union[pd.DataFrame, SessionIndex], target_date: dt.date) -> pd.DataFrame:
+    """Slice correct en US/Eastern (évite les pièges de .date). Passer un SessionIndex évite de réindexer."""
+    return _as_sessions(df).day(target_date)
 
-def find_previous_16h_open(df: pd.DataFrame, screening_date: dt.date) -> float | None:
+@registry.timed("open16_search")
+def find_previous_16h_open(df: Union[pd.DataFrame, SessionIndex], screening_date: dt.date) -> float | None:
 
     """
     Cherche l'open de la barre 16h (fenêtre 16:00–16:59 ET) d'un jour ouvert < screening_date (max 7 jours).
     On agrège les minutes -> OHLC 1h pour éviter les 'N/A'.
     """
 
-    for delta in range(1, 8):
+    sessions = _as_sessions(df)
+
+    for i in sessions.previous_days(screening_date):
 
-        day = screening_date - dt.timedelta(days=delta)
-        win = _hour_window(df, day, 16)
-        bar = _make_hour_bar(win)
+        bar = _make_hour_bar(sessions.hour_window(i, 16))
 
         if bar is not None:
 
             open_val = bar["Open"]
-            logger.info(f"Found 16h open for {day}: {open_val}")
+            logger.info(f"Found 16h open for {sessions.date(i)}: {open_val}")
             return open_val
         
     logger.warning(f"No 16h bar found in past 7 days before {screening_date}")
     return None
 
+@registry.timed("result_write", kind="screener")
 def save_screener_results(results: list[tuple], filename: str = "screener_results.txt") -> None:
 
     path = OUTPUT_DIR / filename
@@ -115,18 +171,25 @@ def save_screener_results(results: list[tuple], filename: str = "screener_result
 
     logger.info(f"Results saved to {path}")
 
-def find_previous_day_data(df: pd.DataFrame, start_date: dt.date, max_lookback_days: int = 7) -> pd.DataFrame | None:
+@registry.timed("result_write", kind="backtest")
+def save_backtest_results(table: pd.DataFrame, filename: str = "backtest_results.csv") -> None:
+
+    """Table date × ticker (1 = match, 0 = non retenu)."""
+
+    path = OUTPUT_DIR / filename
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-    day_cursor = start_date - dt.timedelta(days=1)
+    table.astype(int).to_csv(path)
+    logger.info(f"Backtest results saved to {path}")
 
-    for _ in range(max_lookback_days):
-        data = _slice_day(df, day_cursor)
+@registry.timed("day_slice", day="previous")
+def find_previous_day_data(df: Union[pd.DataFrame, SessionIndex], start_date: dt.date, max_lookback_days: int = 7) -> pd.DataFrame | None:
 
-        if not data.empty:
-            return data
-        
-        day_cursor -= dt.timedelta(days=1)
+    """Dernière séance avec des barres dans les `max_lookback_days` jours précédant start_date."""
 
-    return None
+    sessions = _as_sessions(df)
+    previous = sessions.previous_days(start_date, max_lookback_days)
+
+    return sessions.rows(previous[0]) if previous else None
 
 # endregion
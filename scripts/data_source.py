@@ -0,0 +1,328 @@
+import abc
+import zlib
+import random
+import asyncio
+import numpy as np
+import pandas as pd
+import datetime as dt
+
+from pathlib import Path
+from ib_insync import IB, Contract
+from typing import Dict, Optional, Tuple, Union
+from config import logger, EASTERN_TZ
+from bar_cache import BAR_COLUMNS
+
+# region : Variables
+
+REPLAY_FORMATS = (".parquet", ".csv")
+
+CONTRACTS_FILE = "contracts.csv"
+CONTRACT_FIELDS = ("symbol", "conId", "exchange", "primaryExchange", "currency")
+
+# Champs de BarData, dans l'ordre des colonnes de bars_to_df (bar_cache.BAR_COLUMNS)
+BAR_FIELDS = ("open", "high", "low", "close", "volume", "average", "barCount")
+
+_UTC = dt.timezone.utc
+
+# endregion
+
+# region : Helper Functions
+
+def _epoch_ns(date) -> int:
+
+    """BarData.date -> ns UTC : datetime avec fuseau, datetime naïf (UTC) ou date (barres journalières, minuit UTC)."""
+
+    if not isinstance(date, dt.datetime):
+        date = dt.datetime(date.year, date.month, date.day)
+
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=_UTC)
+
+    return round(date.timestamp() * 1e6) * 1000
+
+def decode_bars(bars) -> Tuple[np.ndarray, np.ndarray]:
+
+    """
+    Réponse reqHistoricalData -> (ts, values) en un seul passage sur les BarData, sans DataFrame :
+    ts (barres,) int64 ns UTC, values (barres, 7) float64 dans l'ordre de BAR_COLUMNS.
+    """
+
+    n = len(bars)
+
+    ts = np.fromiter((_epoch_ns(b.date) for b in bars), dtype=np.int64, count=n)
+    values = np.array([(b.open, b.high, b.low, b.close, b.volume, b.average, b.barCount) for b in bars], dtype=np.float64).reshape(n, len(BAR_FIELDS))
+
+    return ts, values
+
+def bars_to_df(bars) -> pd.DataFrame:
+
+    """
+    Réponse historique -> DataFrame indexé US/Eastern (colonnes Open, High, Low, Close, volume, average, barCount).
+    Construit directement depuis decode_bars (pas de util.df ni de pd.to_datetime).
+    Les backends hors ligne renvoient directement ce DataFrame.
+    """
+
+    if isinstance(bars, pd.DataFrame):
+        return bars
+
+    if not bars:
+        return pd.DataFrame()
+
+    ts, values = decode_bars(bars)
+    index = pd.DatetimeIndex(ts.view("datetime64[ns]"), tz="UTC", name="date").tz_convert(EASTERN_TZ)
+
+    columns = {c: values[:, i] for i, c in enumerate(BAR_COLUMNS)}
+    columns["barCount"] = columns["barCount"].astype(np.int64)
+
+    return pd.DataFrame(columns, index=index)
+
+def _read_bars(path: Path) -> pd.DataFrame:
+
+    df = pd.read_parquet(path) if path.suffix == ".parquet" else pd.read_csv(path)
+
+    if "date" in df.columns:
+        df = df.set_index("date")
+
+    df.index = pd.to_datetime(df.index, utc=True).tz_convert(EASTERN_TZ)
+    return df.sort_index()
+
+def _write_bars(path: Path, df: pd.DataFrame) -> None:
+
+    out = df.rename_axis("date")
+
+    if path.suffix == ".parquet":
+        out.to_parquet(path)
+
+    else:
+        out.to_csv(path)
+
+def _slice_request(df: pd.DataFrame, end_date_time: str, duration_str: str) -> pd.DataFrame:
+
+    """
+    Reproduit la fenêtre d'une requête IB sur des barres enregistrées :
+    endDateTime 'YYYYMMDD HH:MM:SS' (UTC) ou '' (maintenant), durationStr 'N S' ou 'N D' (N séances).
+    """
+
+    if end_date_time:
+        end = pd.Timestamp(dt.datetime.strptime(end_date_time, "%Y%m%d %H:%M:%S"), tz="UTC")
+
+    else:
+        end = pd.Timestamp.now(tz="UTC")
+
+    df = df[df.index < end]
+    amount, unit = duration_str.split()
+
+    if unit == "S":
+        return df[df.index >= end - pd.Timedelta(seconds=int(amount))]
+
+    sessions = pd.Index(df.index.date).unique()[-int(amount):]
+    return df[pd.Index(df.index.date).isin(sessions)]
+
+# endregion
+
+# region : Data Sources
+
+class DataSource(abc.ABC):
+
+    """
+    Backend de données de fetch_data : le sous-ensemble de l'API ib_insync.IB dont le fetch a besoin
+    (isConnected, errorEvent, connectAsync, qualifyContractsAsync, reqHistoricalDataAsync).
+    ib_insync.IB est le backend « live » ; les sous-classes ci-dessous servent hors ligne.
+    Un DataSource ne lit ni n'écrit les caches disque (barres, contrats).
+    """
+
+    def __init__(self):
+        self.errorEvent = _NullEvent()
+
+    def isConnected(self) -> bool:
+        return True
+
+    async def connectAsync(self, *args, **kwargs) -> None:
+        pass
+
+    def disconnect(self) -> None:
+        pass
+
+    @abc.abstractmethod
+    async def qualifyContractsAsync(self, *contracts: Contract) -> list:
+        ...
+
+    @abc.abstractmethod
+    async def reqHistoricalDataAsync(self, contract: Contract, **request):
+        ...
+
+class _NullEvent:
+
+    """Remplace ib.errorEvent pour les backends qui n'émettent pas d'erreurs IB."""
+
+    def __iadd__(self, handler):
+        return self
+
+    def __isub__(self, handler):
+        return self
+
+class ReplaySource(DataSource):
+
+    """
+    Rejoue des barres enregistrées : un fichier <SYMBOL>.parquet ou <SYMBOL>.csv par ticker dans `directory`
+    (format de bars_to_df), plus contracts.csv pour les conId.
+    latency / jitter : délai simulé par requête (s) ; pacing_error_rate : probabilité d'une erreur 420 simulée.
+    paced=False : pas de fenêtres de pacing IB côté client (mesure de l'orchestration seule).
+    """
+
+    def __init__(self,
+                 directory: Union[str, Path],
+                 latency: float = 0.0,
+                 jitter: float = 0.0,
+                 pacing_error_rate: float = 0.0,
+                 seed: Optional[int] = None,
+                 paced: bool = True):
+
+        super().__init__()
+
+        self.directory = Path(directory)
+        self.latency = latency
+        self.jitter = jitter
+        self.pacing_error_rate = pacing_error_rate
+        self.paced = paced
+
+        self._rng = random.Random(seed)
+        self._frames: Dict[str, pd.DataFrame] = {}
+        self._contracts = self._load_contracts()
+
+    def _load_contracts(self) -> Dict[str, dict]:
+
+        path = self.directory / CONTRACTS_FILE
+
+        if not path.exists():
+            return {}
+
+        return {row["symbol"]: row for row in pd.read_csv(path).to_dict("records")}
+
+    def _path(self, symbol: str) -> Optional[Path]:
+
+        for ext in REPLAY_FORMATS:
+
+            path = self.directory / f"{symbol}{ext}"
+
+            if path.exists():
+                return path
+
+        return None
+
+    def _frame(self, symbol: str) -> pd.DataFrame:
+
+        if symbol not in self._frames:
+            path = self._path(symbol)
+            self._frames[symbol] = _read_bars(path) if path is not None else pd.DataFrame()
+
+        return self._frames[symbol]
+
+    async def _simulate_round_trip(self) -> None:
+
+        delay = self.latency + self._rng.uniform(0, self.jitter)
+
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if self.pacing_error_rate and self._rng.random() < self.pacing_error_rate:
+            raise RuntimeError("Error 420, reqId -1: Historical data request pacing violation (simulated)")
+
+    async def qualifyContractsAsync(self, *contracts: Contract) -> list:
+
+        """Qualifie les tickers présents dans l'enregistrement (conId enregistré, sinon dérivé du symbole)."""
+
+        await asyncio.sleep(self.latency)
+
+        for c in contracts:
+
+            if self._path(c.symbol) is None:
+                continue
+
+            row = self._contracts.get(c.symbol, {})
+            con_id, exchange = row.get("conId"), row.get("primaryExchange")
+
+            # Cellules vides de contracts.csv : NaN à la lecture
+            c.conId = int(con_id) if pd.notna(con_id) and con_id else zlib.crc32(c.symbol.encode())
+            c.primaryExchange = exchange if pd.notna(exchange) and exchange else c.primaryExchange
+
+        return [c for c in contracts if c.conId]
+
+    async def reqHistoricalDataAsync(self, contract: Contract, **request) -> pd.DataFrame:
+
+        await self._simulate_round_trip()
+
+        df = self._frame(contract.symbol)
+
+        if df.empty:
+            raise RuntimeError(f"Error 162, reqId -1: HMDS query returned no data: {contract.symbol} (replay)")
+
+        return _slice_request(df, request.get("endDateTime", ""), request.get("durationStr", "1 D"))
+
+class RecordingSource(DataSource):
+
+    """
+    Délègue à une connexion IB et enregistre chaque réponse dans `directory`
+    (barres fusionnées par ticker + contracts.csv), au format lu par ReplaySource.
+    fmt=".parquet" nécessite pyarrow (ou fastparquet).
+    """
+
+    def __init__(self, ib: IB, directory: Union[str, Path], fmt: str = ".csv"):
+
+        super().__init__()
+
+        self.ib = ib
+        self.directory = Path(directory)
+        self.fmt = fmt
+        self.errorEvent = ib.errorEvent
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def client(self):
+        return self.ib.client
+
+    def isConnected(self) -> bool:
+        return self.ib.isConnected()
+
+    async def connectAsync(self, *args, **kwargs) -> None:
+        await self.ib.connectAsync(*args, **kwargs)
+
+    def disconnect(self) -> None:
+        self.ib.disconnect()
+
+    async def qualifyContractsAsync(self, *contracts: Contract) -> list:
+
+        qualified = await self.ib.qualifyContractsAsync(*contracts)
+
+        path = self.directory / CONTRACTS_FILE
+        rows = pd.DataFrame([{f: getattr(c, f) for f in CONTRACT_FIELDS} for c in qualified], columns=CONTRACT_FIELDS)
+
+        if path.exists():
+            rows = pd.concat([pd.read_csv(path), rows]).drop_duplicates("symbol", keep="last")
+
+        rows.to_csv(path, index=False)
+        return qualified
+
+    async def reqHistoricalDataAsync(self, contract: Contract, **request) -> pd.DataFrame:
+
+        df = bars_to_df(await self.ib.reqHistoricalDataAsync(contract, **request))
+
+        if not df.empty:
+
+            path = self.directory / f"{contract.symbol}{self.fmt}"
+
+            if path.exists():
+                recorded = _read_bars(path)
+                df_all = pd.concat([recorded, df])
+                df_all = df_all[~df_all.index.duplicated(keep="last")].sort_index()
+
+            else:
+                df_all = df
+
+            _write_bars(path, df_all)
+            logger.debug(f"[RECORD] {contract.symbol}: {len(df)} bars -> {path}")
+
+        return df
+
+# endregion
@@ -0,0 +1,436 @@
+import time
+import numpy as np
+import pandas as pd
+import datetime as dt
+
+from config import logger
+from metrics import registry
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+from utils import build_hour_matrix, HOUR_FIELDS, VOLUME
+from expressions import Condition, Number, Open16, Bar, Nth, Range, Extremum, ARITHMETIC
+from conditions import CONDITIONS
+from bar_store import BarStore, TickerBars
+from data_handler import SessionIndex, get_data_for_date, find_previous_day_data, find_previous_16h_open
+
+# region : Variables
+
+# Valeurs des matrices de résultats (int8) : vrai / faux / N/A (barres absentes)
+TRUE, FALSE, NA = 1, 0, -1
+
+# endregion
+
+# region : Universe Functions
+
+class Universe:
+
+    """
+    Barres horaires de tout l'univers empilées en un seul tableau NumPy.
+    - bars    : (tickers, 2, 24, 5) — jours [DAY, DAY-1], heures 0–23, champs OHLCV (NaN si absent)
+    - open16  : (tickers,) — Open 16h DAY-1
+    - present : (tickers, 2, 24) — barre présente (équivalent de get_bar_at_hour)
+    - valid   : (tickers, 2, 24) — barre exploitable (équivalent de _safe_bar_at_hour_today)
+    """
+
+    __slots__ = ("tickers", "bars", "open16", "present", "valid")
+
+    def __init__(self, tickers: List[str], bars: np.ndarray, open16: np.ndarray):
+
+        self.tickers = tickers
+        self.bars = bars
+        self.open16 = open16
+
+        ohlc = bars[..., :VOLUME]
+
+        self.present = ~np.isnan(ohlc).all(axis=-1)
+        self.valid = ~np.isnan(ohlc).any(axis=-1) & ~(bars[..., VOLUME] <= 0)
+
+    def __len__(self) -> int:
+        return len(self.tickers)
+
+def stack_universe(tickers: List[str],
+                   matrices: Iterable[Tuple[np.ndarray, np.ndarray]],
+                   open16: Iterable[float]) -> Universe:
+
+    """
+    Empile les matrices horaires (DAY, DAY-1) de chaque ticker en un Universe.
+    """
+
+    blocks = [np.stack((d, dy)) for d, dy in matrices]
+    bars = np.stack(blocks) if blocks else np.full((0, 2, 24, len(HOUR_FIELDS)), np.nan)
+
+    return Universe(list(tickers), bars, np.asarray(list(open16), dtype=float))
+
+def _skip(ticker: str, reason: str, message: str) -> None:
+
+    logger.debug(f"[SKIP] {message} for {ticker}")
+    registry.inc("tickers_skipped", reason=reason)
+
+def prepare_ticker(df: Union[pd.DataFrame, SessionIndex, TickerBars, None], screening_date: dt.date, ticker: str = "") -> Optional[Tuple[Tuple[np.ndarray, np.ndarray], float]]:
+
+    """
+    Découpe DAY, DAY-1 et l'Open 16h DAY-1 d'un ticker : ((matrice DAY, matrice DAY-1), open16),
+    ou None si le ticker est écarté (mêmes règles que run_screener). Le DataFrame peut être libéré ensuite.
+    Un DataFrame est copié dans un BarStore d'un ticker puis lu dans ses tableaux, comme les barres d'un BarStore
+    (TickerBars) ; un SessionIndex passe par les fonctions de data_handler.
+    """
+
+    if not isinstance(df, SessionIndex):
+        bars = df if isinstance(df, TickerBars) else BarStore.from_frames({ticker: df})[ticker]
+        return _prepare_bars(bars, screening_date, ticker)
+
+    sessions = df
+
+    if not len(sessions):
+        return _skip(ticker, "no_data", "No data")
+
+    data_today = get_data_for_date(sessions, screening_date)
+
+    if data_today.empty:
+        return _skip(ticker, "no_data_today", "No data_today")
+
+    data_yesterday = find_previous_day_data(sessions, screening_date)
+
+    if data_yesterday is None:
+        return _skip(ticker, "no_previous_day", "No previous day data")
+
+    open_16h = find_previous_16h_open(sessions, screening_date)
+
+    if open_16h is None:
+        return _skip(ticker, "no_16h_open", "No 16h open found")
+
+    return (build_hour_matrix(data_today), build_hour_matrix(data_yesterday)), open_16h
+
+def _prepare_bars(bars: TickerBars, screening_date: dt.date, ticker: str) -> Optional[Tuple[Tuple[np.ndarray, np.ndarray], float]]:
+
+    """prepare_ticker sur les tableaux d'un BarStore : mêmes règles, sans DataFrame."""
+
+    if not len(bars):
+        return _skip(ticker, "no_data", "No data")
+
+    start, stop = bars.session(screening_date)
+
+    if start == stop:
+        return _skip(ticker, "no_data_today", "No data_today")
+
+    previous = next(bars.previous_sessions(screening_date), None)
+
+    if previous is None:
+        return _skip(ticker, "no_previous_day", "No previous day data")
+
+    bar16 = next((bar for day in bars.previous_sessions(screening_date) if (bar := bars.hour_bar(day, 16)) is not None), None)
+
+    if bar16 is None:
+        return _skip(ticker, "no_16h_open", "No 16h open found")
+
+    return (bars.hour_matrix(screening_date), bars.hour_matrix(previous)), bar16[0]
+
+def build_universe(df_map: Union[Dict[str, Union[pd.DataFrame, SessionIndex]], BarStore], tickers: List[str], screening_date: dt.date) -> Universe:
+
+    """
+    Prépare DAY, DAY-1 et l'Open 16h DAY-1 de chaque ticker puis empile le tout.
+    Les tickers sans données exploitables sont écartés (mêmes règles que run_screener).
+    """
+
+    kept, matrices, opens = [], [], []
+
+    for ticker in tickers:
+
+        prepared = prepare_ticker(df_map.get(ticker), screening_date, ticker)
+
+        if prepared is None:
+            continue
+
+        kept.append(ticker)
+        matrices.append(prepared[0])
+        opens.append(prepared[1])
+
+    return stack_universe(kept, matrices, opens)
+
+# endregion
+
+# region : Helper Functions
+
+def _col(u: Universe, day: int, hour: int, col: int) -> np.ndarray:
+    return u.bars[:, day, hour, col]
+
+def _range_stat(u: Universe, day: int, hours: range, col: int, mode: str) -> Tuple[np.ndarray, np.ndarray]:
+
+    """
+    Max/min d'une colonne sur une plage horaire (NaN ignorés), avec le masque « au moins une valeur ».
+    """
+
+    values = u.bars[:, day, hours.start:hours.stop, col]
+    ok = ~np.isnan(values)
+
+    if mode == "max":
+        stat = np.where(ok, values, -np.inf).max(axis=1, initial=-np.inf)
+
+    else:
+        stat = np.where(ok, values, np.inf).min(axis=1, initial=np.inf)
+
+    return stat, ok.any(axis=1)
+
+def _nth_present_hour(u: Universe, day: int, n: int) -> Tuple[np.ndarray, np.ndarray]:
+
+    """
+    Heure de la n-ième barre présente (0 = première barre) et masque d'existence.
+    """
+
+    present = u.present[:, day]
+    hit = present & (np.cumsum(present, axis=1) == n + 1)
+
+    return hit.argmax(axis=1), hit.any(axis=1)
+
+# endregion
+
+# region : Vectorized Conditions
+
+# Chaque expression de conditions.CONDITIONS est compilée en noyau u -> (primary, inverse) int8 TRUE / FALSE / NA,
+# avec la même sémantique que la règle ticker par ticker (valeur absente -> condition.missing).
+# Chaque nœud devient une fonction (u, cache) -> (valeurs (n,), masque « valeur présente ») ; les plages et
+# n-ièmes barres lues plusieurs fois par une condition ne sont calculées qu'une fois (cache du noyau).
+
+def _cached(cache: dict, key: tuple, compute: Callable):
+
+    if key not in cache:
+        cache[key] = compute()
+
+    return cache[key]
+
+def _compile_node(node, valid: bool, mode: str = "max") -> Callable:
+
+    if isinstance(node, Number):
+        return lambda u, cache: (node.value, True)
+
+    if isinstance(node, Open16):
+        return lambda u, cache: (u.open16, True)
+
+    if isinstance(node, Bar):
+        col = HOUR_FIELDS.index(node.field)
+        return lambda u, cache: (_col(u, node.day, node.hour, col), (u.valid if valid else u.present)[:, node.day, node.hour])
+
+    if isinstance(node, Nth):
+
+        def _fn(u, cache):
+
+            hour, ok = _cached(cache, ("nth", node.day, node.n), lambda: _nth_present_hour(u, node.day, node.n))
+
+            if node.field == "Hour":
+                return hour, ok
+
+            return u.bars[np.arange(len(u)), node.day, hour, HOUR_FIELDS.index(node.field)], ok
+
+        return _fn
+
+    if isinstance(node, Range):
+        col = HOUR_FIELDS.index(node.field)
+        key = ("range", node.day, node.hours.start, node.hours.stop, col, mode)
+        return lambda u, cache: _cached(cache, key, lambda: _range_stat(u, node.day, node.hours, col, mode))
+
+    if isinstance(node, Extremum):
+        args = [_compile_node(arg, valid, node.mode) for arg in node.args]
+        reduce, fill = (np.maximum, -np.inf) if node.mode == "max" else (np.minimum, np.inf)
+
+        if len(args) == 1:
+            return args[0]
+
+        def _fn(u, cache):
+
+            value, ok = fill, False
+
+            for arg in args:
+                v, has = arg(u, cache)
+                value, ok = reduce(value, np.where(has, v, fill)), ok | has
+
+            return value, ok
+
+        return _fn
+
+    left, right, op = _compile_node(node.left, valid), _compile_node(node.right, valid), ARITHMETIC[node.op]
+
+    if node.op == "/":
+
+        # Dénominateur nul : valeur absente (comme conditions._compile_node), et non inf / nan
+        def _fn(u, cache):
+
+            (a, ok_a), (b, ok_b) = left(u, cache), right(u, cache)
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return np.divide(a, b), ok_a & ok_b & (b != 0)
+
+        return _fn
+
+    def _fn(u, cache):
+        (a, ok_a), (b, ok_b) = left(u, cache), right(u, cache)
+        return op(a, b), ok_a & ok_b
+
+    return _fn
+
+def _outcome(n: int, ok, cond, missing: Optional[bool]) -> np.ndarray:
+
+    if missing is None:
+        out = np.where(ok, cond, NA)
+
+    else:
+        out = ~ok | cond if missing else ok & cond
+
+    return np.broadcast_to(out, (n,)).astype(np.int8)
+
+def compile_kernel(condition: Condition) -> Callable[[Universe], Tuple[np.ndarray, np.ndarray]]:
+
+    """
+    Compile une condition en noyau vectorisé : (primary, inverse) sur tout l'univers en quelques opérations NumPy.
+    cache : sources déjà calculées sur ce même univers (partagé entre les conditions d'un evaluate_universe).
+    """
+
+    left, right = _compile_node(condition.left, condition.valid), _compile_node(condition.right, condition.valid)
+    op, inv_op, (miss_p, miss_i) = condition.operator, condition.inverse_operator, condition.missing
+
+    def _fn(u, cache=None):
+
+        cache = {} if cache is None else cache
+        (a, ok_a), (b, ok_b) = left(u, cache), right(u, cache)
+        ok = ok_a & ok_b
+
+        return _outcome(len(u), ok, op(a, b), miss_p), _outcome(len(u), ok, inv_op(a, b), miss_i)
+
+    return _fn
+
+VECTOR_CONDITIONS: Dict[int, Callable[..., Tuple[np.ndarray, np.ndarray]]] = {cid: compile_kernel(c) for cid, c in CONDITIONS.items()}
+
+# endregion
+
+# region : API Functions
+
+def evaluate_universe(u: Universe, ids: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+
+    """
+    Évalue les conditions demandées sur tout l'univers d'un coup.
+    Renvoie (primary, inverse), deux matrices int8 (tickers × conditions) à valeurs TRUE / FALSE / NA,
+    colonnes dans l'ordre de `ids`. Les plages et n-ièmes barres communes à plusieurs conditions sont calculées une fois.
+    """
+
+    ids = list(ids)
+
+    primary = np.full((len(u), len(ids)), NA, dtype=np.int8)
+    inverse = np.full((len(u), len(ids)), NA, dtype=np.int8)
+
+    if not len(u):
+        return primary, inverse
+
+    cache = {}
+
+    with np.errstate(invalid="ignore"):
+
+        for j, cid in enumerate(ids):
+
+            func = VECTOR_CONDITIONS.get(cid)
+
+            if func is None:
+                logger.warning(f"No evaluation function defined for condition {cid}.")
+                continue
+
+            t0 = time.perf_counter()
+            primary[:, j], inverse[:, j] = func(u, cache)
+
+            registry.observe("condition_vector", time.perf_counter() - t0, condition=cid)
+            registry.inc("conditions_na", int(np.count_nonzero(primary[:, j] == NA)), condition=cid)
+
+    return primary, inverse
+
+def empty_selection(n: int, checked: bool) -> np.ndarray:
+
+    """
+    Verdict de n tickers quand il ne reste aucune condition après retrait des paires contradictoires :
+    tous retenus si aucune case n'était cochée, aucun sinon (comme evaluate_conditions).
+    """
+
+    return np.full(n, not checked, dtype=bool)
+
+def screen_universe(u: Universe,
+                    selected_ids: Iterable[int],
+                    inverse_ids: Iterable[int],
+                    checked: Optional[bool] = None) -> np.ndarray:
+
+    """
+    Masque booléen (tickers,) des tickers retenus : toutes les conditions évaluées sont vraies,
+    les N/A sont ignorées et un ticker sans aucune condition évaluée est exclu.
+    checked : au moins une case cochée avant retrait des paires contradictoires (par défaut, ids non vides).
+    """
+
+    selected_ids, inverse_ids = sorted(selected_ids), sorted(inverse_ids)
+
+    if not selected_ids and not inverse_ids:
+        return empty_selection(len(u), bool(checked))
+
+    primary, _ = evaluate_universe(u, selected_ids)
+    _, inverse = evaluate_universe(u, inverse_ids)
+
+    return match_matrix(np.hstack((primary, inverse)))
+
+def match_matrix(values: np.ndarray) -> np.ndarray:
+
+    """
+    Réduit une matrice TRUE / FALSE / NA (tickers × conditions) en verdict par ticker.
+    """
+
+    known = values != NA
+    return known.any(axis=1) & ((values == TRUE) | ~known).all(axis=1)
+
+def backtest_universe(df_map: Union[Dict[str, pd.DataFrame], BarStore],
+                      tickers: List[str],
+                      dates: Iterable[dt.date],
+                      selected_ids: Iterable[int],
+                      inverse_ids: Iterable[int],
+                      recorder=None,
+                      fingerprints: Optional[Callable] = None,
+                      checked: Optional[bool] = None) -> pd.DataFrame:
+
+    """
+    Rejoue le screening sur chaque date à partir d'un seul historique par ticker.
+    DAY, DAY-1 et l'Open 16h DAY-1 sont découpés localement pour chaque date.
+    Renvoie une table booléenne date × ticker (False si le ticker est écarté ce jour-là).
+    recorder : results_store.RunRecorder qui reçoit les verdicts et résultats par condition de chaque date.
+    fingerprints : fingerprints.fingerprint_day, (store, tickers, date) -> empreintes des conditions ;
+    le verdict de chaque date est alors un masque de bits (empreintes en cache pour les séances terminées).
+    checked : au moins une case cochée avant retrait des paires contradictoires (voir screen_universe).
+    """
+
+    selected_ids, inverse_ids = set(selected_ids), set(inverse_ids)
+    ids = sorted(selected_ids | inverse_ids)
+    table = pd.DataFrame(False, index=pd.Index(list(dates), name="date"), columns=list(tickers))
+
+    # Barres copiées une fois dans des tableaux contigus, découpées ensuite sans DataFrame pour chaque date
+    store = df_map if isinstance(df_map, BarStore) else BarStore.from_frames(df_map, tickers)
+
+    for day in table.index:
+
+        if fingerprints is not None:
+            u = fingerprints(store, tickers, day)
+            matches = u.match(selected_ids, inverse_ids, checked)
+
+            if recorder is not None:
+                recorder.add_universe(day, tickers, u, ids, *u.outcomes(ids), matches)
+
+        else:
+            u = build_universe(store, tickers, day)
+
+            if recorder is None:
+                matches = screen_universe(u, selected_ids, inverse_ids, checked)
+
+            else:
+                primary, inverse = evaluate_universe(u, ids)
+                matches = empty_selection(len(u), bool(checked))
+
+                if ids:
+                    columns = [primary[:, j] if cid in selected_ids else inverse[:, j] for j, cid in enumerate(ids)]
+                    matches = match_matrix(np.column_stack(columns))
+
+                recorder.add_universe(day, tickers, u, ids, primary, inverse, matches)
+
+        table.loc[day, [t for t, m in zip(u.tickers, matches) if m]] = True
+        logger.debug(f"[BACKTEST] {day}: {int(matches.sum())} matches / {len(u)} tickers")
+
+    return table
+
+# endregion
@@ -0,0 +1,460 @@
+import re
+import operator
+
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
+from utils import HOUR_FIELDS, DAY, DAY_MINUS_1
+
+# region : Variables
+
+# Grammaire des conditions :
+#   condition  := expr comparateur expr [ "|" option ("," option)* ]
+#   expr       := terme (("+" | "-") terme)*           terme := facteur (("*" | "/") facteur)*
+#   facteur    := nombre | "-" facteur | "(" expr ")" | Open16 | champ "[" réf "]" | (max | min) "(" arg ("," arg)* ")"
+#   réf        := heure ["," jour] | "bar" n ["," jour]  (n-ième barre présente, 1 = première ; champ Hour = son heure)
+#   arg        := expr | champ "[" heure ".." heure ["," jour] "]"   (plage incluse, valeurs absentes ignorées)
+#   heure      := 4h | 4        jour := D | D-1
+#   options    := valid (barres à heure fixe exploitables, et non seulement présentes)
+#                 symmetric (inverse ≤ ↔ ≥, < ↔ > au lieu de l'inverse logique)
+#                 missing=false | missing=na | missing=false/true (principal / inverse si une valeur manque ; false par défaut)
+# Exemples : "Close[18h, D-1] >= Open[18h, D-1] | valid", "High[10h] > max(High[4..9])"
+
+FIELDS = HOUR_FIELDS + ("Hour",)
+
+COMPARATORS = {">=": "≥", "<=": "≤", "!=": "≠", "==": "=", "≥": "≥", "≤": "≤", "≠": "≠", "=": "=", ">": ">", "<": "<"}
+
+OPERATORS: Dict[str, Callable] = {"≥": operator.ge, "≤": operator.le, ">": operator.gt, "<": operator.lt, "=": operator.eq, "≠": operator.ne}
+
+LOGICAL_INVERSES = {"≥": "<", "≤": ">", ">": "≤", "<": "≥", "=": "≠", "≠": "="}
+SYMMETRIC_INVERSES = {"≥": "≤", "≤": "≥", ">": "<", "<": ">"}
+
+ARITHMETIC: Dict[str, Callable] = {"+": operator.add, "-": operator.sub, "*": operator.mul, "/": operator.truediv}
+
+MISSING_VALUES = {"false": False, "true": True, "na": None}
+
+_TOKEN = re.compile(r"\s*(?:(\d+h)|(\d+(?:\.\d+)?)|([A-Za-z_]\w*)|(>=|<=|!=|==|\.\.|[≥≤≠=<>\[\](),|+\-*/]))")
+
+# endregion
+
+# region : Expression Nodes
+
+class ExpressionError(ValueError):
+    pass
+
+class Number:
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: float):
+        self.value = value
+
+class Open16:
+
+    """Open 16h DAY-1 du ticker."""
+
+    __slots__ = ()
+
+class Bar:
+
+    """Champ de la barre d'une heure fixe."""
+
+    __slots__ = ("field", "day", "hour")
+
+    def __init__(self, field: str, day: int, hour: int):
+
+        self.field = field
+        self.day = day
+        self.hour = hour
+
+class Nth:
+
+    """Champ (ou heure) de la n-ième barre présente de la journée, n = 0 pour la première."""
+
+    __slots__ = ("field", "day", "n")
+
+    def __init__(self, field: str, day: int, n: int):
+
+        self.field = field
+        self.day = day
+        self.n = n
+
+class Range:
+
+    """Colonne sur une plage horaire [start; stop[, agrégée par le max / min qui l'entoure."""
+
+    __slots__ = ("field", "day", "hours")
+
+    def __init__(self, field: str, day: int, hours: range):
+
+        self.field = field
+        self.day = day
+        self.hours = hours
+
+class Extremum:
+
+    """max(...) / min(...) des arguments renseignés ; absent si aucun ne l'est."""
+
+    __slots__ = ("mode", "args")
+
+    def __init__(self, mode: str, args: tuple):
+
+        self.mode = mode
+        self.args = args
+
+class BinOp:
+
+    __slots__ = ("op", "left", "right")
+
+    def __init__(self, op: str, left, right):
+
+        self.op = op
+        self.left = left
+        self.right = right
+
+class Condition:
+
+    """
+    Condition compilée : left op right, avec son inverse explicite et la valeur des cases
+    (principale, inverse) quand une barre manque (False, True ou None pour N/A).
+    """
+
+    __slots__ = ("text", "left", "op", "right", "inverse_op", "valid", "missing")
+
+    def __init__(self, text: str, left, op: str, right, inverse_op: str, valid: bool, missing: Tuple[Optional[bool], Optional[bool]]):
+
+        self.text = text
+        self.left = left
+        self.op = op
+        self.right = right
+        self.inverse_op = inverse_op
+        self.valid = valid
+        self.missing = missing
+
+    @property
+    def symbol(self) -> str:
+        return self.op
+
+    @property
+    def inverse_symbol(self) -> str:
+        return self.inverse_op
+
+    @property
+    def operator(self) -> Callable:
+        return OPERATORS[self.op]
+
+    @property
+    def inverse_operator(self) -> Callable:
+        return OPERATORS[self.inverse_op]
+
+    def nodes(self) -> List:
+        return _walk(self.left) + _walk(self.right)
+
+    def day_hours(self) -> FrozenSet[int]:
+
+        """Heures fixes lues sur DAY (pré-contrôle des barres manquantes)."""
+
+        return frozenset(n.hour for n in self.nodes() if isinstance(n, Bar) and n.day == DAY)
+
+    def __repr__(self) -> str:
+        return f"Condition({self.text!r})"
+
+def _walk(node) -> List:
+
+    if isinstance(node, BinOp):
+        return [node] + _walk(node.left) + _walk(node.right)
+
+    if isinstance(node, Extremum):
+        return [node] + [n for arg in node.args for n in _walk(arg)]
+
+    return [node]
+
+# endregion
+
+# region : Parser
+
+class _Parser:
+
+    def __init__(self, text: str):
+
+        self.text = text
+        self.tokens = _tokenize(text)
+        self.pos = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self, expected: Optional[str] = None) -> str:
+
+        token = self.peek()
+
+        if token is None or (expected is not None and token != expected):
+            self.fail(f"expected {expected or 'a token'}, got {token or 'end of expression'}")
+
+        self.pos += 1
+        return token
+
+    def fail(self, message: str):
+        raise ExpressionError(f"{message} in {self.text!r}")
+
+    # region : Grammar
+
+    def condition(self) -> Condition:
+
+        left = self.expr()
+
+        if self.peek() not in COMPARATORS:
+            self.fail(f"expected a comparison operator, got {self.peek() or 'end of expression'}")
+
+        op = COMPARATORS[self.take()]
+        right = self.expr()
+
+        valid, symmetric, missing = False, False, (False, False)
+
+        if self.peek() == "|":
+            self.take()
+            valid, symmetric, missing = self.options()
+
+        if self.peek() is not None:
+            self.fail(f"unexpected {self.peek()}")
+
+        if symmetric and op not in SYMMETRIC_INVERSES:
+            self.fail(f"no symmetric inverse for {op}")
+
+        inverse_op = SYMMETRIC_INVERSES[op] if symmetric else LOGICAL_INVERSES[op]
+
+        return Condition(self.text, left, op, right, inverse_op, valid, missing)
+
+    def options(self) -> Tuple[bool, bool, Tuple[Optional[bool], Optional[bool]]]:
+
+        valid, symmetric, missing = False, False, (False, False)
+
+        while True:
+
+            name = self.take()
+
+            if name == "valid":
+                valid = True
+
+            elif name == "symmetric":
+                symmetric = True
+
+            elif name == "missing":
+                self.take("=")
+                primary = self.missing_value()
+                inverse = primary
+
+                if self.peek() == "/":
+                    self.take()
+                    inverse = self.missing_value()
+
+                missing = (primary, inverse)
+
+            else:
+                self.fail(f"unknown option {name}")
+
+            if self.peek() != ",":
+                return valid, symmetric, missing
+
+            self.take()
+
+    def missing_value(self) -> Optional[bool]:
+
+        token = self.take()
+
+        if token not in MISSING_VALUES:
+            self.fail(f"missing= expects false, true or na, got {token}")
+
+        return MISSING_VALUES[token]
+
+    def expr(self, allow_range: bool = False):
+
+        node = self.term(allow_range)
+
+        if isinstance(node, Range):
+            return node
+
+        while self.peek() in ("+", "-"):
+            op = self.take()
+            node = BinOp(op, node, self.term())
+
+        return node
+
+    def term(self, allow_range: bool = False):
+
+        node = self.factor(allow_range)
+
+        if isinstance(node, Range):
+            return node
+
+        while self.peek() in ("*", "/"):
+            op = self.take()
+            node = BinOp(op, node, self.factor())
+
+        return node
+
+    def factor(self, allow_range: bool = False):
+
+        token = self.peek()
+
+        if token is None:
+            self.fail("unexpected end of expression")
+
+        if token == "-":
+            self.take()
+            return BinOp("-", Number(0.0), self.factor())
+
+        if token == "(":
+            self.take()
+            node = self.expr()
+            self.take(")")
+            return node
+
+        if _is_number(token):
+            return Number(float(self.take()))
+
+        if token == "Open16":
+            self.take()
+            return Open16()
+
+        if token in ("max", "min"):
+            return self.extremum()
+
+        if token in FIELDS:
+            return self.field(allow_range)
+
+        self.fail(f"unexpected {token}")
+
+    def extremum(self) -> Extremum:
+
+        mode = self.take()
+        self.take("(")
+
+        args = [self.expr(allow_range=True)]
+
+        while self.peek() == ",":
+            self.take()
+            args.append(self.expr(allow_range=True))
+
+        self.take(")")
+        return Extremum(mode, tuple(args))
+
+    def field(self, allow_range: bool):
+
+        name = self.take()
+        self.take("[")
+
+        if (self.peek() or "").startswith("bar"):
+            n = self.bar_number()
+            node = Nth(name, self.day(), n - 1)
+
+        elif name == "Hour":
+            self.fail("Hour is only defined for bar n")
+
+        else:
+            start = self.hour()
+            stop = None
+
+            if self.peek() == "..":
+
+                if not allow_range:
+                    self.fail(f"hour range of {name} outside max() / min()")
+
+                self.take()
+                stop = self.hour()
+
+                if stop < start:
+                    self.fail(f"empty hour range {start}..{stop}")
+
+            day = self.day()
+            node = Bar(name, day, start) if stop is None else Range(name, day, range(start, stop + 1))
+
+        self.take("]")
+        return node
+
+    def bar_number(self) -> int:
+
+        """« bar1 » ou « bar 1 »."""
+
+        token = self.take()
+        digits = token[3:] or self.take()
+
+        if not digits.isdigit() or int(digits) < 1:
+            self.fail(f"invalid bar number {digits} (bars are numbered from 1)")
+
+        return int(digits)
+
+    def day(self) -> int:
+
+        if self.peek() != ",":
+            return DAY
+
+        self.take()
+        self.take("D")
+
+        if self.peek() == "-":
+            self.take()
+
+            if self.integer() != 1:
+                self.fail("only D and D-1 are available")
+
+            return DAY_MINUS_1
+
+        return DAY
+
+    def hour(self) -> int:
+
+        token = self.take()
+        h = int(token[:-1]) if token.endswith("h") and token[:-1].isdigit() else None
+
+        if h is None and token.isdigit():
+            h = int(token)
+
+        if h is None or not 0 <= h <= 23:
+            self.fail(f"invalid hour {token}")
+
+        return h
+
+    def integer(self) -> int:
+
+        token = self.take()
+
+        if not token.isdigit():
+            self.fail(f"expected an integer, got {token}")
+
+        return int(token)
+
+    # endregion
+
+def _is_number(token: str) -> bool:
+    return token[0].isdigit() and not token.endswith("h")
+
+def _tokenize(text: str) -> List[str]:
+
+    tokens, pos = [], 0
+    text = text.rstrip()
+
+    while pos < len(text):
+
+        match = _TOKEN.match(text, pos)
+
+        if match is None:
+            raise ExpressionError(f"unexpected character {text[pos:].lstrip()[:1]!r} in {text!r}")
+
+        tokens.append(match.group(match.lastindex))
+        pos = match.end()
+
+    return tokens
+
+# endregion
+
+# region : API Functions
+
+def parse_condition(text: str) -> Condition:
+
+    """
+    Analyse une condition (voir la grammaire en tête de module).
+    Lève ExpressionError si l'expression est invalide.
+    """
+
+    return _Parser(text).condition()
+
+# endregion
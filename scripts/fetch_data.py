@@ -1,105 +1,108 @@
 from __future__ import annotations
 
+import time
 import pytz
 import random
 import asyncio
+import numpy as np
 import pandas as pd
 import datetime as dt
 
-from ib_insync import IB, Stock, util
-from config import EASTERN_TZ, logger
-from typing import Dict, List, Optional, Tuple
+import bar_cache
+import contract_cache
+
+from pandas.tseries.offsets import BDay
+from ib_insync import IB, Stock
+from config import EASTERN_TZ, BAR_CACHE_ENABLED, CONTRACT_CACHE_ENABLED, QUALIFY_BATCH_SIZE, PACING_WINDOWS, logger
+from ib_connect import IBPool
+from bar_store import BarStore
+from metrics import registry
+from data_source import DataSource, ReplaySource, bars_to_df, decode_bars
+from pacing import PacingController, get_pacer, is_pacing_error
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
 
 # region : Variables
 
 __all__ = ["fetch_all_data",
-           "MAX_CONCURRENCY",
-           "REQUEST_DELAY_SEC",
+           "fetch_store",
+           "stream_all_data",
+           "history_duration_days",
            "MAX_RETRIES",
            "BACKOFF_BASE"]
 
-FAST = {
-    "MAX_RETRIES": 1,
-    "MAX_CONCURRENCY": 96,
-    "BACKOFF_BASE": 0.12,
-    "REQUEST_DELAY_SEC": 0.0,
-}
-
-SLOW = {
-    "MAX_RETRIES": 2,
-    "MAX_CONCURRENCY": 3,
-    "BACKOFF_BASE": 2.0,
-    "REQUEST_DELAY_SEC": 0.6,
-}
+MAX_RETRIES: int = 2
+BACKOFF_BASE: float = 2.0
 
-MAX_RETRIES: int = FAST["MAX_RETRIES"]
-MAX_CONCURRENCY: int = FAST["MAX_CONCURRENCY"]
+RETRYABLE_ERROR_CODES = {162, 321, 354, 420}
 
-BACKOFF_BASE: float = FAST["BACKOFF_BASE"]
-REQUEST_DELAY_SEC: float = FAST["REQUEST_DELAY_SEC"]
+# « No security definition has been found » : seul refus définitif d'un contrat, mis en cache négatif
+NO_SECURITY_DEFINITION = 200
 
-PACING_ERROR_CODES = {354, 420}
-RETRYABLE_ERROR_CODES = {162, 321, 354, 420}
+# Cache contrats pour éviter re-qualifications (None = ticker inconnu d'IB)
+_CONTRACT_CACHE: Dict[str, Optional[Stock]] = {}
 
-# Cache contrats pour éviter re-qualifications
-_CONTRACT_CACHE: Dict[str, Stock] = {}
+# Réponse d'un ticker : DataFrame (cache disque, backends hors ligne, échec) ou barres IB décodées (ts, values)
+Reply = Union[pd.DataFrame, Tuple[np.ndarray, np.ndarray]]
 
 # endregion
 
 # region : Helper Finctions
 
-def _today_eastern_date() -> dt.date:
-    return dt.datetime.now(EASTERN_TZ).date()
+def _compute_end_datetime_str(screening_date: dt.date) -> str:
 
-def _age_in_days(screening_date: dt.date) -> int:
-    return abs((_today_eastern_date() - screening_date).days)
+    """
+    Fenêtre IB: fin = lendemain 11:00 US/Eastern → UTC.
+    Format IB: 'YYYYMMDD HH:MM:SS' (UTC), pas de suffixe.
+    """
 
+    next_day_11 = dt.datetime.combine(screening_date + dt.timedelta(days=1), dt.time(11, 0))
+    utc_end = EASTERN_TZ.localize(next_day_11).astimezone(pytz.utc)
+    return utc_end.strftime("%Y%m%d %H:%M:%S")
 
-def _pick_profile(screening_date: dt.date):
 
-    """
-    ≤ 6 jours  -> FAST (ultra-rapide, tel quel)
-    > 6 jours  -> SLOW (backoff exponentiel + petit délai)
-    """
+def _needed_duration_days(_: dt.date) -> int:
+    return 3
 
-    age = _age_in_days(screening_date)
+def _decode_reply(bars) -> Reply:
 
-    if age <= 6:
-        prof, label = FAST, "FAST"
+    """Réponse IB -> (ts, values) de decode_bars ; un DataFrame (backend hors ligne) ou une réponse vide -> DataFrame."""
 
-    else:
-        prof, label = SLOW, "SLOW"
+    if isinstance(bars, pd.DataFrame) or not bars:
+        return bars_to_df(bars)
 
-    global MAX_RETRIES, MAX_CONCURRENCY, BACKOFF_BASE, REQUEST_DELAY_SEC
+    return decode_bars(bars)
 
-    MAX_RETRIES = prof["MAX_RETRIES"]
-    MAX_CONCURRENCY = prof["MAX_CONCURRENCY"]
+def _is_empty(reply: Reply) -> bool:
+    return len(reply[0]) == 0 if isinstance(reply, tuple) else reply.empty
 
-    BACKOFF_BASE = prof["BACKOFF_BASE"]
-    REQUEST_DELAY_SEC = prof["REQUEST_DELAY_SEC"]
+def _cache_window(screening_date: dt.date, duration_days: Optional[int] = None) -> Tuple[dt.datetime, dt.datetime]:
 
-    logger.info(f"[FETCH_PROFILE] {label} — age={age}d "
-                f"(MAX_CONCURRENCY={MAX_CONCURRENCY}, "
-                f"RETRIES={MAX_RETRIES}, "
-                f"DELAY={REQUEST_DELAY_SEC}s, "
-                f"BACKOFF_BASE={BACKOFF_BASE})")
-    
-    return prof, label
+    """
+    Fenêtre [début, fin) couverte par une requête complète, en US/Eastern
+    (fin = lendemain 11:00, début = fin - N jours ouvrés).
+    """
 
-def _compute_end_datetime_str(screening_date: dt.date) -> str:
+    end = EASTERN_TZ.localize(dt.datetime.combine(screening_date + dt.timedelta(days=1), dt.time(11, 0)))
+    start = end - BDay(duration_days or _needed_duration_days(screening_date))
+
+    return start.to_pydatetime(), end
+
+def _top_up_request(gap_start: dt.datetime, end: dt.datetime, end_time_str: str) -> Tuple[str, str]:
 
     """
-    Fenêtre IB: fin = lendemain 11:00 US/Eastern → UTC.
-    Format IB: 'YYYYMMDD HH:MM:SS' (UTC), pas de suffixe.
+    (endDateTime, durationStr) pour ne demander que [gap_start, end) à IB.
+    Si la fin est dans le futur, on laisse IB borner à maintenant (endDateTime vide).
     """
 
-    next_day_11 = dt.datetime.combine(screening_date + dt.timedelta(days=1), dt.time(11, 0))
-    utc_end = EASTERN_TZ.localize(next_day_11).astimezone(pytz.utc)
-    return utc_end.strftime("%Y%m%d %H:%M:%S")
+    now = dt.datetime.now(EASTERN_TZ)
+    end_str = end_time_str if end <= now else ""
 
+    seconds = int((min(end, now) - gap_start).total_seconds()) + 3600
 
-def _needed_duration_days(_: dt.date) -> int:
-    return 3
+    if seconds <= 86400:
+        return end_str, f"{seconds} S"
+
+    return end_str, f"{-(-seconds // 86400)} D"
 
 def _parse_ib_error_code(e: Exception) -> Optional[int]:
 
@@ -116,64 +119,104 @@ def _parse_ib_error_code(e: Exception) -> Optional[int]:
     return None
 
 
-def _bars_to_df(bars) -> pd.DataFrame:
+def _known_contracts(tickers: List[str], persist: bool = True) -> Dict[str, Optional[Stock]]:
 
-    if not bars:
-        return pd.DataFrame()
-    
-    df = util.df(bars)
+    """
+    Contrats déjà résolus : cache mémoire du process, puis cache disque (positifs et négatifs).
+    persist=False (backend hors ligne) : aucun cache, tout est requalifié auprès du backend.
+    """
 
-    if df.empty:
-        return pd.DataFrame()
-    
-    df["date"] = pd.to_datetime(df["date"])
-    df.set_index("date", inplace=True)
+    if not persist:
+        return {}
 
-    idx = df.index
+    known = {t: _CONTRACT_CACHE[t] for t in tickers if t in _CONTRACT_CACHE}
+    missing = [t for t in tickers if t not in known]
 
-    if idx.tz is None:
-        df.index = idx.tz_localize("UTC").tz_convert(EASTERN_TZ)
+    if missing and CONTRACT_CACHE_ENABLED:
 
-    else:
-        df.index = idx.tz_convert(EASTERN_TZ)
+        on_disk = contract_cache.load_contracts(missing)
+
+        _CONTRACT_CACHE.update(on_disk)
+        known.update(on_disk)
+
+    return known
+
+async def _qualify_batch(ib: IB,
+                         tickers: List[str],
+                         pacer: PacingController,
+                         persist: bool = True) -> Dict[str, Optional[Stock]]:
 
-    return df.rename(columns={"open": "Open", "high": "High", "low": "Low", "close": "Close"})
+    """
+    Qualifie un lot de tickers en un seul appel qualifyContractsAsync (un seul créneau de pacing).
+    Un ticker non qualifié n'est mis en cache négatif (None) que si IB a répondu l'erreur 200 pour sa requête ;
+    un échec transitoire (timeout, déconnexion, erreur de l'appel) n'est pas mis en cache.
+    """
+
+    contracts = [Stock(t, "SMART", "USD") for t in tickers]
+    requested = {id(c) for c in contracts}
+    undefined = set()
+
+    def _on_error(req_id, code, message, contract=None) -> None:
 
-async def _qualify_contract(ib: IB, ticker: str) -> Optional[Stock]:
+        if code == NO_SECURITY_DEFINITION and contract is not None and id(contract) in requested:
+            undefined.add(id(contract))
+
+    ib.errorEvent += _on_error
 
     try:
+        async with pacer.request():
 
-        if ticker in _CONTRACT_CACHE:
-            return _CONTRACT_CACHE[ticker]
-        
-        c = Stock(ticker, "SMART", "USD")
-        await ib.qualifyContractsAsync(c)
+            with registry.timer("qualify"):
+                await ib.qualifyContractsAsync(*contracts)
+
+    except ConnectionError:
+        raise
 
-        _CONTRACT_CACHE[ticker] = c
-        return c
-    
     except Exception as e:
-        logger.error(f"[QUALIFY] {ticker}: {e}")
-        return None
+        logger.error(f"[QUALIFY] {len(tickers)} tickers ({tickers[0]}...): {e}")
+        return {}
+
+    finally:
+        ib.errorEvent -= _on_error
+
+    qualified = dict(zip(tickers, (c if c.conId else None for c in contracts)))
+    unknown = {t for t, c in zip(tickers, contracts) if id(c) in undefined}
+
+    registry.inc("contracts_unknown", len(unknown))
+
+    if len(unknown) < sum(c is None for c in qualified.values()):
+        logger.warning(f"[QUALIFY] {sum(c is None for c in qualified.values()) - len(unknown)} contracts not qualified "
+                       f"without an IB error {NO_SECURITY_DEFINITION}, not cached")
+
+    cacheable = {t: c for t, c in qualified.items() if c is not None or t in unknown}
+
+    if persist:
+        _CONTRACT_CACHE.update(cacheable)
+
+    if persist and CONTRACT_CACHE_ENABLED:
+        contract_cache.store_contracts(cacheable)
+
+    logger.debug(f"[QUALIFY] {sum(c is not None for c in qualified.values())}/{len(tickers)} qualified")
+    return qualified
 
 # endregion
 
 # region : Fetch Functions
 
-async def _fetch_one_fast(ib: IB,
-                          contract: Stock,
-                          end_time_str: str,
-                          *,
-                          screening_date: dt.date,
-                          max_retries: int,
-                          backoff_base: float,
-                          delay_after: float) -> Tuple[str, pd.DataFrame]:
+async def _fetch_one(ib: IB,
+                     contract: Stock,
+                     end_time_str: str,
+                     *,
+                     screening_date: dt.date,
+                     pacer: PacingController,
+                     duration_str: Optional[str] = None,
+                     decoded: bool = False) -> Tuple[str, Reply]:
     
     """
-    FAST (ultra-rapide tel quel) :
-      - 3D, 1h, TRADES, useRTH=False
-      - 1 retry pacing only, backoff court + léger jitter
-      - pas de délai inter-requête
+    Requête historique 1h, TRADES, useRTH=False, cadencée par le PacingController :
+      - erreur de pacing -> le contrôleur réduit la concurrence et impose une pause, puis retry
+      - autre erreur retryable -> backoff exponentiel BACKOFF_BASE ** (attempt-1)
+    decoded : renvoie les barres décodées (ts, values) au lieu d'un DataFrame (fetch_store).
     """
 
     symbol = contract.symbol
@@ -183,178 +226,310 @@ async def _fetch_one_fast(ib: IB,
 
     while True:
 
-        try:
-            bars = await ib.reqHistoricalDataAsync(contract,
-                                                   endDateTime=end_time_str,
-                                                   durationStr=f"{duration_days} D",
-                                                   barSizeSetting="1 hour",
-                                                   whatToShow="TRADES",
-                                                   useRTH=False,
-                                                   formatDate=1)
-            
-            return symbol, _bars_to_df(bars)
+        async with pacer.request():
+
+            t0 = time.perf_counter()
+
+            try:
+                bars = await ib.reqHistoricalDataAsync(contract,
+                                                       endDateTime=end_time_str,
+                                                       durationStr=duration_str or f"{duration_days} D",
+                                                       barSizeSetting="1 hour",
+                                                       whatToShow="TRADES",
+                                                       useRTH=False,
+                                                       formatDate=1)
+
+                latency = time.perf_counter() - t0
+
+                pacer.on_success(latency)
+                registry.observe("historical_request", latency)
 
-        except Exception as e:
+                with registry.timer("bar_decode"):
+                    return symbol, _decode_reply(bars) if decoded else bars_to_df(bars)
 
-            attempt += 1
-            code = _parse_ib_error_code(e)
+            except ConnectionError:
+                raise
 
-            if code == 162:
-                logger.debug(f"[NO_DATA] {symbol}: {e}")
-                return symbol, pd.DataFrame()
+            except Exception as e:
+                error = e
 
-            if code in PACING_ERROR_CODES and attempt <= max_retries:
+        if not ib.isConnected():
+            raise ConnectionError(f"{symbol}: connexion IB perdue ({error})")
 
-                wait = backoff_base + random.uniform(0, backoff_base)
-                logger.warning(f"[PACING RETRY {attempt}/{max_retries}] {symbol} — sleep {wait:.2f}s (code {code})")
+        attempt += 1
+        code = _parse_ib_error_code(error)
 
-                await asyncio.sleep(wait)
-                continue
+        registry.inc("ib_errors", code=code if code is not None else "unknown")
 
-            logger.error(f"[FETCH_FAIL] {symbol}: {e}")
+        if is_pacing_error(code, str(error)) and attempt <= MAX_RETRIES:
+
+            wait = pacer.on_pacing_error(code)
+            logger.warning(f"[PACING RETRY {attempt}/{MAX_RETRIES}] {symbol} — pause {wait:.2f}s (code {code})")
+            registry.inc("fetch_retries", kind="pacing")
+            continue
+
+        if code == 162:
+            logger.debug(f"[NO_DATA] {symbol}: {error}")
             return symbol, pd.DataFrame()
 
-async def _fetch_one_slow(ib: IB,
-                          contract: Stock,
-                          end_time_str: str,
-                          *,
-                          screening_date: dt.date,
-                          delay_after: float,
-                          max_retries: int,
-                          backoff_base: float) -> Tuple[str, pd.DataFrame]:
-    
+        if code in RETRYABLE_ERROR_CODES and attempt <= MAX_RETRIES:
+
+            backoff = BACKOFF_BASE ** (attempt - 1) + random.uniform(0, 0.1)
+            logger.warning(f"[RETRY {attempt}/{MAX_RETRIES}] {symbol} (code={code}): {error} — backoff {backoff:.2f}s")
+
+            registry.inc("fetch_retries", kind="backoff")
+            await asyncio.sleep(backoff)
+            continue
+
+        logger.error(f"[FETCH_FAIL] {symbol}: {error}")
+        registry.inc("fetch_failures")
+        return symbol, pd.DataFrame()
+
+async def _fetch_one_cached(ib: IB,
+                            contract: Stock,
+                            end_time_str: str,
+                            *,
+                            screening_date: dt.date,
+                            duration_days: Optional[int] = None,
+                            use_cache: bool = True,
+                            decoded: bool = False,
+                            **kwargs) -> Tuple[str, Reply]:
+
     """
-    SLOW (ta logique) :
-      - 3D, 1h, TRADES, useRTH=False
-      - backoff exponentiel BACKOFF_BASE ** (attempt-1)
-      - petit délai inter-requête après succès
+    Enveloppe _fetch_one avec le cache disque :
+      - fenêtre entièrement en cache -> aucune requête IB
+      - sinon, seule la partie manquante (souvent les dernières heures) est demandée
+      - les heures terminées sont ajoutées au cache, la barre en formation non
+    decoded : une réponse IB complète (pas de cache, cache manquant) reste décodée (ts, values) ;
+    les lectures et compléments du cache restent des DataFrames.
     """
 
-    symbol = contract.symbol
-    attempt = 0
-
-    backoff = 0.0
-    duration_days = _needed_duration_days(screening_date)
+    full_duration = f"{duration_days} D" if duration_days else None
 
-    while True:
+    if not (BAR_CACHE_ENABLED and use_cache):
+        return await _fetch_one(ib, contract, end_time_str, screening_date=screening_date, duration_str=full_duration, decoded=decoded, **kwargs)
 
-        if backoff > 0:
-            await asyncio.sleep(backoff)
+    symbol = contract.symbol
+    start, end = _cache_window(screening_date, duration_days)
+    gap = bar_cache.missing_range(symbol, start, end)
 
-        try:
-            bars = await ib.reqHistoricalDataAsync(contract,
-                                                   endDateTime=end_time_str,
-                                                   durationStr=f"{duration_days} D",
-                                                   barSizeSetting="1 hour",
-                                                   whatToShow="TRADES",
-                                                   useRTH=False,
-                                                   formatDate=1)
-            
-            df = _bars_to_df(bars)
+    if gap is None:
+        logger.debug(f"[CACHE_HIT] {symbol}")
+        registry.inc("bar_cache", result="hit")
+        return symbol, bar_cache.load_bars(symbol, start, end)
 
-            if delay_after > 0:
-                await asyncio.sleep(delay_after)
+    gap_start, gap_end = gap
+    partial = gap_start > start
 
-            return symbol, df
+    registry.inc("bar_cache", result="top_up" if partial else "miss")
 
-        except Exception as e:
+    if partial:
+        req_end, duration_str = _top_up_request(gap_start, end, end_time_str)
+        logger.debug(f"[CACHE_TOP_UP] {symbol}: {gap_start:%Y-%m-%d %H:%M} -> {gap_end:%Y-%m-%d %H:%M} ({duration_str})")
+        symbol, df = await _fetch_one(ib, contract, req_end, screening_date=screening_date, duration_str=duration_str, **kwargs)
 
-            attempt += 1
-            err_code = _parse_ib_error_code(e)
+    else:
+        symbol, df = await _fetch_one(ib, contract, end_time_str, screening_date=screening_date, duration_str=full_duration, decoded=decoded, **kwargs)
 
-            if err_code in RETRYABLE_ERROR_CODES and attempt <= max_retries:
+    if _is_empty(df):
+        return symbol, bar_cache.load_bars(symbol, start, end) if partial else df
 
-                backoff = backoff_base ** (attempt - 1)
+    bar_cache.store_bars(symbol, df, gap_start, gap_end)
 
-                logger.warning(f"[RETRY {attempt}/{max_retries}] {symbol} (code={err_code}): {e} — backoff {backoff:.2f}s")
-                continue
+    # Fenêtre entièrement demandée : la réponse IB est déjà complète, rien à fusionner
+    if isinstance(df, tuple):
+        return symbol, df
 
-            logger.error(f"[FETCH_FAIL] {symbol}: {e}")
-            return symbol, pd.DataFrame()
+    return symbol, bar_cache.merge_bars(bar_cache.load_bars(symbol, start, end), df)
 
 # endregion
 
 # region : API Functions
 
-async def fetch_all_data(ib: IB, tickers: List[str], screening_date: dt.date) -> Dict[str, pd.DataFrame]:
+def history_duration_days(start_date: dt.date, end_date: dt.date, lookback_days: int = 7) -> int:
+
+    """
+    Nombre de jours ouvrés à demander pour couvrir [start_date - lookback_days ; end_date] d'un seul tenant
+    (le lookback couvre DAY-1 et l'Open 16h DAY-1 du premier jour).
+    """
+
+    return len(pd.bdate_range(start_date - dt.timedelta(days=lookback_days), end_date + dt.timedelta(days=1)))
+
+async def stream_all_data(ib: IB | IBPool | DataSource,
+                          tickers: List[str],
+                          screening_date: dt.date,
+                          duration_days: Optional[int] = None,
+                          decoded: bool = False) -> AsyncIterator[Tuple[str, Reply]]:
 
     """
-    Bascule auto :
-      - ≤ 6 jours  -> FAST (ultra-rapide tel quel)
-      - > 6 jours  -> SLOW (ta logique lente : concurrence faible + backoff expo)
+    Télécharge les barres 1h de chaque ticker, cadencées par le PacingController partagé
+    (fenêtres de pacing IB + concurrence adaptative, état conservé entre les runs),
+    et produit (ticker, df) dans l'ordre d'arrivée, un ticker à la fois.
+    ib : connexion unique ou IBPool ; avec un pool, les tickers sont répartis en tourniquet sur les voies
+    (un PacingController par clientId) et une voie déconnectée est reconnectée ou remplacée.
+    Un DataSource (ReplaySource, RecordingSource) remplace IB : les caches disque sont alors ignorés.
+    duration_days : historique plus long que la fenêtre par défaut (mode backtest), une requête par ticker.
+    decoded : les réponses IB fraîches sont produites décodées (ts, values) plutôt qu'en DataFrame (fetch_store).
+    Fermer le générateur (aclosing, annulation) annule les requêtes encore en cours.
     """
 
     if not tickers:
         logger.warning("[FETCH] Aucun ticker fourni.")
-        return {}
+        return
+
+    pool = ib if isinstance(ib, IBPool) else IBPool.wrap(ib)
+    persist = not isinstance(pool.primary, DataSource)
+
+    # Un rejeu (latence et erreurs simulées) ne doit pas modifier l'état de pacing appris sur IB
+    if isinstance(pool.primary, ReplaySource):
+        windows = PACING_WINDOWS if pool.primary.paced else []
+        pacers = [PacingController(windows, state_file=None) for _ in range(len(pool))]
+
+    else:
+        pacers = [get_pacer(pool.client_id(lane)) for lane in range(len(pool))]
 
-    prof, label = _pick_profile(screening_date)
     end_time_str = _compute_end_datetime_str(screening_date)
-    logger.info(f"[FETCH] endDateTime={end_time_str} | tickers={len(tickers)}")
+    logger.info(f"[FETCH] endDateTime={end_time_str} | tickers={len(tickers)} | "
+                f"lanes={pool.connected_count()}/{len(pool)} | concurrency={sum(p.concurrency for p in pacers):.0f}")
 
-    results: Dict[str, pd.DataFrame] = {}
+    # Chaque job dépose (ticker, df) dès réception ; None marque la fin de tous les jobs
+    queue: asyncio.Queue = asyncio.Queue()
 
-    if label == "FAST":
+    def _store(ticker: str, df: Reply) -> None:
+        queue.put_nowait((ticker, df))
 
-        sem = asyncio.Semaphore(min(prof["MAX_CONCURRENCY"], max(1, len(tickers))))
+    async def _on_lane(index: int, label: str, call):
 
-        async def _qualify_and_fetch(ticker: str):
+        """Exécute call(client, pacer) sur une voie du pool, en changeant de voie si la connexion tombe."""
 
-            async with sem:
-                c = await _qualify_contract(ib, ticker)
+        for attempt in range(MAX_RETRIES + 1):
 
-            if c is None:
-                results[ticker] = pd.DataFrame()
-                return
+            picked = await pool.lane(index + attempt)
 
-            async with sem:
-                sym, df = await _fetch_one_fast(ib, c, end_time_str,
-                                                screening_date=screening_date,
-                                                max_retries=prof["MAX_RETRIES"],
-                                                backoff_base=prof["BACKOFF_BASE"],
-                                                delay_after=prof["REQUEST_DELAY_SEC"])
-                
-            results[sym] = df
+            if picked is None:
+                logger.error(f"[FETCH_FAIL] {label}: aucune connexion IB disponible")
+                registry.inc("fetch_failures")
+                return None
 
-        await asyncio.gather(*[_qualify_and_fetch(t) for t in tickers], return_exceptions=False)
+            lane, client = picked
 
-    else:
-       
-        async def _qualify_one(t: str) -> tuple[str, Optional[Stock]]:
+            try:
+                return await call(client, pacers[lane])
 
-            c = await _qualify_contract(ib, t)
-            return t, c
+            except ConnectionError as e:
+                logger.warning(f"[LANE_DROP] clientId={pool.client_id(lane)} {label}: {e}")
+                registry.inc("lane_drops", client_id=pool.client_id(lane))
+
+        return None
 
-        pairs = await asyncio.gather(*[_qualify_one(t) for t in tickers])
-        qualified: Dict[str, Optional[Stock]] = {t: c for t, c in pairs}
+    async def _fetch(index: int, ticker: str, contract: Optional[Stock]):
 
-        for t, c in pairs:
-            if c is None:
-                logger.warning(f"[SKIP] {t}: contrat non qualifié")
+        if contract is None:
+            logger.warning(f"[SKIP] {ticker}: contrat non qualifié")
+            registry.inc("tickers_skipped", reason="unqualified")
+            _store(ticker, pd.DataFrame())
+            return
 
-        sem = asyncio.Semaphore(prof["MAX_CONCURRENCY"])
+        fetched = await _on_lane(index, ticker,
+                                 lambda client, pacer: _fetch_one_cached(client, contract, end_time_str,
+                                                                         screening_date=screening_date,
+                                                                         duration_days=duration_days,
+                                                                         use_cache=persist,
+                                                                         decoded=decoded,
+                                                                         pacer=pacer))
 
-        async def _worker(ticker: str, contract: Optional[Stock]) -> None:
+        _store(*(fetched or (ticker, pd.DataFrame())))
 
-            if contract is None:
-                results[ticker] = pd.DataFrame()
-                return
+    async def _qualify_and_fetch(index: int, batch: List[str]):
+
+        qualified = await _on_lane(index, f"{len(batch)} contracts",
+                                   lambda client, pacer: _qualify_batch(client, batch, pacer, persist)) or {}
+
+        await asyncio.gather(*[_fetch(index + k, t, qualified.get(t)) for k, t in enumerate(batch)])
+
+    known = _known_contracts(tickers, persist)
+    misses = [t for t in tickers if t not in known]
+
+    if misses:
+        logger.info(f"[QUALIFY] {len(tickers) - len(misses)} contracts cached, {len(misses)} to qualify")
+
+    jobs = [_fetch(i, t, known[t]) for i, t in enumerate(tickers) if t in known]
+    jobs += [_qualify_and_fetch(i, misses[i:i + QUALIFY_BATCH_SIZE]) for i in range(0, len(misses), QUALIFY_BATCH_SIZE)]
+
+    async def _run_jobs():
+
+        try:
+            await asyncio.gather(*jobs)
+
+        finally:
+            queue.put_nowait(None)
+
+    for client, pacer in zip(pool.clients, pacers):
+        client.errorEvent += pacer.on_ib_error
+
+    runner = asyncio.ensure_future(_run_jobs())
+    ok = ko = 0
+
+    try:
+
+        while (item := await queue.get()) is not None:
+
+            if _is_empty(item[1]):
+                ko += 1
+
+            else:
+                ok += 1
+
+            yield item
+
+        await runner
+
+    finally:
+
+        if not runner.done():
+            runner.cancel()
+            await asyncio.gather(runner, return_exceptions=True)
+
+        for client, pacer in zip(pool.clients, pacers):
+            client.errorEvent -= pacer.on_ib_error
+            pacer.save()
+
+        logger.info(f"[FETCH_DONE] {ok} OK / {ko} KO / total {ok + ko}")
+
+async def fetch_all_data(ib: IB | IBPool | DataSource,
+                         tickers: List[str],
+                         screening_date: dt.date,
+                         duration_days: Optional[int] = None) -> Dict[str, pd.DataFrame]:
+
+    """
+    Variante « tout en mémoire » de stream_all_data : {ticker: df} une fois tous les tickers reçus
+    (backtest, benchmark). Le screening consomme stream_all_data directement.
+    """
+
+    return {ticker: df async for ticker, df in stream_all_data(ib, tickers, screening_date, duration_days)}
+
+async def fetch_store(ib: IB | IBPool | DataSource,
+                      tickers: List[str],
+                      screening_date: dt.date,
+                      duration_days: Optional[int] = None,
+                      on_received: Optional[Callable[[str], None]] = None) -> BarStore:
+
+    """
+    Variante compacte de fetch_all_data : chaque réponse IB est décodée directement en tableaux (BarStore.from_bars),
+    sans DataFrame intermédiaire (seuls le cache disque et les backends hors ligne en produisent),
+    et le tout est assemblé en un BarStore dans l'ordre de `tickers`.
+    on_received : appelé avec chaque ticker reçu (progression).
+    """
 
-            async with sem:
-                sym, df = await _fetch_one_slow(ib, contract, end_time_str,
-                                                screening_date=screening_date,
-                                                delay_after=prof["REQUEST_DELAY_SEC"],
-                                                max_retries=prof["MAX_RETRIES"],
-                                                backoff_base=prof["BACKOFF_BASE"])
-                
-                results[sym] = df
+    parts: Dict[str, BarStore] = {}
 
-        await asyncio.gather(*[_worker(t, c) for t, c in qualified.items()], return_exceptions=False)
+    async for ticker, reply in stream_all_data(ib, tickers, screening_date, duration_days, decoded=True):
+        parts[ticker] = BarStore.from_bars(ticker, reply)
+        del reply
 
-    ok = sum(1 for df in results.values() if not df.empty)
-    ko = len(results) - ok
+        if on_received is not None:
+            on_received(ticker)
 
-    logger.info(f"[FETCH_DONE] {ok} OK / {ko} KO / total {len(results)}")
-    return results
+    return BarStore.concat(parts, tickers)
 
 # endregion
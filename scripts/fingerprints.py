@@ -0,0 +1,328 @@
+import sqlite3
+import hashlib
+import argparse
+import numpy as np
+import datetime as dt
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from config import logger, EASTERN_TZ, FINGERPRINT_CACHE_FILE
+from metrics import registry
+from bar_cache import last_finished_hour
+from bar_store import BarStore, TickerBars, HOUR_NS, DAY_NS
+from conditions import CONDITION_EXPRESSIONS, resolve_condition_ids
+from engine import NA, Universe, build_universe, evaluate_universe, empty_selection
+
+# region : Variables
+
+# Empreinte d'un ticker à une date : 4 bitsets (un bit par condition du vocabulaire) empilés en (4, WORDS) uint64
+PRIMARY_TRUE, PRIMARY_KNOWN, INVERSE_TRUE, INVERSE_KNOWN = range(4)
+
+# Conditions dans l'ordre des bits ; la clé change dès qu'une expression (ou une condition utilisateur) change
+VOCABULARY: Tuple[int, ...] = tuple(sorted(CONDITION_EXPRESSIONS))
+POSITIONS: Dict[int, int] = {cid: i for i, cid in enumerate(VOCABULARY)}
+WORDS = -(-len(VOCABULARY) // 64)
+VOCABULARY_KEY = hashlib.sha1("\n".join(f"{cid}\t{CONDITION_EXPRESSIONS[cid]}" for cid in VOCABULARY).encode()).hexdigest()[:16]
+
+# Heure de fin de la dernière barre lue par les conditions (19h) : la séance est figée ensuite
+FINAL_HOUR = 20
+
+# Jours parcourus avant la date pour trouver DAY-1 et l'Open 16h (TickerBars.previous_sessions)
+LOOKBACK_DAYS = 7
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    vocabulary TEXT NOT NULL,
+    date       TEXT NOT NULL,
+    ticker     TEXT NOT NULL,
+    open16     REAL,
+    bits       BLOB,
+    PRIMARY KEY (vocabulary, date, ticker)
+) WITHOUT ROWID;
+"""
+
+_conn: Optional[sqlite3.Connection] = None
+
+# endregion
+
+# region : Helper Functions
+
+def _get_connection() -> sqlite3.Connection:
+
+    global _conn
+
+    if _conn is None:
+        FINGERPRINT_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+
+        _conn = sqlite3.connect(FINGERPRINT_CACHE_FILE, check_same_thread=False)
+        _conn.executescript(_SCHEMA)
+
+        logger.info(f"[FINGERPRINT] Fingerprint cache opened: {FINGERPRINT_CACHE_FILE}")
+
+    return _conn
+
+def _pack(flags: np.ndarray) -> np.ndarray:
+
+    """(n, conditions du vocabulaire) bool -> (n, WORDS) uint64, bit i = colonne i."""
+
+    padded = np.zeros((flags.shape[0], WORDS * 64), dtype=bool)
+    padded[:, :flags.shape[1]] = flags
+
+    return np.packbits(padded, axis=1, bitorder="little").view("<u8")
+
+def _mask(ids: Iterable[int]) -> np.ndarray:
+
+    flags = np.zeros((1, len(VOCABULARY)), dtype=bool)
+
+    for cid in ids:
+
+        if cid in POSITIONS:
+            flags[0, POSITIONS[cid]] = True
+
+        else:
+            logger.warning(f"No evaluation function defined for condition {cid}.")
+
+    return _pack(flags)[0]
+
+def is_final(day: dt.date, now: Optional[dt.datetime] = None) -> bool:
+
+    """Séance terminée : la barre 19h de `day` est close, son empreinte ne changera plus."""
+
+    return last_finished_hour(now) >= EASTERN_TZ.localize(dt.datetime.combine(day, dt.time(FINAL_HOUR)))
+
+def covers_lookback(bars: Optional[TickerBars], day: dt.date) -> bool:
+
+    """
+    Les barres reçues couvrent toute la fenêtre lue pour `day` (de day - LOOKBACK_DAYS à la barre 19h) :
+    un ticker écarté à cette date l'est alors définitivement, et non faute d'historique téléchargé.
+    """
+
+    if bars is None or not len(bars):
+        return False
+
+    wall = bars.wall
+    epoch_day = (day - dt.date(1970, 1, 1)).days
+
+    return wall[0] < (epoch_day - LOOKBACK_DAYS + 1) * DAY_NS and wall[-1] >= epoch_day * DAY_NS + (FINAL_HOUR - 1) * HOUR_NS
+
+# endregion
+
+# region : Fingerprint Functions
+
+def fingerprint_universe(u: Universe) -> np.ndarray:
+
+    """Évalue tout le vocabulaire sur l'univers et renvoie les empreintes (tickers, 4, WORDS) uint64."""
+
+    primary, inverse = evaluate_universe(u, VOCABULARY)
+
+    return np.stack((_pack(primary == 1), _pack(primary != NA), _pack(inverse == 1), _pack(inverse != NA)), axis=1)
+
+def match_fingerprints(bits: np.ndarray,
+                       selected_ids: Iterable[int],
+                       inverse_ids: Iterable[int],
+                       checked: Optional[bool] = None) -> np.ndarray:
+
+    """
+    Verdict par ticker sur des empreintes (tickers, 4, WORDS), même sémantique que engine.screen_universe :
+    aucune case cochée False, au moins une évaluée (N/A ignorées) ; sans condition, voir engine.empty_selection.
+    """
+
+    selected_ids, inverse_ids = list(selected_ids), list(inverse_ids)
+
+    if not selected_ids and not inverse_ids:
+        return empty_selection(len(bits), bool(checked))
+
+    ms, mi = _mask(selected_ids), _mask(inverse_ids)
+    pt, pk, it, ik = (bits[:, row] for row in (PRIMARY_TRUE, PRIMARY_KNOWN, INVERSE_TRUE, INVERSE_KNOWN))
+
+    failed = ((pk & ~pt & ms) | (ik & ~it & mi)).any(axis=1)
+    evaluated = ((pk & ms) | (ik & mi)).any(axis=1)
+
+    return evaluated & ~failed
+
+def unpack_fingerprints(bits: np.ndarray, ids: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+
+    """(primary, inverse) int8 TRUE / FALSE / NA (tickers × ids) relus dans les empreintes, comme evaluate_universe."""
+
+    pos = np.array([POSITIONS[cid] for cid in ids], dtype=np.int64)
+
+    words = bits[:, :, pos // 64]
+    flags = (words >> (pos % 64).astype(np.uint64)) & np.uint64(1)
+
+    primary = np.where(flags[:, PRIMARY_KNOWN] == 1, flags[:, PRIMARY_TRUE], NA).astype(np.int8)
+    inverse = np.where(flags[:, INVERSE_KNOWN] == 1, flags[:, INVERSE_TRUE], NA).astype(np.int8)
+
+    return primary, inverse
+
+class FingerprintDay:
+
+    """
+    Empreintes d'une date pour les tickers retenus (dans l'ordre de la demande) :
+    expose tickers et open16 comme un Universe, pour RunRecorder.add_universe.
+    """
+
+    __slots__ = ("day", "tickers", "open16", "bits")
+
+    def __init__(self, day: dt.date, tickers: List[str], open16: np.ndarray, bits: np.ndarray):
+
+        self.day = day
+        self.tickers = tickers
+        self.open16 = open16
+        self.bits = bits
+
+    def __len__(self) -> int:
+        return len(self.tickers)
+
+    def match(self, selected_ids: Iterable[int], inverse_ids: Iterable[int], checked: Optional[bool] = None) -> np.ndarray:
+        return match_fingerprints(self.bits, selected_ids, inverse_ids, checked)
+
+    def outcomes(self, ids: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+        return unpack_fingerprints(self.bits, ids)
+
+# endregion
+
+# region : Cache Functions
+
+def load_fingerprints(day: dt.date, tickers: Iterable[str]) -> Tuple[Dict[str, Tuple[float, np.ndarray]], Set[str]]:
+
+    """
+    Empreintes en cache d'une date : ({ticker: (open16, bits (4, WORDS))}, tickers écartés ce jour-là).
+    Les tickers absents des deux n'ont pas encore d'empreinte.
+    """
+
+    wanted = set(tickers)
+    found, skipped = {}, set()
+
+    rows = _get_connection().execute("SELECT ticker, open16, bits FROM fingerprints WHERE vocabulary=? AND date=?",
+                                     (VOCABULARY_KEY, day.isoformat()))
+
+    for ticker, open16, bits in rows:
+
+        if ticker not in wanted:
+            continue
+
+        if bits is None:
+            skipped.add(ticker)
+
+        else:
+            found[ticker] = (open16, np.frombuffer(bits, dtype="<u8").reshape(4, WORDS))
+
+    return found, skipped
+
+def store_fingerprints(day: dt.date, fp: FingerprintDay, skipped: Iterable[str] = ()) -> None:
+
+    """Enregistre les empreintes d'une date terminée, et les tickers écartés (empreinte vide)."""
+
+    rows = [(VOCABULARY_KEY, day.isoformat(), t, float(o), b.tobytes()) for t, o, b in zip(fp.tickers, fp.open16, fp.bits)]
+    rows += [(VOCABULARY_KEY, day.isoformat(), t, None, None) for t in skipped]
+
+    try:
+        conn = _get_connection()
+
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?)", rows)
+
+    except sqlite3.Error as e:
+        logger.error(f"[FINGERPRINT] Could not store fingerprints for {day}: {e}")
+
+def covered_tickers(tickers: Iterable[str], dates: Iterable[dt.date]) -> Set[str]:
+
+    """Tickers dont toutes les dates ont une empreinte en cache (inutile de télécharger leurs barres)."""
+
+    dates = {d.isoformat() for d in dates}
+
+    if not dates:
+        return set(tickers)
+
+    counts: Dict[str, int] = {}
+
+    rows = _get_connection().execute("SELECT ticker, date FROM fingerprints WHERE vocabulary=? AND date >= ? AND date <= ?",
+                                     (VOCABULARY_KEY, min(dates), max(dates)))
+
+    for ticker, date in rows:
+
+        if date in dates:
+            counts[ticker] = counts.get(ticker, 0) + 1
+
+    return {t for t in tickers if counts.get(t, 0) == len(dates)}
+
+def fingerprint_day(store: BarStore, tickers: List[str], day: dt.date, cached: bool = True) -> FingerprintDay:
+
+    """
+    Empreintes des tickers à une date : relues dans le cache, calculées depuis `store` pour les autres
+    (tout le vocabulaire en un passage du moteur vectorisé) puis enregistrées si la séance est terminée.
+    Un ticker écarté n'est mémorisé comme tel que si ses barres couvrent toute la fenêtre de la date (covers_lookback).
+    """
+
+    final = cached and is_final(day)
+    found, skipped = load_fingerprints(day, tickers) if final else ({}, set())
+
+    todo = [t for t in tickers if t not in found and t not in skipped]
+
+    if todo:
+
+        with registry.timer("fingerprint_compute"):
+            u = build_universe(store, todo, day)
+            computed = FingerprintDay(day, u.tickers, u.open16, fingerprint_universe(u))
+
+        registry.inc("fingerprints_computed", len(u))
+
+        if final:
+            kept = set(u.tickers)
+            store_fingerprints(day, computed, [t for t in todo if t not in kept and covers_lookback(store.get(t), day)])
+
+        found.update((t, (o, b)) for t, o, b in zip(computed.tickers, computed.open16, computed.bits))
+
+    registry.inc("fingerprints_cached", len(tickers) - len(todo))
+
+    kept = [t for t in tickers if t in found]
+    bits = np.stack([found[t][1] for t in kept]) if kept else np.zeros((0, 4, WORDS), dtype="<u8")
+
+    return FingerprintDay(day, kept, np.array([found[t][0] for t in kept], dtype=float), bits)
+
+def screen_cached(selected_ids: Iterable[int],
+                  inverse_ids: Iterable[int],
+                  start: dt.date,
+                  end: dt.date,
+                  checked: Optional[bool] = None) -> Dict[dt.date, List[str]]:
+
+    """Tickers retenus à chaque date de [start; end] parmi toutes les empreintes en cache, sans barres ni IB."""
+
+    selected_ids, inverse_ids = list(selected_ids), list(inverse_ids)
+    days: Dict[str, Tuple[List[str], List[bytes]]] = {}
+
+    rows = _get_connection().execute("SELECT date, ticker, bits FROM fingerprints "
+                                     "WHERE vocabulary=? AND date >= ? AND date <= ? AND bits IS NOT NULL ORDER BY date, ticker",
+                                     (VOCABULARY_KEY, start.isoformat(), end.isoformat()))
+
+    for date, ticker, bits in rows:
+        entry = days.setdefault(date, ([], []))
+        entry[0].append(ticker)
+        entry[1].append(bits)
+
+    results = {}
+
+    for date, (tickers, blobs) in days.items():
+        bits = np.frombuffer(b"".join(blobs), dtype="<u8").reshape(len(tickers), 4, WORDS)
+        results[dt.date.fromisoformat(date)] = [t for t, m in zip(tickers, match_fingerprints(bits, selected_ids, inverse_ids, checked)) if m]
+
+    return results
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description="Screening instantané sur les empreintes en cache (sans IB).")
+    parser.add_argument("--start", type=dt.date.fromisoformat, required=True)
+    parser.add_argument("--end", type=dt.date.fromisoformat)
+    parser.add_argument("--conditions", type=int, nargs="*", default=[])
+    parser.add_argument("--inverse", type=int, nargs="*", default=[])
+    args = parser.parse_args()
+
+    selected_ids, inverse_ids = resolve_condition_ids(args.conditions, args.inverse)
+    results = screen_cached(selected_ids, inverse_ids, args.start, args.end or args.start, bool(args.conditions or args.inverse))
+
+    for day, tickers in results.items():
+        print(f"{day}  {len(tickers):4d}  {', '.join(tickers)}")
+
+# endregion
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,38 @@
+import time
+import asyncio
+import threading
 import tkinter as tk
 
-from config import logger
-from app import run_screener
+from typing import Optional
+from metrics import registry
+from config import logger, ASYNC_PUMP_MS
 from tkinter import ttk, filedialog, messagebox
-from data_handler import get_screening_date_now
-from utils import extract_comparator, inverse_comparator
-from conditions import CONDITION_DEFINITIONS as cond_defs
+from utils import get_screening_date_now
+from conditions import CONDITION_DEFINITIONS as cond_defs, CONDITIONS
+from widgets import TickerSelector, ResultsView
+
+# region : Startup
+
+def _import_backend(loop: asyncio.AbstractEventLoop) -> None:
+
+    """
+    Exécuté dans un thread pendant que la fenêtre est déjà utilisable : importe pandas, ib_insync et le moteur.
+    eventkit mémorise la boucle asyncio à l'import, d'où la boucle du thread principal.
+    """
+
+    asyncio.set_event_loop(loop)
+
+    try:
+        import app, screen_cache, ib_connect  # noqa: F401
+
+    except Exception as e:
+        logger.error(f"[STARTUP] Could not load screening modules: {e}")
+
+# endregion
 
 class StockScreenerApp:
 
-    def __init__(self, root, ib):
+    def __init__(self, root, ib=None, started_at: Optional[float] = None):
 
         self.ib = ib
         self.root = root
@@ -19,11 +42,27 @@ class StockScreenerApp:
         self.results = []
 
         self.conditions = {}
-        self.ticker_vars = {}
+
+        self.loop = None
+        self.connect_task = None
+        self.screen_task = None
+        self.backtest_task = None
+        self.screen_cache = None
+
+        self.started_at = time.perf_counter() if started_at is None else started_at
+        self.interactive = False
+
+        t0 = time.perf_counter()
 
         self.create_widgets()
         self.setup_conditions()
 
+        self.widgets_sec = time.perf_counter() - t0
+
+        # Premier affichage d'abord : modules du screening et connexion IB ensuite
+        self.root.bind("<Map>", self._on_map, add="+")
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
     def create_widgets(self):
 
         self.main_frame = ttk.Frame(self.root, padding=5)
@@ -52,28 +91,8 @@ class StockScreenerApp:
         ttk.Button(ticker_btn_frame, text="Select All", command=self.select_all_tickers).pack(side=tk.LEFT, padx=2)
         ttk.Button(ticker_btn_frame, text="Unselect All", command=self.unselect_all_tickers).pack(side=tk.LEFT, padx=2)
 
-        canvas_frame = ttk.Frame(self.ticker_frame)
-        canvas_frame.grid(row=1, column=0, sticky=tk.NSEW)
-        canvas_frame.rowconfigure(0, weight=1)
-        canvas_frame.columnconfigure(0, weight=1)
-
-        ticker_scroll_canvas = tk.Canvas(canvas_frame)
-        ticker_scroll_canvas.grid(row=0, column=0, sticky=tk.NSEW)
-
-        ticker_scrollbar = ttk.Scrollbar(canvas_frame, orient="vertical", command=ticker_scroll_canvas.yview)
-        ticker_scrollbar.grid(row=0, column=1, sticky=tk.NS)
-
-        ticker_scroll_canvas.configure(yscrollcommand=ticker_scrollbar.set)
-
-        self.ticker_inner_frame = ttk.Frame(ticker_scroll_canvas)
-        self.ticker_inner_frame.bind("<Configure>", lambda e: ticker_scroll_canvas.configure(scrollregion=ticker_scroll_canvas.bbox("all")))
-
-        ticker_scroll_canvas.create_window((0, 0), window=self.ticker_inner_frame, anchor="nw")
-
-        def _on_mousewheel(event):
-            ticker_scroll_canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
-
-        ticker_scroll_canvas.bind_all("<MouseWheel>", _on_mousewheel)
+        self.ticker_selector = TickerSelector(self.ticker_frame)
+        self.ticker_selector.grid(row=1, column=0, sticky=tk.NSEW, pady=(5, 0))
 
         # endregion
 
@@ -82,9 +101,8 @@ class StockScreenerApp:
         results_frame = ttk.LabelFrame(self.main_frame, text="Results", padding=5)
         results_frame.grid(row=1, column=0, sticky=tk.NSEW, padx=5, pady=5)
 
-        self.tree = ttk.Treeview(results_frame, columns=("result",), show="headings")
-        self.tree.heading("result", text="Results")
-        self.tree.pack(fill=tk.BOTH, expand=True)
+        self.results_view = ResultsView(results_frame)
+        self.results_view.pack(fill=tk.BOTH, expand=True)
 
         # endregion
 
@@ -99,14 +117,33 @@ class StockScreenerApp:
         self.date_entry.grid(row=0, column=1, sticky=tk.W, padx=5)
         self.date_entry.insert(0, get_screening_date_now().strftime("%Y-%m-%d"))
 
+        ttk.Label(control_frame, text="Backtest End Date (YYYY-MM-DD):").grid(row=1, column=0, sticky=tk.W)
+
+        self.end_date_entry = ttk.Entry(control_frame, width=12)
+        self.end_date_entry.grid(row=1, column=1, sticky=tk.W, padx=5)
+
         ttk.Button(control_frame, text="Upload Ticker List", command=self.upload_file).grid(row=2, column=0, columnspan=2, sticky=tk.W, pady=(5, 0))
 
         btn_frame = ttk.Frame(control_frame)
         btn_frame.grid(row=3, column=0, columnspan=2, pady=10)
 
-        ttk.Button(btn_frame, text="Run Screener", command=lambda: run_screener(self)).pack(side=tk.LEFT, padx=5)
+        self.run_button = ttk.Button(btn_frame, text="Run Screener", command=self.run_screener)
+        self.run_button.pack(side=tk.LEFT, padx=5)
+
+        self.cancel_button = ttk.Button(btn_frame, text="Cancel", command=self.cancel_screener, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
+
+        self.backtest_button = ttk.Button(btn_frame, text="Run Backtest", command=self.run_backtest)
+        self.backtest_button.pack(side=tk.LEFT, padx=5)
+
         ttk.Button(btn_frame, text="Reset", command=self.reset).pack(side=tk.LEFT, padx=5)
 
+        self.progress = ttk.Progressbar(control_frame, orient="horizontal", mode="determinate")
+        self.progress.grid(row=4, column=0, columnspan=2, sticky=tk.EW)
+
+        self.ib_status = ttk.Label(control_frame, text="IB Gateway: loading...")
+        self.ib_status.grid(row=5, column=0, columnspan=2, sticky=tk.W, pady=(5, 0))
+
         # endregion
 
         # region : Indicators
@@ -121,26 +158,194 @@ class StockScreenerApp:
 
         # endregion
 
+    # region : Startup
+
+    def _on_map(self, event):
+
+        if self.interactive:
+            return
+
+        self.interactive = True
+        self.root.after_idle(self._on_interactive)
+
+    def _on_interactive(self):
+
+        """Fenêtre affichée et prête : mesure du time-to-interactive puis chargement du reste en tâche de fond."""
+
+        elapsed = time.perf_counter() - self.started_at
+
+        registry.observe("startup", elapsed, stage="interactive")
+        logger.info(f"[STARTUP] Interactive in {elapsed * 1000:.0f} ms (widgets {self.widgets_sec * 1000:.0f} ms)")
+
+        self.load_backend()
+
+    def load_backend(self):
+
+        """Importe pandas / ib_insync / moteur dans un thread, puis démarre la boucle asyncio et la connexion IB."""
+
+        self.loop = asyncio.get_event_loop_policy().get_event_loop()
+
+        thread = threading.Thread(target=_import_backend, args=(self.loop,), name="backend-import", daemon=True)
+        thread.start()
+
+        self._wait_backend(thread, time.perf_counter())
+
+    def _wait_backend(self, thread: threading.Thread, t0: float):
+
+        if thread.is_alive():
+            self.root.after(ASYNC_PUMP_MS, self._wait_backend, thread, t0)
+            return
+
+        try:
+            from screen_cache import ScreenCache
+
+        except Exception as e:
+            self.set_ib_status(f"unavailable ({e})")
+            return
+
+        logger.info(f"[STARTUP] Screening modules loaded in {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+        self.screen_cache = ScreenCache()
+
+        self.pump_asyncio()
+        self.connect_ib()
+
+    def connect_ib(self):
+
+        """Ouvre le pool IB sur la boucle asyncio pompée par Tk ; l'état s'affiche sous les contrôles."""
+
+        if self.loop is None or (self.connect_task is not None and not self.connect_task.done()):
+            return
+
+        from ib_connect import get_ib_pool_async
+
+        self.set_ib_status("connecting...")
+
+        t0 = time.perf_counter()
+        self.connect_task = self.loop.create_task(get_ib_pool_async())
+        self.connect_task.add_done_callback(lambda task: self._on_ib_connected(task, t0))
+
+    def _on_ib_connected(self, task: asyncio.Task, t0: float):
+
+        pool = None
+
+        if not task.cancelled():
+
+            if task.exception() is not None:
+                logger.error(f"[STARTUP] IB connection failed: {task.exception()}")
+
+            else:
+                pool = task.result()
+
+        if pool is None:
+            self.set_ib_status("unavailable")
+            logger.error("Could not connect to IB Gateway.")
+            return
+
+        elapsed = time.perf_counter() - t0
+
+        self.ib = pool
+        self.set_ib_status(f"connected ({pool.connected_count()}/{len(pool)})")
+
+        registry.observe("startup", elapsed, stage="ib_connect")
+        logger.info(f"[STARTUP] IB Gateway connected in {elapsed * 1000:.0f} ms ({pool.connected_count()}/{len(pool)} lanes)")
+
+    def set_ib_status(self, text: str):
+        self.ib_status.configure(text=f"IB Gateway: {text}")
+
+    # endregion
+
+    # region : Actions
+
+    def _require_ib(self) -> bool:
+
+        if self.ib is not None:
+            return True
+
+        messagebox.showerror("Error", "Not connected to IB Gateway.")
+        self.connect_ib()
+
+        return False
+
+    def run_screener(self):
+
+        if self._require_ib():
+            from app import run_screener
+            run_screener(self)
+
+    def run_backtest(self):
+
+        if self._require_ib():
+            from app import run_backtest
+            run_backtest(self)
+
+    def cancel_screener(self):
+
+        if self.screen_task is not None or self.backtest_task is not None:
+            from app import cancel_screener
+            cancel_screener(self)
+
+    def on_close(self):
+
+        """Fermeture de la fenêtre : annule le screening en cours et arrête les process d'évaluation."""
+
+        self.cancel_screener()
+
+        # Modules du screening chargés (sinon aucun pool n'a pu démarrer)
+        if self.screen_cache is not None:
+            from parallel import shutdown_eval_pool
+            shutdown_eval_pool()
+
+        self.root.destroy()
+
+    # endregion
+
     # region : Helper Functions
 
+    def pump_asyncio(self):
+
+        """
+        Fait tourner la boucle asyncio (ib_insync) par petites tranches depuis la boucle Tk,
+        pour que le screening avance en tâche de fond sans bloquer la fenêtre.
+        """
+
+        loop = self.loop
+
+        if not loop.is_running():
+            loop.call_soon(loop.stop)
+            loop.run_forever()
+
+        self.root.after(ASYNC_PUMP_MS, self.pump_asyncio)
+
+    def set_running(self, running: bool):
+
+        # Fin de run : les dernières lignes n'attendent pas le prochain lot
+        if not running:
+            self.results_view.flush()
+
+        self.run_button.configure(state=tk.DISABLED if running else tk.NORMAL)
+        self.backtest_button.configure(state=tk.DISABLED if running else tk.NORMAL)
+        self.cancel_button.configure(state=tk.NORMAL if running else tk.DISABLED)
+
     def reset(self):
 
+        self.cancel_screener()
+
         self.date_entry.delete(0, tk.END)
         self.date_entry.insert(0, get_screening_date_now().strftime("%Y-%m-%d"))
-        self.tree.delete(*self.tree.get_children())
-
-        for widget in self.ticker_inner_frame.winfo_children():
-            widget.destroy()
+        self.end_date_entry.delete(0, tk.END)
+        self.results_view.clear()
+        self.ticker_selector.set_tickers([])
 
         for var in self.conditions.values():
             var.set(False)
 
-        for var in self.ticker_vars.values():
-            var.set(False)
-
         self.tickers = []
         self.results = []
 
+        if self.screen_cache is not None:
+            self.screen_cache.clear()
+
         logger.info("App reset.")
 
     def upload_file(self):
@@ -172,7 +377,7 @@ class StockScreenerApp:
         tab2 = ttk.Frame(notebook)
 
         notebook.add(tab1, text="Conditions 1 –> 101")
-        notebook.add(tab2, text="Conditions 102 –> 142")
+        notebook.add(tab2, text=f"Conditions {cond_defs[101][0]} –> {cond_defs[-1][0]}")
 
         def create_grid_conditions(tab, start_idx, end_idx):
 
@@ -196,13 +401,7 @@ class StockScreenerApp:
                 for i in range(block_start, block_end):
 
                     idx, label = cond_defs[i]
-                    comparator = extract_comparator(label)
-
-                    if 19 <= idx <= 34 or 51 <= idx <= 66 or idx in (80, 81):
-                        opposite_comparator = ("≤" if comparator == "≥" else "≥" if comparator == "≤" else comparator)
-                        
-                    else:
-                        opposite_comparator = inverse_comparator(comparator)
+                    comparator, opposite_comparator = CONDITIONS[idx].symbol, CONDITIONS[idx].inverse_symbol
 
                     ttk.Label(block_frame, text=f"{idx}. {label}", anchor="w", style="Large.TLabel").grid(row=current_row, column=0, sticky="w")
                     ttk.Label(block_frame, text=f"{comparator}").grid(row=current_row, column=1, sticky="e", padx=(5, 2))
@@ -236,19 +435,24 @@ class StockScreenerApp:
                         ttk.Separator(block_frame, orient="horizontal").grid(row=current_row, column=0, columnspan=5, sticky="ew", pady=0)
                         current_row += 1
 
+        # Second onglet construit à sa première ouverture (ses cases absentes de self.conditions = non cochées)
+        pending = {str(tab2): (tab2, [(101, 126), (126, len(cond_defs))])}
+
+        def on_tab_changed(event):
+
+            tab, ranges = pending.pop(notebook.select(), (None, []))
+
+            for start_idx, end_idx in ranges:
+                create_grid_conditions(tab, start_idx, end_idx)
+
         create_grid_conditions(tab1, 0, 101)
-        create_grid_conditions(tab2, 101, 126)
-        create_grid_conditions(tab2, 126, len(cond_defs))
+        notebook.bind("<<NotebookTabChanged>>", on_tab_changed)
 
     def select_all_tickers(self):
-
-        for var in self.ticker_vars.values():
-            var.set(True)
+        self.ticker_selector.select_all(True)
 
     def unselect_all_tickers(self):
-
-        for var in self.ticker_vars.values():
-            var.set(False)
+        self.ticker_selector.select_all(False)
 
     def deselect_all_conditions(self):
 
@@ -256,20 +460,6 @@ class StockScreenerApp:
             var.set(False)
 
     def populate_ticker_selection(self):
-
-        for widget in self.ticker_inner_frame.winfo_children():
-            widget.destroy()
-
-        self.ticker_vars = {}
-
-        for i, ticker in enumerate(self.tickers, start=1):
-
-            var = tk.BooleanVar(value=True)
-            
-            ttk.Checkbutton(self.ticker_inner_frame,
-                            text=f"{i}. {ticker}",
-                            variable=var).grid(row=i - 1, column=0, sticky=tk.W, pady=1)
-            
-            self.ticker_vars[ticker] = var
+        self.ticker_selector.set_tickers(self.tickers)
 
 # endregion
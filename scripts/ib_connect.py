@@ -1,21 +1,194 @@
-from ib_insync import IB
-from config import IB_GATEWAY_HOST, IB_GATEWAY_PORT, IB_CLIENT_ID, logger
+import time
+import asyncio
 
-_ib_instance = None
+from itertools import cycle
+from ib_insync import IB, util
+from typing import Dict, List, Optional, Tuple
+from config import IB_CLIENT_ID, IB_GATEWAYS, IB_POOL_SIZE, IB_RECONNECT_COOLDOWN_SEC, IB_RECONNECT_MAX_COOLDOWN_SEC, logger
 
-def get_ib():
+_pool = None
 
-    global _ib_instance
+# region : Connection Pool
 
-    if _ib_instance is None or not _ib_instance.isConnected():
-        _ib_instance = IB()
+class IBPool:
+
+    """
+    Pool de connexions IB : `size` clients aux clientId distincts (IB_CLIENT_ID, +1, ...),
+    répartis en tourniquet sur une ou plusieurs gateways (host, port).
+    Chaque client est une « voie » avec son propre budget de pacing ; une voie déconnectée
+    est reconnectée à la demande, ou remplacée par une autre voie si la reconnexion échoue.
+    Après un échec, la voie n'est plus retentée avant la fin d'un délai (doublé à chaque échec consécutif) :
+    les requêtes passent aussitôt sur les voies saines.
+    """
+
+    def __init__(self,
+                 size: int = IB_POOL_SIZE,
+                 gateways: List[Tuple[str, int]] = IB_GATEWAYS,
+                 base_client_id: int = IB_CLIENT_ID):
+
+        self.endpoints = [(host, port, base_client_id + i) for i, (host, port) in zip(range(max(size, 1)), cycle(gateways))]
+        self.clients = [IB() for _ in self.endpoints]
+
+        self._connecting: Dict[int, asyncio.Task] = {}
+        self._failures: Dict[int, int] = {}
+        self._retry_at: Dict[int, float] = {}
+
+    @classmethod
+    def wrap(cls, ib: IB) -> "IBPool":
+
+        """Pool d'une seule voie autour d'une connexion existante (IB ou DataSource hors ligne)."""
+
+        client = getattr(ib, "client", None)
+
+        pool = cls.__new__(cls)
+        pool.endpoints = [(client.host, client.port, client.clientId) if client is not None else ("", 0, 0)]
+        pool.clients = [ib]
+        pool._connecting = {}
+        pool._failures = {}
+        pool._retry_at = {}
+
+        return pool
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+    @property
+    def primary(self) -> IB:
+        return self.clients[0]
+
+    def client_id(self, lane: int) -> int:
+        return self.endpoints[lane % len(self)][2]
+
+    def connected_count(self) -> int:
+        return sum(1 for ib in self.clients if ib.isConnected())
+
+    def isConnected(self) -> bool:
+        return self.connected_count() > 0
+
+    async def _connect_lane(self, lane: int) -> bool:
+
+        host, port, client_id = self.endpoints[lane]
 
         try:
-            _ib_instance.connect(IB_GATEWAY_HOST, IB_GATEWAY_PORT, clientId=IB_CLIENT_ID)
-            logger.info("Connected to IB Gateway.")
+            await self.clients[lane].connectAsync(host, port, clientId=client_id)
+            logger.info(f"Connected to IB Gateway {host}:{port} (clientId={client_id}).")
+
+            self._failures.pop(lane, None)
+            self._retry_at.pop(lane, None)
+            return True
 
         except Exception as e:
-            logger.error(f"Failed to connect to IB Gateway: {e}")
-            return None
+            self.clients[lane].disconnect()
+
+            failures = self._failures[lane] = self._failures.get(lane, 0) + 1
+            cooldown = min(IB_RECONNECT_COOLDOWN_SEC * 2 ** (failures - 1), IB_RECONNECT_MAX_COOLDOWN_SEC)
+            self._retry_at[lane] = time.monotonic() + cooldown
+
+            logger.error(f"Failed to connect to IB Gateway {host}:{port} (clientId={client_id}): {e} "
+                         f"— lane skipped for {cooldown:.0f}s")
+            return False
+
+    async def ensure(self, lane: int, force: bool = False) -> bool:
+
+        """
+        Reconnecte la voie si besoin ; une seule tentative simultanée par voie.
+        Une voie en attente après un échec renvoie False sans nouvelle tentative, sauf si force.
+        """
+
+        lane %= len(self)
+
+        if self.clients[lane].isConnected():
+            return True
+
+        task = self._connecting.get(lane)
+
+        if task is None or task.done():
+
+            if not force and time.monotonic() < self._retry_at.get(lane, 0.0):
+                return False
+
+            task = self._connecting[lane] = asyncio.ensure_future(self._connect_lane(lane))
+
+        return await task
+
+    async def connect(self) -> int:
+
+        """Ouvre toutes les voies en parallèle (y compris celles en attente) ; renvoie le nombre de voies connectées."""
+
+        await asyncio.gather(*[self.ensure(i, force=True) for i in range(len(self))])
+        return self.connected_count()
+
+    async def lane(self, index: int) -> Optional[Tuple[int, IB]]:
+
+        """
+        Voie `index % size` (reconnectée si besoin), sinon la première autre voie disponible.
+        Renvoie (numéro de voie, client) ou None si aucune gateway ne répond.
+        """
+
+        for offset in range(len(self)):
+
+            lane = (index + offset) % len(self)
+
+            if await self.ensure(lane):
+                return lane, self.clients[lane]
+
+        return None
+
+    def disconnect(self) -> None:
+
+        for ib in self.clients:
+            ib.disconnect()
+
+# endregion
+
+# region : API Functions
+
+def get_ib_pool() -> Optional[IBPool]:
+
+    global _pool
+
+    if _pool is None:
+        _pool = IBPool()
+
+    if not _pool.isConnected() and util.run(_pool.connect()) == 0:
+        return None
+
+    return _pool
+
+async def get_ib_pool_async() -> Optional[IBPool]:
+
+    """Variante asynchrone de get_ib_pool, utilisable depuis une boucle asyncio déjà lancée."""
+
+    global _pool
+
+    if _pool is None:
+        _pool = IBPool()
+
+    if not _pool.isConnected() and await _pool.connect() == 0:
+        return None
+
+    return _pool
+
+def get_ib() -> Optional[IB]:
+
+    """Client principal du pool (voie 0), pour les appels qui n'ont besoin que d'une connexion."""
+
+    pool = get_ib_pool()
+
+    if pool is None or not util.run(pool.ensure(0)):
+        return None
+
+    return pool.primary
+
+async def get_ib_async() -> Optional[IB]:
+
+    """Variante asynchrone de get_ib."""
+
+    pool = await get_ib_pool_async()
+
+    if pool is None or not await pool.ensure(0):
+        return None
+
+    return pool.primary
 
-    return _ib_instance
+# endregion
@@ -1,6 +1,10 @@
+import time
+
+# Référence du time-to-interactive (mesuré par StockScreenerApp au premier affichage)
+_STARTED_AT = time.perf_counter()
+
 import tkinter as tk
 
-from ib_connect import get_ib   
 from gui_handler import StockScreenerApp
 from config import APP_TITLE, ICON_PATH, DEFAULT_FULLSCREEN, DEFAULT_ZOOMED
 
@@ -21,13 +25,8 @@ def launch_app():
     except Exception as e:
         print(f"Could not load icon: {e}")
 
-    ib = get_ib()
-
-    if ib is None:
-        print("Could not connect to IB Gateway, exiting.")
-        return
-
-    app = StockScreenerApp(root, ib) 
+    # La connexion IB est ouverte en tâche de fond une fois la fenêtre affichée (état dans Controls)
+    app = StockScreenerApp(root, started_at=_STARTED_AT)
     root.mainloop()
     
 if __name__ == "__main__":
@@ -0,0 +1,206 @@
+import json
+import time
+import functools
+import threading
+import numpy as np
+import datetime as dt
+
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Tuple
+from config import logger, METRICS_DIR, METRICS_FORMATS, METRICS_MAX_SAMPLES
+
+# region : Variables
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+# endregion
+
+# region : Helper Functions
+
+def _key(name: str, labels: dict) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _prom_labels(labels: tuple, **extra) -> str:
+
+    items = list(labels) + [(k, str(v)) for k, v in extra.items()]
+
+    if not items:
+        return ""
+
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+# endregion
+
+# region : Metrics Registry
+
+class MetricsRegistry:
+
+    """
+    Registre de métriques du process :
+    - timers (durées en secondes) : nombre, somme et derniers échantillons pour les percentiles
+    - counters : retries, codes IB, conditions N/A, tickers écartés...
+    Exporté en textfile Prometheus et/ou JSON à la fin de chaque run.
+    """
+
+    def __init__(self, max_samples: int = METRICS_MAX_SAMPLES):
+
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+
+        self.reset()
+
+    def reset(self) -> None:
+
+        with self._lock:
+            self.started_at = time.time()
+            self._counters: Dict[_Key, float] = {}
+            self._timers: Dict[_Key, list] = {}
+
+    # region : Recording
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+
+        key = _key(name, labels)
+
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+
+        key = _key(name, labels)
+
+        with self._lock:
+            timer = self._timers.get(key)
+
+            if timer is None:
+                timer = self._timers[key] = [0, 0.0, deque(maxlen=self.max_samples)]
+
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2].append(seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+
+        t0 = time.perf_counter()
+
+        try:
+            yield
+
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    def timed(self, name: str, **labels):
+
+        """Décorateur : chronomètre chaque appel de la fonction."""
+
+        def decorator(func):
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+
+                t0 = time.perf_counter()
+
+                try:
+                    return func(*args, **kwargs)
+
+                finally:
+                    self.observe(name, time.perf_counter() - t0, **labels)
+
+            return wrapper
+
+        return decorator
+
+    # endregion
+
+    # region : Export
+
+    def snapshot(self) -> dict:
+
+        with self._lock:
+            counters = dict(self._counters)
+            timers = {k: (n, total, np.fromiter(samples, dtype=float)) for k, (n, total, samples) in self._timers.items()}
+
+        return {"started_at": dt.datetime.fromtimestamp(self.started_at).isoformat(timespec="seconds"),
+                "counters": [{"name": name, "labels": dict(labels), "value": value}
+                             for (name, labels), value in sorted(counters.items())],
+                "timers": [{"name": name, "labels": dict(labels), "count": n, "sum": total,
+                            **{f"p{int(q * 100)}": float(np.quantile(s, q)) for q in QUANTILES if len(s)}}
+                           for (name, labels), (n, total, s) in sorted(timers.items())]}
+
+    def to_prometheus(self) -> str:
+
+        """Format texte Prometheus : timers en summary (quantiles, _sum, _count), compteurs en counter."""
+
+        snap = self.snapshot()
+        lines = []
+        typed = set()
+
+        for t in snap["timers"]:
+
+            metric = f"screener_{t['name']}_seconds"
+            labels = tuple(t["labels"].items())
+
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} summary")
+                typed.add(metric)
+
+            for q in QUANTILES:
+
+                value = t.get(f"p{int(q * 100)}")
+
+                if value is not None:
+                    lines.append(f"{metric}{_prom_labels(labels, quantile=q)} {value:.6g}")
+
+            lines.append(f"{metric}_sum{_prom_labels(labels)} {t['sum']:.6g}")
+            lines.append(f"{metric}_count{_prom_labels(labels)} {t['count']}")
+
+        for c in snap["counters"]:
+
+            metric = f"screener_{c['name']}_total"
+
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+
+            lines.append(f"{metric}{_prom_labels(tuple(c['labels'].items()))} {c['value']:g}")
+
+        return "\n".join(lines) + "\n"
+
+    def export(self, run: str, formats: Tuple[str, ...] = METRICS_FORMATS) -> None:
+
+        """
+        Écrit les métriques du run dans METRICS_DIR selon `formats` (par défaut METRICS_FORMATS) :
+          - "prometheus" : screener.prom (textfile collector, remplacé à chaque run)
+          - "json"       : <run>_<horodatage>.json (un fichier par run)
+        """
+
+        if not formats:
+            return
+
+        try:
+            METRICS_DIR.mkdir(parents=True, exist_ok=True)
+
+            if "prometheus" in formats:
+                tmp = METRICS_DIR / "screener.prom.tmp"
+                tmp.write_text(self.to_prometheus())
+                tmp.replace(METRICS_DIR / "screener.prom")
+
+            if "json" in formats:
+                stamp = dt.datetime.now().strftime("%Y%m%d_%H%M%S")
+                (METRICS_DIR / f"{run}_{stamp}.json").write_text(json.dumps(dict(self.snapshot(), run=run), indent=2))
+
+            logger.info(f"[METRICS] {run} metrics written to {METRICS_DIR}")
+
+        except Exception as e:
+            logger.error(f"[METRICS] Could not write metrics: {e}")
+
+    # endregion
+
+# endregion
+
+# Registre partagé par tout le process
+registry = MetricsRegistry()
@@ -0,0 +1,258 @@
+import json
+import time
+import asyncio
+
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, List, Optional, Tuple
+from config import (logger,
+                    PACING_STATE_FILE,
+                    PACING_WINDOWS,
+                    PACING_MIN_CONCURRENCY,
+                    PACING_MAX_CONCURRENCY,
+                    PACING_START_CONCURRENCY,
+                    PACING_COOLDOWN_SEC)
+from metrics import registry
+
+# region : Variables
+
+PACING_ERROR_CODES = {354, 420}
+
+# Une latence au-delà de LATENCY_SLOWDOWN × la moyenne glissante réduit la concurrence
+LATENCY_SLOWDOWN = 2.0
+LATENCY_EWMA_ALPHA = 0.2
+
+# endregion
+
+# region : Helper Functions
+
+def is_pacing_error(code: Optional[int], message: str = "") -> bool:
+
+    """Codes IB de pacing (420, 354) ou erreur 162 « pacing violation »."""
+
+    return code in PACING_ERROR_CODES or (code == 162 and "pacing" in message.lower())
+
+# endregion
+
+# region : Pacing Controller
+
+class PacingController:
+
+    """
+    Ordonnanceur des requêtes historiques IB :
+    - fenêtres glissantes (durée, max requêtes) : aucune n'est jamais dépassée
+    - concurrence AIMD : +1 après une « ronde » de succès rapides, ÷2 sur erreur de pacing,
+      -1 quand la latence dérive
+    - pause globale (cooldown exponentiel) après une erreur de pacing
+    - état (concurrence, latence moyenne) persisté entre deux runs (sauf state_file=None)
+    """
+
+    def __init__(self, windows: List[Tuple[float, int]] = PACING_WINDOWS, state_file=PACING_STATE_FILE):
+
+        self.windows = windows
+        self.state_file = state_file
+
+        self.concurrency = float(PACING_START_CONCURRENCY)
+        self.latency_ewma: Optional[float] = None
+
+        self._in_flight = 0
+        self._successes = 0
+        self._cooldown = 0.0
+        self._paused_until = 0.0
+
+        self._starts: Deque[float] = deque()
+        self._changed: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.load()
+
+    # region : State
+
+    def load(self) -> None:
+
+        if self.state_file is None:
+            return
+
+        try:
+            state = json.loads(self.state_file.read_text())
+
+            self.concurrency = float(min(max(state["concurrency"], PACING_MIN_CONCURRENCY), PACING_MAX_CONCURRENCY))
+            self.latency_ewma = state.get("latency_ewma")
+
+            logger.info(f"[PACING] State loaded: concurrency={self.concurrency:.0f}, latency={self.latency_ewma}")
+
+        except FileNotFoundError:
+            pass
+
+        except Exception as e:
+            logger.warning(f"[PACING] Could not load state: {e}")
+
+    def save(self) -> None:
+
+        if self.state_file is None:
+            return
+
+        try:
+            self.state_file.parent.mkdir(parents=True, exist_ok=True)
+            self.state_file.write_text(json.dumps({"concurrency": self.concurrency,
+                                                   "latency_ewma": self.latency_ewma,
+                                                   "saved_at": time.time()}))
+
+        except Exception as e:
+            logger.warning(f"[PACING] Could not save state: {e}")
+
+    # endregion
+
+    # region : Scheduling
+
+    def _window_delay(self, now: float) -> float:
+
+        """Temps à attendre avant qu'une nouvelle requête respecte toutes les fenêtres glissantes."""
+
+        longest = max((w for w, _ in self.windows), default=0.0)
+
+        while self._starts and now - self._starts[0] >= longest:
+            self._starts.popleft()
+
+        delay = max(0.0, self._paused_until - now)
+
+        for window, max_requests in self.windows:
+
+            in_window = [t for t in self._starts if now - t < window]
+
+            if len(in_window) >= max_requests:
+                delay = max(delay, in_window[len(in_window) - max_requests] + window - now)
+
+        return delay
+
+    async def _notify(self) -> None:
+
+        async with self._changed:
+            self._changed.notify_all()
+
+    @asynccontextmanager
+    async def request(self):
+
+        """
+        Réserve un créneau de requête historique : attend la concurrence et les fenêtres de pacing.
+        """
+
+        loop = asyncio.get_running_loop()
+
+        # La Condition est liée à la boucle : la recréer si le contrôleur change de boucle
+        if self._changed is None or self._loop is not loop:
+            self._changed = asyncio.Condition()
+            self._loop = loop
+
+        async with self._changed:
+
+            while True:
+
+                if self._in_flight < int(self.concurrency):
+
+                    delay = self._window_delay(time.monotonic())
+
+                    if delay <= 0:
+                        break
+
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), timeout=delay)
+
+                    except asyncio.TimeoutError:
+                        pass
+
+                    continue
+
+                await self._changed.wait()
+
+            self._in_flight += 1
+            self._starts.append(time.monotonic())
+
+        try:
+            yield
+
+        finally:
+            self._in_flight -= 1
+            await self._notify()
+
+    # endregion
+
+    # region : Feedback
+
+    def on_success(self, latency: float) -> None:
+
+        if self.latency_ewma is not None and latency > LATENCY_SLOWDOWN * self.latency_ewma:
+            self._decrease(1.0, f"latency {latency:.2f}s")
+
+        else:
+            self._successes += 1
+
+            if self._successes >= int(self.concurrency):
+                self._successes = 0
+                self._increase()
+
+        prev = self.latency_ewma if self.latency_ewma is not None else latency
+        self.latency_ewma = (1 - LATENCY_EWMA_ALPHA) * prev + LATENCY_EWMA_ALPHA * latency
+
+        self._cooldown = 0.0
+
+    def on_pacing_error(self, code: Optional[int]) -> float:
+
+        """Divise la concurrence par 2 et suspend les nouvelles requêtes ; renvoie la pause appliquée."""
+
+        self._decrease(self.concurrency / 2, f"pacing code {code}")
+        registry.inc("pacing_errors", code=code)
+
+        self._cooldown = min(max(PACING_COOLDOWN_SEC, self._cooldown * 2), 60.0)
+        self._paused_until = time.monotonic() + self._cooldown
+
+        return self._cooldown
+
+    def on_ib_error(self, req_id, code, message, *_) -> None:
+
+        """Abonné à ib.errorEvent : certaines erreurs de pacing n'arrivent pas en exception."""
+
+        if is_pacing_error(code, message or ""):
+            logger.warning(f"[PACING] IB error {code}: {message}")
+            self.on_pacing_error(code)
+
+    def _increase(self) -> None:
+
+        if self.concurrency < PACING_MAX_CONCURRENCY:
+            self.concurrency = min(self.concurrency + 1, PACING_MAX_CONCURRENCY)
+            logger.debug(f"[PACING] concurrency -> {self.concurrency:.0f}")
+
+    def _decrease(self, amount: float, reason: str) -> None:
+
+        self.concurrency = max(self.concurrency - amount, PACING_MIN_CONCURRENCY)
+        self._successes = 0
+
+        logger.info(f"[PACING] concurrency -> {self.concurrency:.0f} ({reason})")
+
+    # endregion
+
+# endregion
+
+# region : API Functions
+
+_controllers: Dict[Optional[int], PacingController] = {}
+
+def get_pacer(client_id: Optional[int] = None) -> PacingController:
+
+    """
+    Contrôleur partagé par tous les fetchs du process (l'état survit entre deux runs).
+    Un contrôleur par clientId IB : chaque connexion du pool a son propre budget de pacing.
+    """
+
+    if client_id not in _controllers:
+
+        state_file = PACING_STATE_FILE
+
+        if client_id is not None:
+            state_file = PACING_STATE_FILE.with_name(f"{PACING_STATE_FILE.stem}_{client_id}{PACING_STATE_FILE.suffix}")
+
+        _controllers[client_id] = PacingController(state_file=state_file)
+
+    return _controllers[client_id]
+
+# endregion
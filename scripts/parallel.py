@@ -0,0 +1,160 @@
+import os
+import asyncio
+import numpy as np
+import pandas as pd
+import datetime as dt
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+from config import logger, EVAL_WORKERS, EVAL_SHARD_SIZE
+from metrics import registry
+from bar_store import BarStore
+from engine import prepare_ticker, stack_universe, evaluate_universe, NA
+
+_pool = None
+
+# region : Worker Functions
+
+def _screen_shard(store: BarStore, screening_date: dt.date, ids: List[int]) -> tuple:
+
+    """
+    Exécuté dans un process : découpe DAY / DAY-1 / Open 16h de chaque ticker du lot puis évalue `ids` (moteur vectorisé).
+    Renvoie (tickers retenus, barres (n, 2, 24, 5), open16 (n,), primary (n, k), inverse (n, k), tickers sans barres).
+    """
+
+    kept, matrices, opens, empty = [], [], [], []
+
+    for ticker in store:
+
+        bars = store[ticker]
+
+        if not len(bars):
+            empty.append(ticker)
+
+        prepared = prepare_ticker(bars, screening_date, ticker)
+
+        if prepared is None:
+            continue
+
+        kept.append(ticker)
+        matrices.append(prepared[0])
+        opens.append(prepared[1])
+
+    u = stack_universe(kept, matrices, opens)
+    primary, inverse = evaluate_universe(u, ids)
+
+    return u.tickers, u.bars, u.open16, primary, inverse, empty
+
+def _outcome(value: int) -> Optional[bool]:
+    return None if value == NA else bool(value)
+
+# endregion
+
+# region : Evaluation Pool
+
+class ShardResult:
+
+    """Résultat d'un lot : entrées par ticker, dans l'ordre du lot."""
+
+    __slots__ = ("tickers", "bars", "open16", "primary", "inverse", "ids", "empty")
+
+    def __init__(self, ids: List[int], tickers, bars, open16, primary, inverse, empty):
+
+        self.ids = ids
+        self.tickers = tickers
+        self.bars = bars
+        self.open16 = open16
+        self.primary = primary
+        self.inverse = inverse
+        self.empty = set(empty)
+
+    def entries(self) -> Iterator[Tuple[str, np.ndarray, np.ndarray, float, Dict[int, Tuple[Optional[bool], Optional[bool]]]]]:
+
+        """(ticker, matrice DAY, matrice DAY-1, open16, {cid: (principal, inverse)}) de chaque ticker retenu."""
+
+        for i, ticker in enumerate(self.tickers):
+
+            results = {cid: (_outcome(self.primary[i, j]), _outcome(self.inverse[i, j])) for j, cid in enumerate(self.ids)}
+            yield ticker, self.bars[i, 0], self.bars[i, 1], float(self.open16[i]), results
+
+class EvaluationPool:
+
+    """
+    Process de découpage / évaluation : les tickers sont envoyés par lots de EVAL_SHARD_SIZE
+    (BarStore : quelques tableaux NumPy, sans DataFrame à pickler), chaque lot est traité par un process
+    et les résultats sont rendus dans l'ordre des lots.
+    """
+
+    def __init__(self, workers: Optional[int] = EVAL_WORKERS):
+
+        self.workers = workers or os.cpu_count() or 1
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            logger.info(f"[PARALLEL] Evaluation pool started ({self.workers} processes)")
+
+        return self._executor
+
+    def submit(self, frames: Dict[str, Optional[pd.DataFrame]], screening_date: dt.date, ids: List[int]) -> asyncio.Future:
+
+        """Envoie un lot à un process ; le Future renvoie un ShardResult."""
+
+        ids = list(ids)
+
+        with registry.timer("shard_pack"):
+            store = BarStore.from_frames(frames)
+
+        future = asyncio.get_running_loop().run_in_executor(self.executor, _screen_shard, store, screening_date, ids)
+
+        async def _wrap() -> ShardResult:
+            return ShardResult(ids, *await future)
+
+        return asyncio.ensure_future(_wrap())
+
+    async def screen(self, frames: Dict[str, Optional[pd.DataFrame]], screening_date: dt.date, ids: List[int]) -> List[ShardResult]:
+
+        """Découpe `frames` en lots, les répartit sur les process et renvoie les résultats dans l'ordre des tickers."""
+
+        tickers = list(frames)
+        size = max(1, min(EVAL_SHARD_SIZE, -(-len(tickers) // self.workers)))
+
+        jobs = [self.submit({t: frames[t] for t in tickers[i:i + size]}, screening_date, ids) for i in range(0, len(tickers), size)]
+        return list(await asyncio.gather(*jobs))
+
+    def shutdown(self) -> None:
+
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+# endregion
+
+# region : API Functions
+
+def get_eval_pool() -> Optional[EvaluationPool]:
+
+    """Pool partagé par le process, ou None si EVAL_WORKERS désactive l'évaluation parallèle."""
+
+    global _pool
+
+    if EVAL_WORKERS is not None and EVAL_WORKERS <= 1:
+        return None
+
+    if _pool is None:
+        _pool = EvaluationPool()
+
+    return _pool
+
+def shutdown_eval_pool() -> None:
+
+    """Arrête les process du pool partagé (fermeture de l'application) ; sans effet s'il n'a jamais démarré."""
+
+    if _pool is not None:
+        _pool.shutdown()
+        logger.info("[PARALLEL] Evaluation pool stopped")
+
+# endregion
@@ -0,0 +1,308 @@
+import json
+import sqlite3
+import argparse
+import numpy as np
+import pandas as pd
+import datetime as dt
+
+from typing import Dict, Iterable, List, Optional, Tuple
+from config import logger, RESULTS_DB_FILE, RESULTS_STORE_BACKTEST_OUTCOMES
+from engine import NA, Universe
+
+# region : Variables
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind          TEXT    NOT NULL,
+    status        TEXT    NOT NULL,
+    started_at    TEXT    NOT NULL,
+    finished_at   TEXT,
+    start_date    TEXT    NOT NULL,
+    end_date      TEXT    NOT NULL,
+    condition_set TEXT    NOT NULL,
+    selected_ids  TEXT    NOT NULL,
+    inverse_ids   TEXT    NOT NULL,
+    tickers       INTEGER NOT NULL,
+    matches       INTEGER,
+    timings       TEXT
+);
+
+CREATE INDEX IF NOT EXISTS runs_by_set ON runs (condition_set, start_date);
+
+CREATE TABLE IF NOT EXISTS verdicts (
+    run_id        INTEGER NOT NULL,
+    date          TEXT    NOT NULL,
+    ticker        TEXT    NOT NULL,
+    condition_set TEXT    NOT NULL,
+    matched       INTEGER,
+    open16        REAL,
+    PRIMARY KEY (run_id, date, ticker)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS verdicts_by_ticker ON verdicts (ticker, condition_set, date);
+CREATE INDEX IF NOT EXISTS verdicts_by_date ON verdicts (date, condition_set, matched);
+
+CREATE TABLE IF NOT EXISTS outcomes (
+    run_id        INTEGER NOT NULL,
+    date          TEXT    NOT NULL,
+    ticker        TEXT    NOT NULL,
+    condition_id  INTEGER NOT NULL,
+    value         INTEGER,
+    inverse_value INTEGER,
+    PRIMARY KEY (run_id, date, ticker, condition_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS outcomes_by_condition ON outcomes (condition_id, date);
+"""
+
+# (ticker, verdict, Open 16h DAY-1, {cid: (principal, inverse)}) ; verdict None = ticker écarté (barres manquantes)
+Verdict = Tuple[str, Optional[bool], Optional[float], Dict[int, Tuple[Optional[bool], Optional[bool]]]]
+
+_conn: Optional[sqlite3.Connection] = None
+
+# endregion
+
+# region : Helper Functions
+
+def _get_connection() -> sqlite3.Connection:
+
+    global _conn
+
+    if _conn is None:
+        RESULTS_DB_FILE.parent.mkdir(parents=True, exist_ok=True)
+
+        _conn = sqlite3.connect(RESULTS_DB_FILE, check_same_thread=False)
+        _conn.executescript(_SCHEMA)
+
+        logger.info(f"[RESULTS] Results store opened: {RESULTS_DB_FILE}")
+
+    return _conn
+
+def _flag(value: Optional[bool]) -> Optional[int]:
+    return None if value is None else int(value)
+
+def _tri(value: int) -> Optional[int]:
+    return None if value == NA else int(value)
+
+def condition_set_key(selected_ids: Iterable[int], inverse_ids: Iterable[int]) -> str:
+
+    """Clé d'un jeu de conditions, indépendante de l'ordre des cases : "3,20|86" (principales | inverses)."""
+
+    return f"{','.join(map(str, sorted(set(selected_ids))))}|{','.join(map(str, sorted(set(inverse_ids))))}"
+
+def run_timings(snapshot: dict) -> Dict[str, dict]:
+
+    """Durées d'un snapshot du registre de métriques, cumulées par nom de timer (toutes étiquettes confondues)."""
+
+    timings: Dict[str, dict] = {}
+
+    for t in snapshot["timers"]:
+        entry = timings.setdefault(t["name"], {"count": 0, "sum": 0.0})
+        entry["count"] += t["count"]
+        entry["sum"] += t["sum"]
+
+    return timings
+
+# endregion
+
+# region : Run Recorder
+
+class RunRecorder:
+
+    """
+    Enregistre un run (screening ou backtest) dans le results store :
+    paramètres à la création, verdicts et résultats par condition au fil des dates, statut et durées à la fin.
+    Une erreur SQLite est journalisée et désactive l'enregistrement sans interrompre le run.
+    """
+
+    def __init__(self,
+                 kind: str,
+                 start_date: dt.date,
+                 end_date: dt.date,
+                 selected_ids: Iterable[int],
+                 inverse_ids: Iterable[int],
+                 tickers: int,
+                 outcomes: Optional[bool] = None):
+
+        self.selected_ids = sorted(set(selected_ids))
+        self.inverse_ids = sorted(set(inverse_ids))
+        self.condition_set = condition_set_key(self.selected_ids, self.inverse_ids)
+        # Résultats par condition : toujours pour un screening, selon RESULTS_STORE_BACKTEST_OUTCOMES pour un backtest
+        self.outcomes = (kind != "backtest" or RESULTS_STORE_BACKTEST_OUTCOMES) if outcomes is None else outcomes
+        self.matches = 0
+        self.run_id: Optional[int] = None
+
+        try:
+            conn = _get_connection()
+
+            with conn:
+                cursor = conn.execute("INSERT INTO runs (kind, status, started_at, start_date, end_date, condition_set, "
+                                      "selected_ids, inverse_ids, tickers) VALUES (?, 'running', ?, ?, ?, ?, ?, ?, ?)",
+                                      (kind, dt.datetime.now().isoformat(timespec="seconds"), start_date.isoformat(),
+                                       end_date.isoformat(), self.condition_set, json.dumps(self.selected_ids),
+                                       json.dumps(self.inverse_ids), tickers))
+
+            self.run_id = cursor.lastrowid
+
+        except sqlite3.Error as e:
+            logger.error(f"[RESULTS] Could not record {kind} run: {e}")
+
+    def add(self, day: dt.date, verdicts: Iterable[Verdict]) -> None:
+
+        """Verdicts d'une date ; seules les conditions du jeu sont gardées dans les résultats par condition."""
+
+        if self.run_id is None:
+            return
+
+        ids = set(self.selected_ids) | set(self.inverse_ids)
+        date = day.isoformat()
+
+        rows, outcomes = [], []
+
+        for ticker, matched, open16, results in verdicts:
+
+            rows.append((self.run_id, date, ticker, self.condition_set, _flag(matched), open16))
+            self.matches += bool(matched)
+
+            if self.outcomes:
+                outcomes.extend((self.run_id, date, ticker, cid, _flag(p), _flag(i)) for cid, (p, i) in results.items() if cid in ids)
+
+        self._write(rows, outcomes)
+
+    def add_universe(self, day: dt.date, tickers: Iterable[str], u: Universe, ids: List[int],
+                     primary: np.ndarray, inverse: np.ndarray, matches: np.ndarray) -> None:
+
+        """
+        Verdicts d'une date à partir des matrices du moteur vectorisé (colonnes dans l'ordre de `ids`) ;
+        les tickers de `tickers` absents de l'univers sont enregistrés comme écartés.
+        u : Universe, ou fingerprints.FingerprintDay (seuls tickers et open16 sont lus).
+        """
+
+        if self.run_id is None:
+            return
+
+        date = day.isoformat()
+        kept = set(u.tickers)
+
+        rows = [(self.run_id, date, t, self.condition_set, int(m), float(o)) for t, o, m in zip(u.tickers, u.open16, matches)]
+        rows += [(self.run_id, date, t, self.condition_set, None, None) for t in tickers if t not in kept]
+
+        self.matches += int(matches.sum())
+
+        outcomes = []
+
+        if self.outcomes:
+            outcomes = [(self.run_id, date, t, cid, _tri(primary[i, j]), _tri(inverse[i, j]))
+                        for i, t in enumerate(u.tickers) for j, cid in enumerate(ids)]
+
+        self._write(rows, outcomes)
+
+    def finish(self, status: str, timings: Optional[dict] = None) -> None:
+
+        """Statut final ("done", "cancelled", "error"), nombre de matches et durées du run."""
+
+        if self.run_id is None:
+            return
+
+        try:
+            conn = _get_connection()
+
+            with conn:
+                conn.execute("UPDATE runs SET status=?, finished_at=?, matches=?, timings=? WHERE run_id=?",
+                             (status, dt.datetime.now().isoformat(timespec="seconds"), self.matches,
+                              json.dumps(timings) if timings is not None else None, self.run_id))
+
+            logger.info(f"[RESULTS] Run {self.run_id} recorded ({status}, {self.matches} matches)")
+
+        except sqlite3.Error as e:
+            logger.error(f"[RESULTS] Could not finish run {self.run_id}: {e}")
+
+    def _write(self, rows: list, outcomes: list) -> None:
+
+        try:
+            conn = _get_connection()
+
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?, ?)", rows)
+                conn.executemany("INSERT OR REPLACE INTO outcomes VALUES (?, ?, ?, ?, ?, ?)", outcomes)
+
+        except sqlite3.Error as e:
+            logger.error(f"[RESULTS] Could not record run {self.run_id}, recording stopped: {e}")
+            self.run_id = None
+
+# endregion
+
+# region : API Functions
+
+def matched_dates(ticker: str,
+                  selected_ids: Iterable[int],
+                  inverse_ids: Iterable[int],
+                  start: Optional[dt.date] = None,
+                  end: Optional[dt.date] = None) -> List[dt.date]:
+
+    """
+    Dates où `ticker` a passé ce jeu de conditions, d'après les runs enregistrés (index ticker / jeu / date).
+    Si une date a été screenée plusieurs fois, le run le plus récent l'emporte.
+    """
+
+    query = "SELECT date, matched FROM verdicts WHERE ticker=? AND condition_set=?"
+    params: list = [ticker, condition_set_key(selected_ids, inverse_ids)]
+
+    if start is not None:
+        query += " AND date >= ?"
+        params.append(start.isoformat())
+
+    if end is not None:
+        query += " AND date <= ?"
+        params.append(end.isoformat())
+
+    latest: Dict[str, Optional[int]] = {}
+
+    for date, matched in _get_connection().execute(query + " ORDER BY date, run_id", params):
+        latest[date] = matched
+
+    return [dt.date.fromisoformat(d) for d, matched in latest.items() if matched]
+
+def run_history(limit: int = 50) -> pd.DataFrame:
+
+    """Derniers runs enregistrés (paramètres, statut, nombre de matches), du plus récent au plus ancien."""
+
+    return pd.read_sql_query("SELECT run_id, kind, status, started_at, finished_at, start_date, end_date, "
+                             "condition_set, tickers, matches FROM runs ORDER BY run_id DESC LIMIT ?",
+                             _get_connection(), params=(limit,), index_col="run_id")
+
+def run_verdicts(run_id: int) -> pd.DataFrame:
+
+    """Verdicts d'un run : une ligne par (date, ticker), matched vide pour un ticker écarté."""
+
+    return pd.read_sql_query("SELECT date, ticker, matched, open16 FROM verdicts WHERE run_id=? ORDER BY date, ticker",
+                             _get_connection(), params=(run_id,))
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description="Historique des runs enregistrés dans le results store.")
+    parser.add_argument("--ticker", help="dates où ce ticker a passé le jeu --conditions / --inverse")
+    parser.add_argument("--conditions", type=int, nargs="*", default=[])
+    parser.add_argument("--inverse", type=int, nargs="*", default=[])
+    parser.add_argument("--run", type=int, help="verdicts d'un run")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.ticker:
+        dates = matched_dates(args.ticker.upper(), args.conditions, args.inverse)
+        print(f"{args.ticker.upper()} [{condition_set_key(args.conditions, args.inverse)}]: {len(dates)} matching dates")
+
+        for d in dates:
+            print(f"  {d}")
+
+    elif args.run is not None:
+        print(run_verdicts(args.run).to_string(index=False))
+
+    else:
+        print(run_history(args.limit).to_string())
+
+# endregion
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+import datetime as dt
+
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from config import logger
+from metrics import registry
+from bar_cache import last_finished_hour
+from fingerprints import is_final
+from engine import prepare_ticker
+from conditions import evaluate_conditions
+
+# region : Screen Cache
+
+class TickerEntry:
+
+    """Entrées d'un ticker pour une date : matrices DAY / DAY-1, Open 16h DAY-1 et résultats par condition."""
+
+    __slots__ = ("day", "day_minus1", "open16", "results")
+
+    def __init__(self, day: np.ndarray, day_minus1: np.ndarray, open16: float):
+
+        self.day = day
+        self.day_minus1 = day_minus1
+        self.open16 = open16
+
+        # cid -> (principal, inverse), None = N/A
+        self.results: Dict[int, Tuple[Optional[bool], Optional[bool]]] = {}
+
+class ScreenCache:
+
+    """
+    Mémoire du dernier screening, pour une seule date :
+    - ticker -> TickerEntry, ou None si le ticker a été écarté (barres sans DAY, DAY-1 ou Open 16h)
+    - chaque nouveau jeu de cases ne calcule que les conditions jamais évaluées pour le ticker
+    Vidé au changement de date, et tant que les barres ont été relevées avant la fin de la séance (20h)
+    dès qu'une nouvelle barre 1h est terminée.
+    """
+
+    def __init__(self):
+
+        self.screening_date: Optional[dt.date] = None
+        self.fetched_until: Optional[dt.datetime] = None
+        self.entries: Dict[str, Optional[TickerEntry]] = {}
+
+    def _is_stale(self) -> bool:
+
+        # Barres relevées après la clôture de la séance : figées (même règle que fingerprints.is_final)
+        if is_final(self.screening_date, self.fetched_until):
+            return False
+
+        return last_finished_hour() > self.fetched_until
+
+    def use_date(self, screening_date: dt.date) -> None:
+
+        """Prépare le cache pour `screening_date` (vidé si la date change ou si les barres sont périmées)."""
+
+        if self.screening_date == screening_date and not self._is_stale():
+            return
+
+        if self.entries:
+            logger.info(f"[SCREEN_CACHE] Cleared {len(self.entries)} tickers ({self.screening_date} -> {screening_date})")
+
+        self.screening_date = screening_date
+        self.fetched_until = last_finished_hour()
+        self.entries = {}
+
+    def missing(self, tickers: Iterable[str]) -> List[str]:
+
+        """Tickers à récupérer auprès d'IB (jamais vus pour cette date)."""
+
+        return [t for t in tickers if t not in self.entries]
+
+    def add(self, ticker: str, df: Optional[pd.DataFrame]) -> None:
+
+        """Découpe les barres du ticker et ne garde que ses matrices (le DataFrame peut être libéré)."""
+
+        prepared = prepare_ticker(df, self.screening_date, ticker)
+
+        if prepared is None:
+
+            # Réponse vide (échec du fetch ou 162) : retentée au prochain run
+            if df is not None and not df.empty:
+                self.entries[ticker] = None
+
+            return
+
+        (day, day_minus1), open16 = prepared
+        self.entries[ticker] = TickerEntry(day, day_minus1, open16)
+
+    def add_shard(self, shard, tickers: Iterable[str]) -> None:
+
+        """
+        Enregistre un lot découpé et évalué par un process (parallel.ShardResult) ;
+        les tickers de `tickers` absents du résultat ont été écartés.
+        """
+
+        for ticker, day, day_minus1, open16, results in shard.entries():
+
+            entry = self.entries[ticker] = TickerEntry(day, day_minus1, open16)
+            entry.results.update(results)
+
+        for ticker in tickers:
+
+            if ticker not in self.entries and ticker not in shard.empty:
+                self.entries[ticker] = None
+
+    def screen(self, ticker: str, conditions: dict) -> Optional[float]:
+
+        """Open 16h DAY-1 si le ticker est retenu par `conditions`, sinon None."""
+
+        entry = self.entries.get(ticker)
+
+        if entry is None:
+            return None
+
+        known = len(entry.results)
+        passed = evaluate_conditions(conditions, entry.day, entry.open16, entry.day_minus1, memo=entry.results)
+
+        registry.inc("screen_cache", result="computed" if len(entry.results) > known else "hit")
+
+        return entry.open16 if passed else None
+
+    def verdicts(self, tickers: Iterable[str], matched: Iterable[str]) -> Iterator[tuple]:
+
+        """
+        (ticker, verdict, Open 16h, {cid: (principal, inverse)}) des tickers de `tickers` pour results_store.RunRecorder.add ;
+        verdict None pour un ticker écarté.
+        """
+
+        matched = set(matched)
+
+        for ticker in tickers:
+
+            if ticker not in self.entries:
+                continue
+
+            entry = self.entries[ticker]
+
+            if entry is None:
+                yield ticker, None, None, {}
+                continue
+
+            yield ticker, ticker in matched, entry.open16, entry.results
+
+    def clear(self) -> None:
+
+        self.screening_date = None
+        self.fetched_until = None
+        self.entries = {}
+
+# endregion
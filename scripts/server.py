@@ -0,0 +1,229 @@
+import json
+import time
+import asyncio
+import datetime as dt
+
+import ib_connect
+
+from contextlib import aclosing
+from ib_insync import util
+from metrics import registry
+from ib_connect import get_ib_pool_async
+from fetch_data import stream_all_data, _CONTRACT_CACHE
+from engine import prepare_ticker, stack_universe, screen_universe
+from conditions import resolve_condition_ids
+from utils import get_screening_date_now
+from config import logger, SERVER_HOST, SERVER_PORT, METRICS_FORMATS
+
+# region : Variables
+
+MAX_BODY_BYTES = 1 << 20
+
+_STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+                500: "Internal Server Error", 503: "Service Unavailable"}
+
+_started_at = time.monotonic()
+_screens_served = 0
+
+# endregion
+
+# region : Helper Functions
+
+class RequestError(Exception):
+
+    def __init__(self, status: int, message: str):
+
+        super().__init__(message)
+        self.status = status
+
+def _parse_screen_request(payload: dict) -> tuple:
+
+    """
+    Valide le corps JSON d'un POST /screen :
+      {"tickers": ["AAPL", ...], "date": "YYYY-MM-DD", "conditions": [3, 20], "inverse": [86]}
+    """
+
+    tickers = payload.get("tickers")
+
+    if not isinstance(tickers, list) or not tickers or not all(isinstance(t, str) for t in tickers):
+        raise RequestError(400, "'tickers' must be a non-empty list of symbols")
+
+    try:
+        raw_date = payload.get("date")
+        screening_date = dt.date.fromisoformat(raw_date) if raw_date else get_screening_date_now()
+
+        selected_ids, inverse_ids = resolve_condition_ids(payload.get("conditions", []), payload.get("inverse", []))
+        checked = bool(payload.get("conditions") or payload.get("inverse"))
+
+    except (TypeError, ValueError) as e:
+        raise RequestError(400, f"Invalid request: {e}")
+
+    return [t.strip().upper() for t in tickers], screening_date, selected_ids, inverse_ids, checked
+
+async def _screen(payload: dict) -> dict:
+
+    global _screens_served
+
+    tickers, screening_date, selected_ids, inverse_ids, checked = _parse_screen_request(payload)
+
+    ib = await get_ib_pool_async()
+
+    if ib is None:
+        raise RequestError(503, "IB Gateway unavailable")
+
+    t0 = time.perf_counter()
+    prepared = {}
+
+    # Chaque ticker est découpé en matrices horaires dès réception, puis son DataFrame est libéré
+    async with aclosing(stream_all_data(ib, tickers, screening_date)) as stream:
+
+        async for ticker, df in stream:
+
+            ready = prepare_ticker(df, screening_date, ticker)
+            del df
+
+            if ready is not None:
+                prepared[ticker] = ready
+
+    t1 = time.perf_counter()
+
+    kept = [t for t in dict.fromkeys(tickers) if t in prepared]
+    u = stack_universe(kept, [prepared[t][0] for t in kept], [prepared[t][1] for t in kept])
+    hits = screen_universe(u, selected_ids, inverse_ids, checked)
+
+    matches = [(t, float(o)) for t, o, m in zip(u.tickers, u.open16, hits) if m]
+
+    t2 = time.perf_counter()
+    _screens_served += 1
+
+    logger.info(f"[SERVER] screen {screening_date}: {len(matches)} matches / {len(tickers)} tickers")
+    # Métriques cumulées : textfile Prometheus seulement (pas un JSON par requête)
+    registry.export("server", formats=tuple(f for f in METRICS_FORMATS if f == "prometheus"))
+
+    return {"date": screening_date.isoformat(),
+            "conditions": sorted(selected_ids),
+            "inverse": sorted(inverse_ids),
+            "tickers": len(tickers),
+            "matches": [{"serial": i, "ticker": t, "open16h": o} for i, (t, o) in enumerate(matches, start=1)],
+            "timings_ms": {"fetch": round((t1 - t0) * 1000, 1), "evaluate": round((t2 - t1) * 1000, 1)}}
+
+def _health() -> dict:
+
+    pool = ib_connect._pool
+
+    return {"status": "ok",
+            "ib_connected": bool(pool is not None and pool.isConnected()),
+            "ib_lanes": f"{pool.connected_count()}/{len(pool)}" if pool is not None else "0/0",
+            "cached_contracts": len(_CONTRACT_CACHE),
+            "screens_served": _screens_served,
+            "uptime_s": round(time.monotonic() - _started_at, 1)}
+
+async def _write_json(writer: asyncio.StreamWriter, status: int, body: dict) -> None:
+    await _write_body(writer, status, json.dumps(body).encode("utf-8"), "application/json")
+
+async def _write_body(writer: asyncio.StreamWriter, status: int, data: bytes, content_type: str) -> None:
+
+    writer.write(f"HTTP/1.1 {status} {_STATUS_TEXT.get(status, '')}\r\n"
+                 f"Content-Type: {content_type}\r\n"
+                 f"Content-Length: {len(data)}\r\n"
+                 f"Connection: close\r\n\r\n".encode("ascii") + data)
+
+    await writer.drain()
+
+# endregion
+
+# region : Server Functions
+
+async def _handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+
+    """
+    Mini-serveur HTTP/1.1 (une requête par connexion) :
+      - GET  /health : état du process (connexion IB, caches)
+      - GET  /metrics : métriques cumulées depuis le démarrage (format Prometheus)
+      - POST /screen : screening JSON -> JSON
+    """
+
+    try:
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        method, path, *_ = request_line.split(" ") + ["", ""]
+
+        headers = {}
+
+        while (line := (await reader.readline()).decode("latin-1").strip()):
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", 0) or 0)
+
+        except ValueError:
+            raise RequestError(400, f"Invalid Content-Length: {headers['content-length']!r}")
+
+        if length < 0:
+            raise RequestError(400, f"Invalid Content-Length: {length}")
+
+        if length > MAX_BODY_BYTES:
+            raise RequestError(413, "Request body too large")
+
+        body = await reader.readexactly(length) if length else b""
+
+        if method == "GET" and path == "/health":
+            await _write_json(writer, 200, _health())
+
+        elif method == "GET" and path == "/metrics":
+            await _write_body(writer, 200, registry.to_prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+
+        elif method == "POST" and path == "/screen":
+
+            try:
+                payload = json.loads(body or b"{}")
+
+            except json.JSONDecodeError as e:
+                raise RequestError(400, f"Invalid JSON: {e}")
+
+            if not isinstance(payload, dict):
+                raise RequestError(400, "JSON body must be an object")
+
+            await _write_json(writer, 200, await _screen(payload))
+
+        else:
+            raise RequestError(404, f"No route for {method} {path}")
+
+    except RequestError as e:
+        await _write_json(writer, e.status, {"error": str(e)})
+
+    except Exception as e:
+        logger.error(f"[SERVER_ERROR] {e}")
+        await _write_json(writer, 500, {"error": str(e)})
+
+    finally:
+        writer.close()
+
+def serve(host: str = SERVER_HOST, port: int = SERVER_PORT) -> None:
+
+    """
+    Lance le screener en mode headless : un process long qui garde le pool de connexions IB,
+    le cache de contrats et le cache de barres chauds entre deux requêtes.
+    """
+
+    loop = util.getLoop()
+
+    if loop.run_until_complete(get_ib_pool_async()) is None:
+        logger.warning("[SERVER] Starting without IB connection, will retry on first request.")
+
+    server = loop.run_until_complete(asyncio.start_server(_handle_client, host, port))
+    logger.info(f"[SERVER] Listening on http://{host}:{port} (GET /health, GET /metrics, POST /screen)")
+
+    try:
+        loop.run_forever()
+
+    except KeyboardInterrupt:
+        logger.info("[SERVER] Shutting down.")
+
+    finally:
+        server.close()
+
+# endregion
+
+if __name__ == "__main__":
+    serve()
@@ -1,149 +1,85 @@
-import operator
-import pandas as pd
+import numpy as np
+import datetime as dt
 
-from typing import Optional
+from config import EASTERN_TZ
 
-# region : Evaluation Functions
+# region : Date Functions
 
-def safe_high_vs_open16(d, dy, open16, factor):
+def get_screening_date_now() -> dt.date:
 
-    highs = [get_bar_at_hour(dy, h)["High"] for h in range(16, 20) if (bar := get_bar_at_hour(dy, h)) is not None]
-    highs += [get_bar_at_hour(d, h)["High"] for h in range(4, 20) if (bar := get_bar_at_hour(d, h)) is not None]
+    """Date de screening par défaut : aujourd'hui (US/Eastern), ou le jour ouvré suivant après 20h."""
 
-    if highs:
-        m = max(highs)
-        return m > factor * open16, m <= factor * open16
-    
-    return False, False
-
-def safe_bool_evaluation(value) -> Optional[bool]:
-
-    """
-    Tente de convertir proprement une valeur vers un booléen.
-    Gère aussi les Series pandas d’un seul élément.
-    """
-
-    if value is None:
-        return None
-
-    try:
-        if hasattr(value, "size") and value.size == 1:
-            value = value.item()
-
-        return bool(value)
-    
-    except Exception:
-        return None
-
-def safe_range_high_vs_yclose(d, dy, y_hour, mult):
-
-    y = get_bar_at_hour(dy, y_hour)
-    m = get_range_stat(d, range(4, 20), "High", "max")
-
-    if y is not None and m is not None:
-        return m > mult * y["Close"], m <= mult * y["Close"]
-    
-    return False, False
-
-def safe_compare_bars(d, h1, h2, col, op, cid=None):
-
-    b1, b2 = get_bar_at_hour(d, h1), get_bar_at_hour(d, h2)
-
-    if b1 is not None and b2 is not None:
+    now = dt.datetime.now(EASTERN_TZ)
 
-        primary = op(b1[col], b2[col])
+    if now.time() <= dt.time(20, 0):
+        return now.date()
 
-        def inverse_condition_operator(op):
+    day = now.date() + dt.timedelta(days=1)
 
-            symmetrical = {operator.le: operator.ge, operator.ge: operator.le}
+    while day.weekday() >= 5:
+        day += dt.timedelta(days=1)
 
-            logical = {operator.le: operator.gt,
-                       operator.lt: operator.ge,
-                       operator.ge: operator.lt,
-                       operator.gt: operator.le,
-                       operator.eq: operator.ne,
-                       operator.ne: operator.eq}
+    return day
 
-            if cid in list(range(19, 35)) + list(range(51, 67)):
-                return symmetrical.get(op, op)
-            
-            return logical.get(op, lambda a, b: not op(a, b))
-
-        inverse = inverse_condition_operator(op)(b1[col], b2[col])
-        return primary, inverse
-
-    return False, False
-
-def safe_compare_to_range(d, h, col, hour_range, op, agg_func="max"):
+# endregion
 
-    b = get_bar_at_hour(d, h)
-    m = get_range_stat(d, hour_range, col, agg_func)
+# region : Hour Matrix Functions
 
-    if b is not None and m is not None:
-        return op(b[col], m), not op(b[col], m)
-    
-    return False, False
+HOUR_FIELDS = ("Open", "High", "Low", "Close", "Volume")
+OPEN, HIGH, LOW, CLOSE, VOLUME = range(len(HOUR_FIELDS))
 
-def safe_compare_day1_vs_today(d, dy, h_today, h_yesterday, col, op, cid=None):
+DAY, DAY_MINUS_1 = 0, 1
 
-    b1 = get_bar_at_hour(d, h_today)
-    b2 = get_bar_at_hour(dy, h_yesterday)
+def build_hour_matrix(df) -> np.ndarray:
 
-    if b1 is not None and b2 is not None:
+    """
+    Convertit une journée de barres en matrice (24, 5) indexée par heure US/Eastern.
+    - colonnes : Open, High, Low, Close, Volume
+    - heures absentes : NaN
+    - plusieurs barres dans la même heure : agrégées en OHLC 1h (Volume sommé)
+    - Volume NaN = colonne absente (volume inconnu)
+    """
 
-        primary = op(b1[col], b2[col])
+    m = np.full((24, len(HOUR_FIELDS)), np.nan)
 
-        def inverse_condition_operator(op):
+    if df is None or df.empty:
+        return m
 
-            symmetrical = {operator.le: operator.ge, operator.ge: operator.le}
+    cols = [c for c in HOUR_FIELDS if c in df]
+    pos = [HOUR_FIELDS.index(c) for c in cols]
 
-            logical = {operator.le: operator.gt,
-                       operator.lt: operator.ge,
-                       operator.ge: operator.lt,
-                       operator.gt: operator.le,
-                       operator.eq: operator.ne,
-                       operator.ne: operator.eq,}
+    day = df[cols] if df.index.is_monotonic_increasing else df[cols].sort_index()
+    idx = day.index.tz_convert(EASTERN_TZ) if day.index.tz is not None else day.index
+    hours = np.asarray(idx.hour)
 
-            if cid in [19, 51]:
-                return symmetrical.get(op, op)
-            
-            return logical.get(op, lambda a, b: not op(a, b))
+    if len(np.unique(hours)) == len(hours):
+        m[np.ix_(hours, pos)] = day.to_numpy(dtype=float)
 
-        inverse = inverse_condition_operator(op)(b1[col], b2[col])
-        return primary, inverse
-    return False, False
+    else:
+        agg = {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"}
+        grouped = day.groupby(hours).agg({c: agg[c] for c in cols})
+        m[np.ix_(grouped.index.to_numpy(), pos)] = grouped.to_numpy(dtype=float)
 
-# endregion
+    if "Volume" in df:
+        m[:, VOLUME] = np.where(np.isnan(m[:, VOLUME]) & ~np.isnan(m[:, CLOSE]), 0.0, m[:, VOLUME])
 
-# region : Extraction Functions
+    return m
 
-def extract_comparator(condition_text: str) -> str:
+def to_hour_matrix(data) -> np.ndarray:
 
     """
-    Extrait un opérateur de comparaison d'une chaîne.
+    Renvoie la matrice horaire d'une journée (la construit si on reçoit un DataFrame).
     """
 
-    for symbol in ["≥", "≤", "≠", "=", ">", "<"]:
-
-        if symbol in condition_text:
-            return symbol
-        
-    return "?"
+    return data if isinstance(data, np.ndarray) else build_hour_matrix(data)
 
-def inverse_comparator(symbol: str) -> str:
+def is_valid_bar(row) -> bool:
 
     """
-    Retourne l'opposé logique d'un comparateur.
+    Barre exploitable : OHLC renseignés et volume > 0 (ou volume inconnu).
     """
 
-    inversions = {"≥": "<",
-                  "≤": ">",
-                  "=": "≠",
-                  "≠": "=",
-                  ">": "≤",
-                  "<": "≥"}
-    
-    return symbol.translate(str.maketrans(inversions)) if any(k in symbol for k in inversions) else f"Inverse({symbol})"
+    return not np.isnan(row[:VOLUME]).any() and not row[VOLUME] <= 0
 
 # endregion
 
@@ -153,49 +89,50 @@ def get_range_stat(df, hour_range: range, col: str, mode: str = "max"):
 
     """
     Renvoie max ou min d'une colonne (Open, High, Low, Close) sur une plage horaire donnée.
-    - df : DataFrame avec index horaire
+    - df : matrice horaire (ou DataFrame avec index horaire)
     - hour_range : range(4, 16), etc.
     - col : "High", "Low", ...
     - mode : "max" ou "min"
     """
 
-    values = []
-
-    for h in hour_range:
-
-        bar = get_bar_at_hour(df, h)
+    m = to_hour_matrix(df)
+    values = m[hour_range.start:hour_range.stop, HOUR_FIELDS.index(col)]
+    values = values[~np.isnan(values)]
 
-        if bar is not None and col in bar:
-            values.append(bar[col])
-
-    if not values:
+    if not values.size:
         return None
     
-    return max(values) if mode == "max" else min(values)
+    return float(values.max()) if mode == "max" else float(values.min())
 
 def get_bar_at_hour(df, hour: int):
 
     """
-    Returns the last hourly bar (as a Series) for a given hour.
+    Returns the hourly bar (as a dict) for a given hour, or None if the hour is missing.
     """
 
-    try:
-        bars = df.between_time(f"{hour:02d}:00", f"{hour:02d}:59")
+    row = to_hour_matrix(df)[hour]
 
-        if not bars.empty:
-            return bars.iloc[-1]  
+    if np.isnan(row[:VOLUME]).all():
+        return None
 
-    except Exception as e:
-        print(f"[DEBUG] Error in get_bar_at_hour({hour}): {e}")
+    return dict(zip(HOUR_FIELDS, row.tolist()))
+
+def get_first_n_bars(df, n: int) -> np.ndarray:
+
+    """
+    Retourne les n premières barres présentes de la journée (lignes de la matrice horaire).
+    """
 
-    return None
+    m = to_hour_matrix(df)
+    return m[get_first_n_hours(m, n)]
 
-def get_first_n_bars(df, n: int):
+def get_first_n_hours(df, n: int) -> np.ndarray:
 
     """
-    Retourne les n premières lignes d’un DataFrame trié par date.
+    Retourne les heures des n premières barres présentes de la journée.
     """
 
-    return df.sort_index().head(n)
+    m = to_hour_matrix(df)
+    return np.flatnonzero(~np.isnan(m[:, :VOLUME]).all(axis=1))[:n]
 
 # endregion
@@ -0,0 +1,324 @@
+import numpy as np
+import tkinter as tk
+import tkinter.font as tkfont
+
+from tkinter import ttk
+from typing import List, Optional, Sequence, Tuple
+from config import RESULTS_FLUSH_MS
+
+# region : Variables
+
+# (titre, largeur, format) de chaque colonne du tableau de résultats
+SCREENER_COLUMNS = (("#", 50, "{}"), ("Ticker No", 80, "{}"), ("Ticker", 90, "{}"), ("Open 16h DAY-1", 110, "{:.2f}"))
+BACKTEST_COLUMNS = (("Date", 100, "{}"), ("Matches", 70, "{}"), ("Tickers", 600, "{}"))
+
+TICKER_FILTERS = ("All", "Selected", "Unselected")
+
+CHECK_FILL = "#3b78d8"
+
+# endregion
+
+# region : Ticker Selector
+
+class TickerSelector(ttk.Frame):
+
+    """
+    Liste de tickers virtualisée : seules les lignes visibles sont dessinées sur le canvas,
+    la sélection est un tableau de booléens (un par ticker) plutôt qu'un BooleanVar + Checkbutton par ligne.
+    Recherche (sous-chaîne, sans casse) et filtre Tous / Cochés / Décochés ; un clic coche ou décoche la ligne.
+    """
+
+    def __init__(self, parent, **kwargs):
+
+        super().__init__(parent, **kwargs)
+
+        self.tickers: List[str] = []
+        self.selected = np.zeros(0, dtype=bool)
+        self.visible = np.zeros(0, dtype=np.int64)
+        self.top = 0
+
+        self._upper: List[str] = []
+
+        self.font = tkfont.nametofont("TkDefaultFont")
+        self.row_height = self.font.metrics("linespace") + 6
+
+        self.rowconfigure(1, weight=1)
+        self.columnconfigure(0, weight=1)
+
+        search_frame = ttk.Frame(self)
+        search_frame.grid(row=0, column=0, columnspan=2, sticky=tk.EW, pady=(0, 5))
+        search_frame.columnconfigure(0, weight=1)
+
+        self.search = tk.StringVar()
+        self.search.trace_add("write", lambda *args: self.refilter())
+        ttk.Entry(search_frame, textvariable=self.search).grid(row=0, column=0, sticky=tk.EW)
+
+        self.filter = tk.StringVar(value=TICKER_FILTERS[0])
+        self.filter.trace_add("write", lambda *args: self.refilter())
+        ttk.Combobox(search_frame, textvariable=self.filter, values=TICKER_FILTERS, state="readonly", width=10).grid(row=0, column=1, padx=(5, 0))
+
+        self.canvas = tk.Canvas(self, highlightthickness=0)
+        self.canvas.grid(row=1, column=0, sticky=tk.NSEW)
+
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.yview)
+        self.scrollbar.grid(row=1, column=1, sticky=tk.NS)
+
+        self.count_label = ttk.Label(self)
+        self.count_label.grid(row=2, column=0, columnspan=2, sticky=tk.W, pady=(5, 0))
+
+        self.canvas.bind("<Configure>", lambda e: self.render())
+        self.canvas.bind("<Button-1>", self._on_click)
+        self.canvas.bind("<MouseWheel>", lambda e: self.scroll(-3 * int(e.delta / 120)))
+        self.canvas.bind("<Button-4>", lambda e: self.scroll(-3))
+        self.canvas.bind("<Button-5>", lambda e: self.scroll(3))
+
+        self.render()
+
+    # region : State
+
+    def set_tickers(self, tickers: Sequence[str], selected: bool = True) -> None:
+
+        self.tickers = list(tickers)
+        self.selected = np.full(len(self.tickers), selected, dtype=bool)
+        self.top = 0
+
+        self._upper = [t.upper() for t in self.tickers]
+
+        self.refilter()
+
+    def selected_tickers(self) -> List[str]:
+
+        """Tickers cochés, dans l'ordre de la liste (filtre et recherche ignorés)."""
+
+        return [self.tickers[i] for i in np.flatnonzero(self.selected)]
+
+    def select_all(self, value: bool = True) -> None:
+
+        """Coche (ou décoche) les tickers affichés par la recherche / le filtre courants."""
+
+        self.selected[self.visible] = value
+        self.render()
+
+    def refilter(self) -> None:
+
+        text = self.search.get().strip().upper()
+        mask = np.ones(len(self.tickers), dtype=bool)
+
+        if text:
+            mask = np.fromiter((text in t for t in self._upper), dtype=bool, count=len(self._upper))
+
+        mode = self.filter.get()
+
+        if mode == "Selected":
+            mask &= self.selected
+
+        elif mode == "Unselected":
+            mask &= ~self.selected
+
+        self.visible = np.flatnonzero(mask)
+        self.top = 0
+
+        self.render()
+
+    # endregion
+
+    # region : Drawing
+
+    def _page(self) -> int:
+        return max(1, self.canvas.winfo_height() // self.row_height)
+
+    def render(self) -> None:
+
+        """Redessine les seules lignes visibles (quelques dizaines d'items canvas quelle que soit la taille de la liste)."""
+
+        self.canvas.delete("row")
+
+        n, page = len(self.visible), self._page()
+        self.top = max(0, min(self.top, n - page))
+
+        rh, box = self.row_height, self.row_height - 10
+
+        for r, pos in enumerate(range(self.top, min(n, self.top + page + 1))):
+
+            i = self.visible[pos]
+            y = r * rh
+
+            self.canvas.create_rectangle(4, y + 5, 4 + box, y + 5 + box, outline="gray40", fill=CHECK_FILL if self.selected[i] else "", tags="row")
+            self.canvas.create_text(box + 12, y + rh / 2, text=f"{i + 1}. {self.tickers[i]}", anchor="w", font=self.font, tags="row")
+
+        if n:
+            self.scrollbar.set(self.top / n, min(1.0, (self.top + page) / n))
+
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+        self.count_label.configure(text=f"{int(self.selected.sum())} / {len(self.tickers)} selected ({n} shown)")
+
+    def scroll(self, rows: int) -> None:
+
+        self.top += rows
+        self.render()
+
+    def yview(self, action: str, value: str, unit: Optional[str] = None) -> None:
+
+        """Commande de la scrollbar : "moveto" (fraction) ou "scroll" (lignes / pages)."""
+
+        if action == "moveto":
+            self.top = int(float(value) * len(self.visible))
+
+        elif action == "scroll":
+            self.top += int(value) * (self._page() if unit == "pages" else 1)
+
+        self.render()
+
+    def _on_click(self, event) -> None:
+
+        pos = self.top + event.y // self.row_height
+
+        if pos < len(self.visible):
+            i = self.visible[pos]
+            self.selected[i] = not self.selected[i]
+            self.render()
+
+    # endregion
+
+# endregion
+
+# region : Results View
+
+class ResultsView(ttk.Frame):
+
+    """
+    Tableau de résultats : les lignes ajoutées pendant un run sont insérées par lots (toutes les RESULTS_FLUSH_MS),
+    un clic sur un en-tête trie le tableau sur cette colonne (second clic : ordre inverse).
+    Les valeurs brutes sont gardées pour le tri, le format de la colonne ne sert qu'à l'affichage.
+    """
+
+    def __init__(self, parent, columns: Sequence[Tuple[str, int, str]] = SCREENER_COLUMNS, flush_ms: int = RESULTS_FLUSH_MS, **kwargs):
+
+        super().__init__(parent, **kwargs)
+
+        self.flush_ms = flush_ms
+        self.columns: Sequence[Tuple[str, int, str]] = ()
+
+        self.rows: List[tuple] = []
+        self._pending: List[tuple] = []
+        self._flush_id = None
+        self._sort: Optional[Tuple[int, bool]] = None
+
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+
+        self.tree = ttk.Treeview(self, show="headings")
+        self.tree.grid(row=0, column=0, sticky=tk.NSEW)
+
+        scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.tree.yview)
+        scrollbar.grid(row=0, column=1, sticky=tk.NS)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+
+        self.set_columns(columns)
+
+    def set_columns(self, columns: Sequence[Tuple[str, int, str]]) -> None:
+
+        """Change les colonnes (screening / backtest) et vide le tableau."""
+
+        self.clear()
+        self.columns = columns
+
+        keys = [f"c{i}" for i in range(len(columns))]
+        self.tree.configure(columns=keys)
+
+        for i, (key, (title, width, _)) in enumerate(zip(keys, columns)):
+            self.tree.heading(key, text=title, command=lambda c=i: self.sort_by(c))
+            self.tree.column(key, width=width, stretch=i == len(columns) - 1)
+
+    def clear(self) -> None:
+
+        if self._flush_id is not None:
+            self.after_cancel(self._flush_id)
+            self._flush_id = None
+
+        self.rows = []
+        self._pending = []
+        self._sort = None
+
+        self.tree.delete(*self.tree.get_children())
+        self._update_headings()
+
+    def add(self, row: tuple) -> None:
+
+        """Ajoute une ligne ; l'insertion dans le Treeview est regroupée avec les suivantes."""
+
+        self._pending.append(row)
+
+        if self._flush_id is None:
+            self._flush_id = self.after(self.flush_ms, self.flush)
+
+    def extend(self, rows: Sequence[tuple]) -> None:
+
+        self._pending.extend(rows)
+        self.flush()
+
+    def flush(self) -> None:
+
+        """Insère les lignes en attente (à appeler en fin de run pour ne pas attendre le prochain lot)."""
+
+        if self._flush_id is not None:
+            self.after_cancel(self._flush_id)
+            self._flush_id = None
+
+        if not self._pending:
+            return
+
+        rows, self._pending = self._pending, []
+        self.rows.extend(rows)
+
+        # Tableau trié : les nouvelles lignes reprennent leur place dans l'ordre courant
+        if self._sort is not None:
+            self._refresh()
+
+        else:
+            self._insert(rows)
+
+    def sort_by(self, column: int) -> None:
+
+        self.flush()
+
+        descending = self._sort == (column, False)
+        self._sort = (column, descending)
+
+        self._refresh()
+        self._update_headings()
+
+    # region : Helper Functions
+
+    def _format(self, row: tuple) -> tuple:
+        return tuple(fmt.format(value) for value, (_, _, fmt) in zip(row, self.columns))
+
+    def _insert(self, rows: Sequence[tuple]) -> None:
+
+        for row in rows:
+            self.tree.insert("", "end", values=self._format(row))
+
+    def _refresh(self) -> None:
+
+        column, descending = self._sort
+        self.rows.sort(key=lambda row: row[column], reverse=descending)
+
+        self.tree.delete(*self.tree.get_children())
+        self._insert(self.rows)
+
+    def _update_headings(self) -> None:
+
+        for i, (title, _, _) in enumerate(self.columns):
+
+            arrow = ""
+
+            if self._sort is not None and self._sort[0] == i:
+                arrow = " ▼" if self._sort[1] else " ▲"
+
+            self.tree.heading(f"c{i}", text=title + arrow)
+
+    # endregion
+
+# endregion